@@ -1,3 +1,6 @@
+import os
+import json
+
 #Input directory where the files produced at the stage1 level are
 inputDir = "/ceph/salshamaily/topEWK_FCCee/analysis/stage2_output" #your stage2 directory
 
@@ -79,6 +82,34 @@ procDictAdd = {
 
 }
 
+#Normalization generated from the stage outputs by python/metadata_scan.py --write, replaces the values above when present
+procDictFile = os.path.join(inputDir, "procDictAdd.json")
+if os.path.isfile(procDictFile):
+    with open(procDictFile) as f:
+        procDictAdd = json.load(f)
+
+#Optional: coupling variations filled from the SM samples by python/weighted_final.py, in one event loop per
+#sample, with the per-event weight vector kept by stage2 (keepEFTWeights). One variation per entry of the
+#vector from eftWeightOffset on, in the order of the generator reweighting setup, divided by the nominal
+#entry eftWeightNominal; the BSM samples can then be left out of processList
+eftWeightColumn     = "eft_weights"
+eftWeightVariations = ["ta_ttAup", "ta_ttAdown", "tv_ttAup", "tv_ttAdown", "vr_ttZup", "vr_ttZdown"]
+eftWeightNominal    = 0
+eftWeightOffset     = 1
+
+#Normalization of the coupling variations written by python/weighted_final.py (mean weight ratio per sample),
+#added to procDictAdd when present so that they are not rescaled by the hardcoded cross section variations
+weightedProcDictFile = os.path.join(outputDir, "procDictAdd_weighted.json")
+if os.path.isfile(weightedProcDictFile):
+    with open(weightedProcDictFile) as f:
+        procDictAdd.update(json.load(f))
+
+#Optional: beam polarization scenarios (P_e-, P_e+) filled as an extra histogram axis by python/polarization_final.py,
+#in one event loop per sample, from the beam helicities kept by stage2 (keepBeamHelicities), and the
+#polarization the samples were generated with
+polarizations         = [(0.0, 0.0), (-0.8, 0.3), (0.8, -0.3), (-0.8, 0.0), (0.8, 0.0)]
+generatedPolarization = (0.0, 0.0)
+
 ###Dictionnay of the list of cuts. The key is the name of the selection that will be added to the output file
 cutList = {
     ### no selection, just builds the histograms, it will not be shown in the latex table
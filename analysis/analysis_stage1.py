@@ -1,3 +1,10 @@
+import os, sys
+
+# importing the output dtype/compression profiles
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../python'))
+from output_profiles import apply_dtype_policy
+from rdf_profiler import instrument, unwrap
+
 #Mandatory: List of processes
 processList = {
             'wzp6_ee_tt_pol_ecm365':{'chunks':50},
@@ -26,7 +33,34 @@ outputDir   = "outputs/FCCee/top/hadronic/analysis_stage1/"
 outputDirEos = "/eos/experiment/fcc/ee/analyses/case-studies/top/topEWK/flatNtuples/winter2023"
 
 #Additional/custom C++ functions
-includePaths = ["functions.h"]
+includePaths = ["functions.h", "output_types.h", "polarization.h"]
+
+#Optional: write the output columns with the storage types of output_profiles.dtype_policy,
+#to be switched on once the policy has been checked against the branch list of the stage
+narrowTypes = False
+
+#Optional: compression profile of the output (see output_profiles.compression_profiles),
+#applied with python/output_profiles.py after the stage has run
+outputProfile = "default"
+
+#Optional: per-Define/Filter timing report written at the end of the run (see python/rdf_profiler.py), every
+#job writes its own part next to it, merged by python/rdf_profiler.py <report>. None switches the instrumentation off
+profileReport = None
+
+#Optional: split the output into reco-level and gen-level files (outputDir/reco, outputDir/gen)
+#with python/friend_trees.py, the combined output is removed only once the split has been validated.
+#Attaching the gen files is manual: fccanalysis runs of later stages only read the reco files, scripts
+#building their own dataframe attach the gen friend with friend_trees.open_stage_input
+splitGenReco = False
+
+#Optional: generator weight vector with one weight per coupling point (e.g. "_EventHeader_weights"),
+#written out as eft_weights so that python/weighted_final.py can fill the coupling variations from
+#the SM samples; None if the samples carry no reweighting information
+eftWeightColumn = None
+
+#Optional: write the helicities of the incoming e- and e+ (beam_helicity_em, beam_helicity_ep) of the
+#keepPolInfo samples, used by python/polarization_final.py to reweight to other beam polarizations
+beamHelicities = False
 
 
 #Optional
@@ -41,7 +75,7 @@ class RDFanalysis():
     #__________________________________________________________
     #Mandatory: analysers funtion to define the analysers to process, please make sure you return the last dataframe, in this example it is df2
     def analysers(df):
-        df2 = (df
+        df2 = (instrument(df, profileReport)
                .Alias("Particle0", "Particle#0.index")
                .Alias("Particle1", "Particle#1.index")
 
@@ -134,7 +168,19 @@ class RDFanalysis():
                .Define("jet_btag", "ReconstructedParticle::getJet_btag(Jet3, ParticleIDs, ParticleIDs_0)")
  
         )
-        return df2
+
+        if eftWeightColumn:
+            df2 = df2.Define("eft_weights", eftWeightColumn)
+
+        if beamHelicities:
+            df2 = (df2
+                   .Define("beam_helicity_em", "topEWK::beam_helicity(Particle.PDG, Particle.generatorStatus, Particle.helicity, 11)")
+                   .Define("beam_helicity_ep", "topEWK::beam_helicity(Particle.PDG, Particle.generatorStatus, Particle.helicity, -11)"))
+
+        if narrowTypes:
+            df2 = apply_dtype_policy(df2, RDFanalysis.output())
+
+        return unwrap(df2)
 
 
 
@@ -156,4 +202,11 @@ class RDFanalysis():
                  "jet_charge", "jet_btag", "Emiss_energy", "Emiss_p", "Emiss_px", "Emiss_py", "Emiss_pz",
                  "Emiss_phi", "Emiss_eta"
                 ]
+
+        if eftWeightColumn:
+            branchList.append("eft_weights")
+
+        if beamHelicities:
+            branchList += ["beam_helicity_em", "beam_helicity_ep"]
+
         return branchList
\ No newline at end of file
@@ -1,4 +1,11 @@
-import os, copy # tagging
+import os, sys, copy # tagging
+
+# importing the output dtype/compression profiles
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../python'))
+from output_profiles import apply_dtype_policy
+from rdf_profiler import instrument, unwrap
+from lepton_selection import lepton_defines
+from stage_engine import build_stage
 
 #Mandatory: List of processes
 processList = {
@@ -37,6 +44,8 @@ processList = {
             }
 
 #Optional: output directory, default is local running directory
+#(point inputDir to the reco/ sub-directory if stage1 was run with splitGenReco, the gen columns are
+#then not available to this stage, see python/friend_trees.py)
 inputDir = "/ceph/xzuo/FCC_ntuples/topEWK/ntuples_20240205"
 outputDir   = "/ceph/salshamaily/topEWK_FCCee/analysis/stage2_output"
 
@@ -50,7 +59,47 @@ batchQueue  = "nextweek"
 compGroup   = "group_u_FCC.local_gen"
 
 # Additional/custom C++ functions, defined in header files
-#includePaths = ["functions.h"]
+includePaths = ["output_types.h", "lepton_selection.h"]
+
+#Lepton selection, see python/lepton_selection.py for the available cuts
+muonCuts     = {"min_energy": 13}
+electronCuts = {"min_energy": 13}
+
+#Event selection on the missing energy [GeV]
+emissCut = 23
+
+#Event selection, applied in the order chosen by stage_engine.order_filters
+stage2Filters = [
+    ("one_lepton", "n_muons_pass==1 or n_electrons_pass==1"), # only takes boolean value
+    ("emiss",      f"Emiss_energy.at(0) > {emissCut}"),
+]
+
+#Optional: per-filter selectivity measured on earlier runs, used to order the filters of the next one,
+#e.g. os.path.join(outputDir, "filter_report.json"); every job writes its own report next to it, all of
+#them are read on the next run and merged into one file by python/stage_engine.py <report>. None switches it off
+filterReport = None
+
+#Optional: write the output columns with the storage types of output_profiles.dtype_policy,
+#to be switched on once the policy has been checked against the branch list of the stage
+narrowTypes = False
+
+#Optional: compression profile of the output (see output_profiles.compression_profiles),
+#applied with python/output_profiles.py after the stage has run
+outputProfile = "default"
+
+#Optional: per-Define/Filter timing report written at the end of the run (see python/rdf_profiler.py), every
+#job writes its own part next to it, merged by python/rdf_profiler.py <report>. None switches the instrumentation off
+profileReport = None
+
+#Optional: new columns added to the existing outputs by python/stage2_append.py, written as
+#sidecar friend files instead of re-running the stage, e.g. {"muon_pass_p": "sqrt(muon_pass_pt*muon_pass_pt + muon_pass_pz*muon_pass_pz)"}
+appendDefines = {}
+
+#Optional: keep the per-event coupling weights written by stage1 (eftWeightColumn) for python/weighted_final.py
+keepEFTWeights = False
+
+#Optional: keep the beam helicities written by stage1 (beamHelicities) for python/polarization_final.py
+keepBeamHelicities = False
 
 #Mandatory: RDFanalysis class where the use defines the operations on the TTree
 class RDFanalysis():
@@ -58,40 +107,19 @@ class RDFanalysis():
     #__________________________________________________________
     #Mandatory: analysers funtion to define the analysers to process, please make sure you return the last dataframe, in this example it is df2
     def analysers(df):
-        df2 = (df
-
-               .Define("muon_pass",         "(muon_energy > 13) * 1.0")
-               .Define("muon_pass_px",      "muon_px[muon_pass==1]")
-               .Define("muon_pass_py",      "muon_py[muon_pass==1]")
-               .Define("muon_pass_pz",      "muon_pz[muon_pass==1]")
-               .Define("muon_pass_pt",      "sqrt(muon_pass_px*muon_pass_px + muon_pass_py*muon_pass_py)")
-               .Define("muon_pass_phi",     "muon_phi[muon_pass==1]")
-               .Define("muon_pass_eta",     "muon_eta[muon_pass==1]")
-               .Define("muon_pass_energy",  "muon_energy[muon_pass==1]")
-               .Define("muon_pass_mass",    "muon_mass[muon_pass==1]")
-               .Define("muon_pass_charge",  "muon_charge[muon_pass==1]")
-               .Define("muon_pass_d0",      "muon_d0[muon_pass==1]")
-               .Define("muon_pass_z0",      "muon_z0[muon_pass==1]")
-               .Define("n_muons_pass",      "return int(muon_pass_energy.size())")
-               
-               .Define("electron_pass",         "(electron_energy > 13) * 1.0")
-               .Define("electron_pass_px",      "electron_px[electron_pass==1]")
-               .Define("electron_pass_py",      "electron_py[electron_pass==1]")
-               .Define("electron_pass_pz",      "electron_pz[electron_pass==1]")
-               .Define("electron_pass_pt",      "sqrt(electron_pass_px*electron_pass_px + electron_pass_py*electron_pass_py)")
-               .Define("electron_pass_phi",     "electron_phi[electron_pass==1]")
-               .Define("electron_pass_eta",     "electron_eta[electron_pass==1]")
-               .Define("electron_pass_energy",  "electron_energy[electron_pass==1]")
-               .Define("electron_pass_mass",    "electron_mass[electron_pass==1]")
-               .Define("electron_pass_charge",  "electron_charge[electron_pass==1]")
-               .Define("electron_pass_d0",      "electron_d0[electron_pass==1]")
-               .Define("electron_pass_z0",      "electron_z0[electron_pass==1]")
-               .Define("n_electrons_pass",      "return int(electron_pass_energy.size())")
-               
-               .Filter("n_muons_pass==1 or n_electrons_pass==1") # only takes boolean value
-               .Filter("Emiss_energy.at(0) > 23")
-        )
-        return df2
+        defines = []
+
+        # one compiled selection pass per lepton collection (lepton_selection.h)
+        for collection, counter, cuts in (("muon", "n_muons_pass", muonCuts), ("electron", "n_electrons_pass", electronCuts)):
+            defines += lepton_defines(collection, counter, cuts)
+
+        # filters are reordered by cost and measured selectivity, see python/stage_engine.py
+        df2 = build_stage(instrument(df, profileReport), defines, stage2Filters, filterReport)
+
+        if narrowTypes:
+            df2 = apply_dtype_policy(df2, RDFanalysis.output())
+
+        return unwrap(df2)
 
     #__________________________________________________________
     #Mandatory: output function, please make sure you return the branchlist as a python list
@@ -115,4 +143,10 @@ class RDFanalysis():
 #                 "recoEmiss_px", "recoEmiss_py", "recoEmiss_pz", "recoEmiss_e"
                  ]
 
+        if keepEFTWeights:
+            branchList.append("eft_weights")
+
+        if keepBeamHelicities:
+            branchList += ["beam_helicity_em", "beam_helicity_ep"]
+
         return branchList
\ No newline at end of file
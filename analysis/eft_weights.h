@@ -0,0 +1,25 @@
+#ifndef TOPEWK_EFT_WEIGHTS_H
+#define TOPEWK_EFT_WEIGHTS_H
+
+#include <cstddef>
+#include <stdexcept>
+#include <string>
+
+#include "ROOT/RVec.hxx"
+
+namespace topEWK {
+
+  // weight of a coupling point relative to the nominal generator weight, checking that the weight
+  // vector has the entries the configuration expects (RVec::operator[] does not)
+  template <typename T>
+  double weight_ratio(const ROOT::VecOps::RVec<T> &weights, std::size_t index, std::size_t nominal, std::size_t expected) {
+    if (weights.size() < expected) {
+      throw std::runtime_error("eft weight vector has " + std::to_string(weights.size()) + " entries, " +
+                               std::to_string(expected) + " expected from eftWeightVariations");
+    }
+    return weights[nominal] != 0 ? static_cast<double>(weights[index]) / weights[nominal] : 0.;
+  }
+
+}
+
+#endif
@@ -0,0 +1,127 @@
+#ifndef TOPEWK_LEPTON_SELECTION_H
+#define TOPEWK_LEPTON_SELECTION_H
+
+#include <algorithm>
+#include <cmath>
+#include <limits>
+
+#include "ROOT/RVec.hxx"
+
+namespace topEWK {
+
+  // cuts applied to a lepton collection, all of them in one traversal
+  struct LeptonCuts {
+    float min_energy;
+    float min_pt;
+    float max_abs_eta;
+    float max_abs_d0;
+    float max_abs_z0;
+  };
+
+  inline LeptonCuts lepton_cuts(float min_energy  = 0.f,
+                                float min_pt      = 0.f,
+                                float max_abs_eta = std::numeric_limits<float>::infinity(),
+                                float max_abs_d0  = std::numeric_limits<float>::infinity(),
+                                float max_abs_z0  = std::numeric_limits<float>::infinity()) {
+    return LeptonCuts{min_energy, min_pt, max_abs_eta, max_abs_d0, max_abs_z0};
+  }
+
+  // |value| below a cut, an infinite cut (the default) keeps every value including nan and inf
+  template <typename T>
+  bool within_cut(T value, float max_abs) {
+    return std::isinf(max_abs) || std::abs(value) < max_abs;
+  }
+
+  // value above a lower cut, a cut at or below zero (the default) keeps every value including nan
+  template <typename T>
+  bool above_cut(T value, float min) {
+    return min <= 0.f || value > min;
+  }
+
+  // kinematic fields of the selected leptons, stored block after block in one buffer
+  enum class LeptonField { px, py, pz, pt, phi, eta, energy, mass, d0, z0, count };
+
+  template <typename T, typename C>
+  struct SelectedLeptons {
+    ROOT::VecOps::RVec<bool> pass;   // selection mask over all input leptons
+    ROOT::VecOps::RVec<T> buffer;    // n selected values per LeptonField
+    ROOT::VecOps::RVec<C> charge;
+    int n = 0;
+  };
+
+  // selecting leptons and gathering every selected column in a single pass
+  template <typename T, typename C>
+  SelectedLeptons<T, C> select_leptons(const LeptonCuts &cuts,
+                                       const ROOT::VecOps::RVec<T> &px,
+                                       const ROOT::VecOps::RVec<T> &py,
+                                       const ROOT::VecOps::RVec<T> &pz,
+                                       const ROOT::VecOps::RVec<T> &phi,
+                                       const ROOT::VecOps::RVec<T> &eta,
+                                       const ROOT::VecOps::RVec<T> &energy,
+                                       const ROOT::VecOps::RVec<T> &mass,
+                                       const ROOT::VecOps::RVec<C> &charge,
+                                       const ROOT::VecOps::RVec<T> &d0,
+                                       const ROOT::VecOps::RVec<T> &z0) {
+    SelectedLeptons<T, C> out;
+    const std::size_t size  = energy.size();
+    const std::size_t count = static_cast<std::size_t>(LeptonField::count);
+    out.pass.resize(size);
+    out.charge.resize(size);
+
+    // blocks laid out for all leptons first, so pt is computed once and written straight into its block
+    out.buffer.resize(size * count);
+    T *buffer = out.buffer.data();
+    auto block = [&](LeptonField f) { return buffer + static_cast<std::size_t>(f) * size; };
+
+    std::size_t j = 0;
+    for (std::size_t i = 0; i < size; ++i) {
+      const T pt = std::sqrt(px[i] * px[i] + py[i] * py[i]);
+      out.pass[i] = energy[i] > cuts.min_energy && above_cut(pt, cuts.min_pt) && within_cut(eta[i], cuts.max_abs_eta) &&
+                    within_cut(d0[i], cuts.max_abs_d0) && within_cut(z0[i], cuts.max_abs_z0);
+      if (!out.pass[i])
+        continue;
+      block(LeptonField::px)[j]     = px[i];
+      block(LeptonField::py)[j]     = py[i];
+      block(LeptonField::pz)[j]     = pz[i];
+      block(LeptonField::pt)[j]     = pt;
+      block(LeptonField::phi)[j]    = phi[i];
+      block(LeptonField::eta)[j]    = eta[i];
+      block(LeptonField::energy)[j] = energy[i];
+      block(LeptonField::mass)[j]   = mass[i];
+      block(LeptonField::d0)[j]     = d0[i];
+      block(LeptonField::z0)[j]     = z0[i];
+      out.charge[j] = charge[i];
+      ++j;
+    }
+
+    // closing the gaps: block f moves from f * size to f * n, always towards the front
+    out.n = j;
+    for (std::size_t f = 1; f < count && j < size; ++f)
+      std::copy(buffer + f * size, buffer + f * size + j, buffer + f * j);
+    out.buffer.resize(j * count);
+    out.charge.resize(j);
+
+    return out;
+  }
+
+  // views into the selection result, no copy is made
+  // (the result column owns the memory for the whole event)
+  template <typename T, typename C>
+  ROOT::VecOps::RVec<T> field(const SelectedLeptons<T, C> &selected, LeptonField f) {
+    T *data = const_cast<T *>(selected.buffer.data()) + static_cast<std::size_t>(f) * selected.n;
+    return ROOT::VecOps::RVec<T>(data, selected.n);
+  }
+
+  template <typename T, typename C>
+  ROOT::VecOps::RVec<C> charges(const SelectedLeptons<T, C> &selected) {
+    return ROOT::VecOps::RVec<C>(const_cast<C *>(selected.charge.data()), selected.charge.size());
+  }
+
+  template <typename T, typename C>
+  ROOT::VecOps::RVec<bool> mask(const SelectedLeptons<T, C> &selected) {
+    return ROOT::VecOps::RVec<bool>(const_cast<bool *>(selected.pass.data()), selected.pass.size());
+  }
+
+}
+
+#endif
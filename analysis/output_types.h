@@ -0,0 +1,30 @@
+#ifndef TOPEWK_OUTPUT_TYPES_H
+#define TOPEWK_OUTPUT_TYPES_H
+
+#include <cstdint>
+#include <type_traits>
+
+#include "ROOT/RVec.hxx"
+
+namespace topEWK {
+
+  // converting a collection column to the type it is stored with in the output
+  template <typename T, typename U>
+  ROOT::VecOps::RVec<T> narrow(const ROOT::VecOps::RVec<U> &values) {
+    if constexpr (std::is_same_v<T, U>) {
+      // already the right type: an owning copy, a view would dangle once the input is gone
+      return values;
+    } else {
+      return ROOT::VecOps::RVec<T>(values.begin(), values.end());
+    }
+  }
+
+  // converting a scalar column to the type it is stored with in the output
+  template <typename T, typename U>
+  T narrow(const U &value) {
+    return static_cast<T>(value);
+  }
+
+}
+
+#endif
@@ -0,0 +1,86 @@
+#ifndef TOPEWK_POLARIZATION_H
+#define TOPEWK_POLARIZATION_H
+
+#include <cstddef>
+
+#include "ROOT/RVec.hxx"
+
+namespace topEWK {
+
+  // helicity (-1, +1) of the incoming beam particle with a given PDG ID (generator status 4), 0 if not stored
+  template <typename P, typename S, typename H>
+  int beam_helicity(const ROOT::VecOps::RVec<P> &pdg, const ROOT::VecOps::RVec<S> &status,
+                    const ROOT::VecOps::RVec<H> &helicity, int beam_pdg) {
+    for (std::size_t i = 0; i < pdg.size(); ++i) {
+      if (pdg[i] == beam_pdg && status[i] == 4) {
+        return helicity[i] > 0 ? 1 : (helicity[i] < 0 ? -1 : 0);
+      }
+    }
+    return 0;
+  }
+
+  // weights of an event for every (P_e-, P_e+) configuration, relative to the polarization it was generated with:
+  // (1 + P- h-)(1 + P+ h+) / ((1 + P0- h-)(1 + P0+ h+)), 1 for events without helicities
+  inline ROOT::VecOps::RVec<double> polarization_weights(int h_em, int h_ep,
+                                                         const ROOT::VecOps::RVec<double> &p_em,
+                                                         const ROOT::VecOps::RVec<double> &p_ep,
+                                                         double p0_em, double p0_ep) {
+    ROOT::VecOps::RVec<double> weights(p_em.size(), 1.);
+    if (h_em == 0 || h_ep == 0) return weights;
+
+    const double generated = (1. + p0_em * h_em) * (1. + p0_ep * h_ep);
+    for (std::size_t k = 0; k < p_em.size(); ++k) {
+      weights[k] = (1. + p_em[k] * h_em) * (1. + p_ep[k] * h_ep) / generated;
+    }
+    return weights;
+  }
+
+  // the values of a column once per configuration, configuration after configuration, as the x of a 2D fill
+  template <typename T>
+  ROOT::VecOps::RVec<double> repeat_values(const ROOT::VecOps::RVec<T> &values, std::size_t n) {
+    ROOT::VecOps::RVec<double> out(values.size() * n);
+    for (std::size_t k = 0; k < n; ++k) {
+      for (std::size_t i = 0; i < values.size(); ++i) out[k * values.size() + i] = values[i];
+    }
+    return out;
+  }
+
+  template <typename T>
+  ROOT::VecOps::RVec<double> repeat_values(const T &value, std::size_t n) {
+    return ROOT::VecOps::RVec<double>(n, static_cast<double>(value));
+  }
+
+  // the configuration index (the y of the 2D fill) and weight of every value of repeat_values
+  template <typename T>
+  ROOT::VecOps::RVec<double> repeat_index(const ROOT::VecOps::RVec<T> &values, std::size_t n) {
+    ROOT::VecOps::RVec<double> out(values.size() * n);
+    for (std::size_t k = 0; k < n; ++k) {
+      for (std::size_t i = 0; i < values.size(); ++i) out[k * values.size() + i] = k;
+    }
+    return out;
+  }
+
+  template <typename T>
+  ROOT::VecOps::RVec<double> repeat_index(const T &, std::size_t n) {
+    ROOT::VecOps::RVec<double> out(n);
+    for (std::size_t k = 0; k < n; ++k) out[k] = k;
+    return out;
+  }
+
+  template <typename T>
+  ROOT::VecOps::RVec<double> repeat_weights(const ROOT::VecOps::RVec<T> &values, const ROOT::VecOps::RVec<double> &weights) {
+    ROOT::VecOps::RVec<double> out(values.size() * weights.size());
+    for (std::size_t k = 0; k < weights.size(); ++k) {
+      for (std::size_t i = 0; i < values.size(); ++i) out[k * values.size() + i] = weights[k];
+    }
+    return out;
+  }
+
+  template <typename T>
+  ROOT::VecOps::RVec<double> repeat_weights(const T &, const ROOT::VecOps::RVec<double> &weights) {
+    return weights;
+  }
+
+}
+
+#endif
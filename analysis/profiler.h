@@ -0,0 +1,68 @@
+#ifndef TOPEWK_PROFILER_H
+#define TOPEWK_PROFILER_H
+
+#include <atomic>
+#include <chrono>
+#include <deque>
+
+#include "ROOT/RVec.hxx"
+
+namespace topEWK {
+namespace profiler {
+
+  // accumulated cost of one instrumented Define or Filter, shared by all threads
+  struct Counter {
+    std::atomic<long long> nanoseconds{0};
+    std::atomic<long long> calls{0};
+    std::atomic<long long> elements{0};
+    std::atomic<long long> bytes{0};
+  };
+
+  // a deque keeps the counters in place while new ones are added
+  inline std::deque<Counter> &counters() {
+    static std::deque<Counter> all;
+    return all;
+  }
+
+  // called from python while the graph is built, before the event loop starts
+  inline int add() {
+    counters().emplace_back();
+    return static_cast<int>(counters().size()) - 1;
+  }
+
+  inline long long nanoseconds(int id) { return counters()[id].nanoseconds.load(); }
+  inline long long calls(int id) { return counters()[id].calls.load(); }
+  inline long long elements(int id) { return counters()[id].elements.load(); }
+  inline long long bytes(int id) { return counters()[id].bytes.load(); }
+
+  // size of a column value: one element for scalars, the length for collections
+  template <typename T>
+  long long size_of(const T &) { return 1; }
+
+  template <typename T>
+  long long size_of(const ROOT::VecOps::RVec<T> &values) { return static_cast<long long>(values.size()); }
+
+  template <typename T>
+  long long bytes_of(const T &) { return sizeof(T); }
+
+  template <typename T>
+  long long bytes_of(const ROOT::VecOps::RVec<T> &values) { return static_cast<long long>(values.size() * sizeof(T)); }
+
+  // evaluating an expression and charging its wall time and output size to a counter
+  template <typename F>
+  auto timed(int id, F &&expression) {
+    const auto start  = std::chrono::steady_clock::now();
+    auto result       = expression();
+    const auto stop   = std::chrono::steady_clock::now();
+    Counter &counter  = counters()[id];
+    counter.nanoseconds += std::chrono::duration_cast<std::chrono::nanoseconds>(stop - start).count();
+    counter.calls       += 1;
+    counter.elements    += size_of(result);
+    counter.bytes       += bytes_of(result);
+    return result;
+  }
+
+}
+}
+
+#endif
@@ -0,0 +1,201 @@
+# importing packages
+import os
+import sys
+import json
+import math
+import heapq
+import argparse
+import uproot
+from concurrent.futures import ThreadPoolExecutor
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files
+
+# file sizes and event counts are cached, keyed by path, and refreshed when a file changes
+cache_file = os.path.join(os.path.expanduser("~"), ".cache", "topEWK", "sample_stats.json")
+
+# processing time assumed when no measurement is available [s/event]
+default_seconds_per_event = 2e-3
+
+# reading and writing the statistics cache
+def load_cache():
+    if os.path.isfile(cache_file):
+        with open(cache_file) as f:
+            return json.load(f)
+    return {}
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, "w") as f:
+        json.dump(cache, f)
+
+# statistics of one file
+def file_stats(path, cache):
+
+    """
+    Returns the size and number of events of a file, reading the events tree only if the cached
+    entry is missing or the file changed.
+    Parameters:
+    - path: str, path to the .root file.
+    - cache: dict, statistics cache (updated in place).
+    Returns:
+    - stats: dict, {"bytes": int, "events": int}.
+    """
+
+    stat  = os.stat(path)
+    entry = cache.get(path)
+
+    if entry and entry["mtime"] == stat.st_mtime and entry["bytes"] == stat.st_size:
+        return entry
+
+    with uproot.open(path) as file:
+        events = file["events"].num_entries
+
+    cache[path] = {"mtime": stat.st_mtime, "bytes": stat.st_size, "events": events}
+
+    return cache[path]
+
+def sample_stats(input_dir, samples, workers=16):
+
+    """
+    Collects the files, total size and total number of events of every sample.
+    Parameters:
+    - input_dir: str, stage input directory.
+    - samples: list of str, sample names.
+    - workers: int, number of files opened in parallel.
+    Returns:
+    - stats: dict, {sample: {"files": int, "bytes": int, "events": int}}.
+    """
+
+    cache = load_cache()
+    files = {sample: sample_files(input_dir, sample) for sample in samples}
+    paths = [path for sample_paths in files.values() for path in sample_paths]
+
+    # opening files is I/O bound, so threads are enough
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        per_file = dict(zip(paths, pool.map(lambda path: file_stats(path, cache), paths)))
+
+    save_cache(cache)
+
+    return {sample: {"files":  len(sample_paths),
+                     "bytes":  sum(per_file[path]["bytes"] for path in sample_paths),
+                     "events": sum(per_file[path]["events"] for path in sample_paths)}
+            for sample, sample_paths in files.items()}
+
+# choosing the number of chunks
+def plan_chunks(stats, seconds_per_event, target_seconds, target_bytes=None):
+
+    """
+    Chooses the number of chunks of every sample so that each chunk takes about target_seconds
+    and reads at most target_bytes. FCCAnalyses splits the file list of a sample, so a sample
+    cannot have more chunks than files.
+    Parameters:
+    - stats: dict, output of sample_stats().
+    - seconds_per_event: dict, {sample: processing time per event}, missing samples use the default.
+    - target_seconds: float, wanted wall time per chunk.
+    - target_bytes: float, maximum input size per chunk, or None.
+    Returns:
+    - chunks: dict, {sample: number of chunks}.
+    """
+
+    chunks = {}
+
+    for sample, sample_stat in stats.items():
+        seconds = sample_stat["events"] * seconds_per_event.get(sample, default_seconds_per_event)
+        wanted  = math.ceil(seconds / target_seconds)
+
+        if target_bytes:
+            wanted = max(wanted, math.ceil(sample_stat["bytes"] / target_bytes))
+
+        chunks[sample] = max(1, min(wanted, sample_stat["files"]))
+
+    return chunks
+
+# predicting the wall time of the whole production
+def predict_makespan(stats, chunks, seconds_per_event, cores):
+
+    """
+    Predicts the wall time of running all chunks on a number of cores, scheduling the longest
+    chunks first on the least loaded core.
+    Parameters:
+    - stats: dict, output of sample_stats().
+    - chunks: dict, output of plan_chunks().
+    - seconds_per_event: dict, {sample: processing time per event}.
+    - cores: int, number of cores (or batch slots).
+    Returns:
+    - makespan: float, predicted wall time [s].
+    - longest: float, longest single chunk [s].
+    - total: float, summed CPU time [s].
+    """
+
+    durations = []
+
+    for sample, n_chunks in chunks.items():
+        seconds = stats[sample]["events"] * seconds_per_event.get(sample, default_seconds_per_event)
+        durations += [seconds / n_chunks] * n_chunks
+
+    loads = [0.0] * cores
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(loads, loads[0] + duration)
+
+    return max(loads), max(durations, default=0.0), sum(durations)
+
+# writing the processList
+def format_process_list(chunks):
+
+    """
+    Formats the planned chunks as a processList for a stage configuration.
+    Parameters:
+    - chunks: dict, output of plan_chunks().
+    Returns:
+    - text: str, python source of the processList.
+    """
+
+    width = max(len(sample) for sample in chunks) + 3
+    lines = ["processList = {"]
+
+    for sample, n_chunks in chunks.items():
+        lines.append(f"    {repr(sample) + ':':<{width}} {{'chunks':{n_chunks}}},")
+
+    lines.append("}")
+
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan the number of chunks per sample from input sizes and event counts.")
+    parser.add_argument("config", help="stage configuration, e.g. analysis/analysis_stage1.py")
+    parser.add_argument("--input-dir", default=None, help="input directory, defaults to inputDir of the configuration")
+    parser.add_argument("--target-minutes", type=float, default=30.0, help="wanted wall time per chunk")
+    parser.add_argument("--target-gb", type=float, default=None, help="maximum input size per chunk")
+    parser.add_argument("--timing", default=None, help="JSON with seconds per event per sample (e.g. from dry_run.py)")
+    parser.add_argument("--cores", type=int, default=None, help="cores used for the makespan, defaults to nCPUS")
+    args = parser.parse_args()
+
+    config    = load_config(args.config)
+    input_dir = args.input_dir or getattr(config, "inputDir", None)
+
+    if input_dir is None:
+        sys.exit(f"{args.config} has no inputDir, pass --input-dir")
+
+    seconds_per_event = {}
+    if args.timing:
+        with open(args.timing) as f:
+            seconds_per_event = json.load(f)
+
+    stats  = sample_stats(input_dir, list(config.processList))
+    chunks = plan_chunks(stats, seconds_per_event, args.target_minutes * 60,
+                         args.target_gb * 1e9 if args.target_gb else None)
+    cores  = args.cores or getattr(config, "nCPUS", 1)
+
+    print(f"{'sample':<70} {'files':>6} {'events':>11} {'GB':>7} {'chunks':>7} {'was':>5}")
+    for sample, n_chunks in chunks.items():
+        was = config.processList[sample].get("chunks", 1)
+        print(f"{sample:<70} {stats[sample]['files']:>6} {stats[sample]['events']:>11} "
+              f"{stats[sample]['bytes'] / 1e9:>7.2f} {n_chunks:>7} {was:>5}")
+
+    makespan, longest, total = predict_makespan(stats, chunks, seconds_per_event, cores)
+    print(f"\nPredicted makespan on {cores} cores: {makespan / 3600:.2f} h "
+          f"(longest chunk {longest / 60:.1f} min, {total / 3600:.1f} CPU-hours)\n")
+
+    print(format_process_list(chunks))
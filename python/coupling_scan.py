@@ -0,0 +1,228 @@
+# importing packages
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.stats import chi2
+from concurrent.futures import ProcessPoolExecutor
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sample_norm import couplings
+from hist_cube import load_cubes
+from eft_morphing import build_model, morphing_weights, grid
+from datacard_fit import profile_mc_stats
+
+# confidence levels of the contours
+contour_levels = [0.68, 0.95]
+
+# grid points profiled together in one vectorised Newton iteration
+block_size = 4096
+
+# building the scan input
+def channel_templates(cube, lumi, names, selection):
+
+    """
+    Sums the morphing templates of all processes of one selection, as they enter one datacard bin.
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    - names: list of str, scanned couplings.
+    - selection: str, selection of the channel.
+    Returns:
+    - templates: numpy array, shape (1 + 2K, bins).
+    - variances: numpy array, shape (1 + 2K, bins).
+    """
+
+    model = build_model(cube, lumi, names)
+    rows  = [i for i, (process, sel) in enumerate(model["keys"]) if sel == selection]
+
+    if not rows:
+        raise KeyError(f"no complete set of templates for selection {selection}")
+
+    return model["templates"][rows].sum(axis=0), model["variances"][rows].sum(axis=0)
+
+# profiling the normalization at many points at once
+def block_nll(weights, templates, sigma, data, tolerance=1e-8, max_steps=50):
+
+    """
+    Profiles a free overall normalization (as the 'free' rateParam of the datacards) at a block of
+    coupling points, with the MC statistics nuisances profiled analytically. The normalization is
+    the only parameter left to the iteration, so the Hessian of the block is diagonal, one
+    curvature per point: every step computes it together with the gradient, and each point takes
+    its own Newton step.
+    Parameters:
+    - weights: numpy array, morphing weights of the points, shape (G, 1 + 2K).
+    - templates: numpy array, shape (1 + 2K, bins).
+    - sigma: numpy array, MC statistical error of every bin.
+    - data: numpy array, observed (or Asimov) yields.
+    - tolerance: float, convergence of the normalization.
+    - max_steps: int, maximum number of Newton steps.
+    Returns:
+    - nll: numpy array, profiled negative log-likelihood of every point, shape (G,).
+    """
+
+    prediction = np.maximum(weights @ templates, 1e-12)
+    norm       = np.ones(len(prediction))
+
+    def derivatives(norm):
+        total = norm[:, None] * prediction
+        beta  = profile_mc_stats(total, data, sigma)
+        mean  = np.maximum(total + beta * sigma, 1e-12)
+        return beta, mean, ((1 - data / mean) * prediction).sum(axis=1), (data * prediction ** 2 / mean ** 2).sum(axis=1)
+
+    converged = np.zeros(len(norm), dtype=bool)
+
+    for step in range(max_steps):
+        beta, mean, gradient, curvature = derivatives(norm)
+
+        update    = np.where(converged, 0.0, gradient / np.maximum(curvature, 1e-12))
+        norm      = np.maximum(norm - update, 1e-6)
+        converged = np.abs(update) < tolerance
+
+        if converged.all():
+            break
+
+    beta, mean = derivatives(norm)[:2]
+    log        = np.where(data > 0, data * np.log(np.maximum(data, 1e-12) / mean), 0.0)
+
+    return (mean - data + log + beta ** 2 / 2).sum(axis=1)
+
+def scan_block(task):
+
+    """
+    Profiles one block of grid points (run in a worker process).
+    Parameters:
+    - task: tuple, (points, names, templates, sigma, data).
+    Returns:
+    - nll: numpy array, profiled negative log-likelihood of the points.
+    """
+
+    points, names, templates, sigma, data = task
+
+    return block_nll(morphing_weights(points, names), templates, sigma, data)
+
+def profile_scan(points, names, templates, variances, data=None, jobs=1):
+
+    """
+    Evaluates the profile likelihood ratio -2 ln(L/Lmax) on a grid of coupling points. The grid is
+    split into blocks of neighbouring points, each block is profiled at once and the blocks run in
+    parallel.
+    Parameters:
+    - points: numpy array, coupling points, shape (G, K).
+    - names: list of str, couplings in the order of the columns of points.
+    - templates: numpy array, output of channel_templates().
+    - variances: numpy array, output of channel_templates().
+    - data: numpy array, observed yields, the SM Asimov dataset if None.
+    - jobs: int, number of worker processes.
+    Returns:
+    - q: numpy array, -2 delta ln L of every point, shape (G,).
+    """
+
+    data  = templates[0] if data is None else data
+    sigma = np.sqrt(variances[0])
+    tasks = [(points[start:start + block_size], names, templates, sigma, data)
+             for start in range(0, len(points), block_size)]
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            nll = np.concatenate(list(pool.map(scan_block, tasks)))
+    else:
+        nll = np.concatenate([scan_block(task) for task in tasks])
+
+    return 2 * (nll - nll.min())
+
+# contours
+def contour_thresholds(dof):
+
+    """
+    Returns the -2 delta ln L values of the contour_levels for a number of scanned couplings.
+    Parameters:
+    - dof: int, number of couplings.
+    Returns:
+    - thresholds: dict, {level: value}.
+    """
+
+    return {level: chi2.ppf(level, dof) for level in contour_levels}
+
+def plot_scan(axes, q, names, thresholds, output_file):
+
+    """
+    Plots the contours of a 2D scan, or of the 2D profiles of a 3D scan (minimum over the third
+    coupling).
+    Parameters:
+    - axes: list of numpy array, grid values of every coupling.
+    - q: numpy array, -2 delta ln L reshaped to the grid.
+    - names: list of str, couplings.
+    - thresholds: dict, output of contour_thresholds().
+    - output_file: str, path of the image.
+    """
+
+    pairs = [(0, 1)] if len(names) == 2 else [(0, 1), (0, 2), (1, 2)]
+
+    fig, panels = plt.subplots(1, len(pairs), figsize=(6 * len(pairs), 5), squeeze=False)
+
+    for panel, (i, j) in zip(panels[0], pairs):
+        others  = tuple(k for k in range(len(names)) if k not in (i, j))
+        profile = q.min(axis=others) if others else q
+
+        mesh = panel.pcolormesh(axes[i], axes[j], profile.T, shading="auto", cmap="viridis_r")
+        lines = panel.contour(axes[i], axes[j], profile.T, levels=sorted(thresholds.values()), colors=["white", "red"])
+        panel.clabel(lines, fmt={value: f"{level:.0%}" for level, value in thresholds.items()})
+        panel.plot(0, 0, "k+", markersize=12, label="SM")
+        panel.set_xlabel(names[i])
+        panel.set_ylabel(names[j])
+        panel.legend()
+        fig.colorbar(mesh, ax=panel, label=r"$-2\Delta\ln L$")
+
+    fig.tight_layout()
+    fig.savefig(output_file)
+    plt.close(fig)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile likelihood scan on a 2D/3D grid of the ta_ttA, tv_ttA, vr_ttZ couplings.")
+    parser.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    parser.add_argument("--variable", required=True, help="histogram used for the fit, e.g. muon_pass_energy")
+    parser.add_argument("--selection", default="TestSel", help="selection of the histograms")
+    parser.add_argument("--coupling", action="append", default=[], metavar="NAME=MIN:MAX:N",
+                        help="coupling range, repeat for every scanned coupling (default: all three, 3c either side, 41 points)")
+    parser.add_argument("--lumi", type=float, default=None, help="luminosity [pb^-1], defaults to the one of the final stage")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--output", default=None, help="write the grid and -2 delta ln L to this .npz")
+    parser.add_argument("--plot", default=None, help="save the contour plot to this image")
+    args = parser.parse_args()
+
+    cubes, int_lumi = load_cubes(args.cubes)
+
+    ranges = {}
+    for option in args.coupling:
+        name, values = option.split("=")
+        low, high, n = values.split(":")
+        ranges[name] = (float(low), float(high), int(n))
+
+    ranges = ranges or {name: (-3 * value, 3 * value, 41) for name, value in couplings.items()}
+    names  = list(ranges)
+    axes   = [np.linspace(*ranges[name]) for name in names]
+    points = grid([ranges[name] for name in names])
+
+    templates, variances = channel_templates(cubes[args.variable], args.lumi or int_lumi, names, args.selection)
+
+    start = time.perf_counter()
+    q     = profile_scan(points, names, templates, variances, jobs=args.jobs).reshape([len(axis) for axis in axes])
+    print(f"Scanned {len(points)} points in {time.perf_counter() - start:.2f} s")
+
+    thresholds = contour_thresholds(len(names))
+    for name, axis in zip(names, axes):
+        others = tuple(k for k in range(len(names)) if names[k] != name)
+        inside = axis[q.min(axis=others) <= chi2.ppf(0.68, 1)] if others else axis[q <= chi2.ppf(0.68, 1)]
+        if len(inside):
+            print(f"  {name:<7} 68% CL interval (profiled): [{inside.min():.4g}, {inside.max():.4g}]")
+
+    if args.output:
+        np.savez_compressed(args.output, q=q, names=np.array(names), thresholds=np.array(list(thresholds.values())),
+                            **{f"axis_{name}": axis for name, axis in zip(names, axes)})
+
+    if args.plot and len(names) > 1:
+        plot_scan(axes, q, names, thresholds, args.plot)
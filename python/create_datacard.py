@@ -1,70 +1,119 @@
 import os
+import uproot
+from concurrent.futures import ProcessPoolExecutor
 
-def create_datacard(energy_type, variation, signal_processes, background_processes, output_dir, signal_base_path, background_base_path):
+# Datacard template: all shapes of a card come from one file, named after the process ($PROCESS)
+# and, for shape nuisances, after the process and the systematic ($PROCESS_$SYSTEMATIC)
+card_template = """imax    1 number of bins
+jmax    * number of processes minus 1
+kmax    * number of nuisance parameters
+--------------------------------------------------------------------------------
+shapes  *  *  {shape_file}  $PROCESS  $PROCESS_$SYSTEMATIC
+--------------------------------------------------------------------------------
+bin            DH
+observation    -1
+--------------------------------------------------------------------------------
+{process_table}
+--------------------------------------------------------------------------------
+free rateParam DH * 1.0
+* autoMCStats 1 1"""
+
+def shape_sources(energy_type, variation, signal_processes, background_processes, signal_base_path, background_base_path):
     """
-    Creates a single data card for a specific energy type and variation.
+    Lists the input histogram of every process of a card, and of data_obs (the first SM process).
+
+    Returns:
+    - sources (dict): {process: (path of the .root file, name of the histogram)}.
     """
-    # Construct paths for signal and background processes
-    signal_paths = [
-        f"{signal_base_path}/deviation_histogram_{energy_type}_{proc}_{variation}_TestSel.root"
+    sources = {
+        proc: (f"{signal_base_path}/deviation_histogram_{energy_type}_{proc}_{variation}_TestSel.root",
+               f"deviation_hist_{energy_type}_{proc}_{variation}_TestSel")
         for proc in signal_processes
-    ]
-    background_paths = [
-        f"{background_base_path}/{energy_type}_{proc.replace('SM', '')}_SM_TestSel.root"
+    }
+    sources.update({
+        proc: (f"{background_base_path}/{energy_type}_{proc.replace('SM', '')}_SM_TestSel.root", energy_type)
         for proc in background_processes
-    ]
-    
-    # Data card lines
-    lines = [
-        "imax    1 number of bins",
-        "jmax    * number of processes minus 1",
-        "kmax    * number of nuisance parameters",
-        "--------------------------------------------------------------------------------",
-    ]
-    
-    # Add shapes for signal processes
-    for proc, path in zip(signal_processes, signal_paths):
-        lines.append(f"shapes  {proc}    DH  {path}  deviation_hist_{energy_type}_{proc}_{variation}_TestSel")
-    
-    # Add shapes for background processes
-    for proc, path in zip(background_processes, background_paths):
-        lines.append(f"shapes  {proc}  DH  {path}  {energy_type}")
-    
-    # Add shapes for data_obs (assumes it's the same as one of the SM processes)
-    lines.append(f"shapes  data_obs   DH  {background_paths[0]}  {energy_type}")
-    
-    lines.append("--------------------------------------------------------------------------------")
-    lines.append("bin".ljust(15) + "DH")
-    lines.append("observation".ljust(15) + "-1")
-    lines.append("--------------------------------------------------------------------------------")
-    
-    # Add bin, process, and rate with consistent spacing
+    })
+    sources["data_obs"] = sources[background_processes[0]]
+
+    return sources
+
+def validate_sources(all_sources):
+    """
+    Checks that every referenced histogram exists, opening every input file once for all cards.
+
+    Args:
+    - all_sources (list): Outputs of shape_sources() of all cards.
+
+    Raises:
+    - FileNotFoundError: listing every missing file and histogram.
+    """
+    wanted = {}
+    for sources in all_sources:
+        for path, hist in sources.values():
+            wanted.setdefault(path, set()).add(hist)
+
+    missing = []
+    for path, hists in sorted(wanted.items()):
+        if not os.path.exists(path):
+            missing.append(f"{path} (file)")
+            continue
+        with uproot.open(path) as f:
+            keys = set(f.keys(cycle=False))
+        missing += [f"{path}:{hist}" for hist in sorted(hists - keys)]
+
+    if missing:
+        raise FileNotFoundError(f"{len(missing)} input histograms are missing:\n  " + "\n  ".join(missing))
+
+def process_table(signal_processes, background_processes, column_width=15):
+    """
+    Formats the bin, process and rate lines, signals with ids <= 0.
+    """
     all_processes = signal_processes + background_processes
-    column_width = 15  # Consistent column width
-
-    bins_line = "bin".ljust(column_width) + " ".join(["DH".ljust(column_width) for _ in all_processes])
-    process_names_line = "process".ljust(column_width) + " ".join([proc.ljust(column_width) for proc in all_processes])
-    process_ids_line = "process".ljust(column_width) + " ".join(
-        [f"-{i+1}".ljust(column_width) for i in range(len(signal_processes))] +
-        [f"{i+1}".ljust(column_width) for i in range(len(background_processes))]
-    )
-    rates_line = "rate".ljust(column_width) + " ".join(["-1".ljust(column_width) for _ in all_processes])
-    
-    lines.extend([bins_line, process_names_line, process_ids_line, rates_line])
-    lines.append("--------------------------------------------------------------------------------")
-    lines.append("free rateParam DH * 1.0")
-    lines.append("* autoMCStats 1 1")
-
-    # Write to file
+    ids = [f"-{i+1}" for i in range(len(signal_processes))] + [f"{i+1}" for i in range(len(background_processes))]
+
+    rows = [
+        ("bin", ["DH"] * len(all_processes)),
+        ("process", all_processes),
+        ("process", ids),
+        ("rate", ["-1"] * len(all_processes)),
+    ]
+
+    return "\n".join(name.ljust(column_width) + " ".join(value.ljust(column_width) for value in values) for name, values in rows)
+
+def create_datacard(energy_type, variation, signal_processes, background_processes, output_dir, signal_base_path, background_base_path):
+    """
+    Creates a single data card for a specific energy type and variation, with all its shapes
+    packed into shapes_{energy_type}_{variation}.root next to it.
+    """
+    sources    = shape_sources(energy_type, variation, signal_processes, background_processes, signal_base_path, background_base_path)
+    shape_file = f"shapes_{energy_type}_{variation}.root"
+
+    # Pack the shapes, one histogram per process
+    with uproot.recreate(os.path.join(output_dir, shape_file)) as output:
+        for proc, (path, hist) in sources.items():
+            with uproot.open(path) as f:
+                output[proc] = f[hist]
+
+    # Render the card, the shape file is found relative to it
     output_path = os.path.join(output_dir, f"datacard_{energy_type}_{variation}.txt")
     with open(output_path, "w") as f:
-        f.write("\n".join(lines))
+        f.write(card_template.format(shape_file=shape_file, process_table=process_table(signal_processes, background_processes)))
     print(f"Data card written to {output_path}")
 
-def generate_datacards(energy_types, variations, signal_processes, background_processes, output_dir, signal_base_path, background_base_path):
+    return output_path
+
+def write_card(task):
+    """
+    Creates one data card (in a worker process).
     """
-    Generates data cards for all specified energy types and variations.
-    
+    return create_datacard(*task)
+
+def generate_datacards(energy_types, variations, signal_processes, background_processes, output_dir, signal_base_path, background_base_path, jobs=1):
+    """
+    Generates data cards for all specified energy types and variations. All input histograms are
+    validated before any card is written, then the cards are written in parallel.
+
     Args:
     - energy_types (list): List of energy types (e.g., ["muon_pass_energy", "electron_pass_energy", "Emiss_energy"]).
     - variations (list): List of BSM variations (e.g., ["ta_ttAdown", "ta_ttAup"]).
@@ -73,10 +122,25 @@ def generate_datacards(energy_types, variations, signal_processes, background_pr
     - output_dir (str): Directory to save the data cards.
     - signal_base_path (str): Base path for the signal root histogram files.
     - background_base_path (str): Base path for the background root histogram files.
+    - jobs (int): Number of worker processes.
+
+    Returns:
+    - paths (list): Paths of the data cards.
     """
-    for energy_type in energy_types:
-        for variation in variations:
-            create_datacard(energy_type, variation, signal_processes, background_processes, output_dir, signal_base_path, background_base_path)
+    tasks = [
+        (energy_type, variation, signal_processes, background_processes, output_dir, signal_base_path, background_base_path)
+        for energy_type in energy_types
+        for variation in variations
+    ]
+
+    validate_sources([shape_sources(*task[:4], *task[5:]) for task in tasks])
+    os.makedirs(output_dir, exist_ok=True)
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(write_card, tasks))
+
+    return [write_card(task) for task in tasks]
 
 if __name__ == "__main__":
     # Define inputs
@@ -87,6 +151,7 @@ if __name__ == "__main__":
     output_dir = "./datacards"
     signal_base_path = "/ceph/salshamaily/topEWK_FCCee/root_hists/bsm_sm_dev_samples"
     background_base_path = "/ceph/salshamaily/topEWK_FCCee/root_hists/bsm_sm_samples"
-    
+    jobs = 8
+
     # generating datacards for all variables
-    generate_datacards(energy_types, variations, signal_processes, background_processes, output_dir, signal_base_path, background_base_path)
\ No newline at end of file
+    generate_datacards(energy_types, variations, signal_processes, background_processes, output_dir, signal_base_path, background_base_path, jobs)
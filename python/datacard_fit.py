@@ -0,0 +1,479 @@
+# importing packages
+import os
+import json
+import glob
+import time
+import fnmatch
+import argparse
+import numpy as np
+import uproot
+from scipy.optimize import minimize
+from scipy.stats import norm
+
+# confidence level of the upper limits (CLs)
+cl_alpha = 0.05
+
+# number of signal strength points of the limit scans
+limit_points = 100
+
+# reading a datacard
+def parse_datacard(path):
+
+    """
+    Reads a text datacard as written by create_datacard.py: shapes, observation, processes and
+    rates, rateParam and autoMCStats lines. Other nuisance lines are reported and ignored.
+    Parameters:
+    - path: str, path to the datacard.
+    Returns:
+    - card: dict, "path", "bin", "processes", "signal", "rates", "shapes", "observation",
+      "rate_params" and "auto_mc_stats".
+    """
+
+    card = {"path": path, "bin": None, "processes": [], "signal": [], "rates": [], "shapes": {},
+            "observation": -1, "rate_params": [], "auto_mc_stats": None}
+    columns = {}
+
+    with open(path) as f:
+        lines = [line.split("#")[0].split() for line in f]
+
+    for words in lines:
+        if not words or words[0].startswith("-") or words[0] in ["imax", "jmax", "kmax"]:
+            continue
+
+        if words[0] == "shapes":
+            card["shapes"][words[1]] = {"bin": words[2], "file": words[3], "hist": words[4],
+                                        "syst": words[5] if len(words) > 5 else None}
+        elif words[0] == "observation":
+            card["observation"] = float(words[1])
+        elif words[0] in ["bin", "process", "rate"]:
+            # the first 'bin' line belongs to the observation, the later ones to the processes
+            key = words[0] if words[0] != "process" or "process" not in columns else "process_id"
+            columns[key] = words[1:]
+        elif len(words) > 1 and words[1] == "rateParam":
+            card["rate_params"].append({"name": words[0], "bin": words[2], "process": words[3], "init": float(words[4])})
+        elif len(words) > 1 and words[1] == "autoMCStats":
+            card["auto_mc_stats"] = {"bin": words[0], "threshold": float(words[2]),
+                                     "include_signal": len(words) > 3 and words[3] != "0"}
+        else:
+            print(f"Warning: {path}: '{' '.join(words)}' is not supported and was ignored")
+
+    card["bin"]       = columns["bin"][0]
+    card["processes"] = columns["process"]
+    card["signal"]    = [int(number) <= 0 for number in columns["process_id"]]
+    card["rates"]     = [float(rate) for rate in columns["rate"]]
+
+    return card
+
+def shape_of(card, process, systematic=None):
+
+    """
+    Finds the shape entry of a process, falling back on the '*' entry, and fills in $PROCESS,
+    $CHANNEL and $SYSTEMATIC. Relative file paths are taken from the directory of the datacard.
+    Parameters:
+    - card: dict, output of parse_datacard().
+    - process: str, process name (or data_obs).
+    - systematic: str, shape nuisance with its Up/Down suffix, None for the nominal shape.
+    Returns:
+    - file: str, path to the .root file.
+    - hist: str, name of the histogram in the file.
+    """
+
+    shape   = card["shapes"].get(process) or card["shapes"]["*"]
+    pattern = shape["hist"] if systematic is None else shape["syst"]
+
+    if pattern is None:
+        raise KeyError(f"{card['path']}: no systematic shapes given for {process}")
+
+    names = {"$PROCESS": process, "$CHANNEL": card["bin"], "$SYSTEMATIC": systematic or ""}
+    file  = shape["file"]
+    hist  = pattern
+    for key, value in names.items():
+        file = file.replace(key, value)
+        hist = hist.replace(key, value)
+
+    if not os.path.isabs(file):
+        file = os.path.join(os.path.dirname(card["path"]), file)
+
+    return file, hist
+
+def read_shape(card, process):
+
+    """
+    Reads the contents and squared errors of the shape of a process, without flow bins.
+    Parameters:
+    - card: dict, output of parse_datacard().
+    - process: str, process name (or data_obs).
+    Returns:
+    - values: numpy array, bin contents.
+    - variances: numpy array, squared bin errors.
+    """
+
+    file, hist = shape_of(card, process)
+
+    with uproot.open(file) as f:
+        return f[hist].values(), f[hist].variances()
+
+def load_card(card):
+
+    """
+    Reads every shape of a datacard and applies the rates (-1 keeps the integral of the shape).
+    Parameters:
+    - card: dict, output of parse_datacard().
+    Returns:
+    - yields: numpy array, shape (processes, bins).
+    - variances: numpy array, shape (processes, bins).
+    - data: numpy array, shape (bins,).
+    """
+
+    yields, variances = [], []
+
+    for process, rate in zip(card["processes"], card["rates"]):
+        values, errors = read_shape(card, process)
+        factor         = 1.0 if rate < 0 or values.sum() == 0 else rate / values.sum()
+        yields.append(values * factor)
+        variances.append(errors * factor ** 2)
+
+    data = read_shape(card, "data_obs")[0] if ("data_obs" in card["shapes"] or "*" in card["shapes"]) else None
+
+    return np.array(yields), np.array(variances), data
+
+# stacking all cards into one batch
+def build_batch(cards):
+
+    """
+    Reads all datacards into padded arrays so that every card is fitted at once. Parameter 0 of a
+    card is the signal strength r applied to its signal processes, the next ones are its rateParams.
+    Parameters:
+    - cards: list of dict, outputs of parse_datacard().
+    Returns:
+    - batch: dict, "names", "yields" (C, P, B), "sigma" (C, B), "data" (C, B), "mask" (C, B),
+      "uses" (C, K, P), "init" (C, K) and "params" (names of the parameters of every card).
+    """
+
+    loaded = [load_card(card) for card in cards]
+    n_proc = max(len(card["processes"]) for card in cards)
+    n_bins = max(len(data if data is not None else yields[0]) for yields, variances, data in loaded)
+    n_par  = 1 + max(len({param["name"] for param in card["rate_params"]}) for card in cards)
+
+    batch = {"names":  [card["path"] for card in cards],
+             "yields": np.zeros((len(cards), n_proc, n_bins)),
+             "sigma":  np.zeros((len(cards), n_bins)),
+             "data":   np.zeros((len(cards), n_bins)),
+             "mask":   np.zeros((len(cards), n_bins), dtype=bool),
+             "uses":   np.zeros((len(cards), n_par, n_proc), dtype=bool),
+             "init":   np.ones((len(cards), n_par)),
+             "params": []}
+
+    for c, (card, (yields, variances, data)) in enumerate(zip(cards, loaded)):
+        n_p, n_b = yields.shape
+        batch["yields"][c, :n_p, :n_b] = yields
+        batch["mask"][c, :n_b]         = True
+        batch["uses"][c, 0, :n_p]      = card["signal"]
+
+        # Barlow-Beeston lite: one nuisance per bin on the summed template, with the summed MC error
+        stats = card["auto_mc_stats"]
+        if stats is not None:
+            included = [stats["include_signal"] or not signal for signal in card["signal"]]
+            batch["sigma"][c, :n_b] = np.sqrt(variances[included].sum(axis=0))
+
+        names = ["r"]
+        for param in card["rate_params"]:
+            if param["name"] not in names:
+                names.append(param["name"])
+            k = names.index(param["name"])
+            batch["init"][c, k] = param["init"]
+            if fnmatch.fnmatch(card["bin"], param["bin"]):
+                batch["uses"][c, k, :n_p] |= [fnmatch.fnmatch(process, param["process"]) for process in card["processes"]]
+
+        batch["params"].append(names)
+        batch["data"][c, :n_b] = data if data is not None else yields[~np.array(card["signal"])].sum(axis=0)
+
+    return batch
+
+def repeat_batch(batch, times):
+
+    """
+    Repeats every card of a batch, e.g. once per point of a signal strength scan.
+    Parameters:
+    - batch: dict, output of build_batch().
+    - times: int, number of copies of every card.
+    Returns:
+    - batch: dict, with every array repeated along the first axis.
+    """
+
+    return {key: np.repeat(value, times, axis=0) if isinstance(value, np.ndarray) else value
+            for key, value in batch.items()}
+
+# the likelihood
+def expected(theta, batch):
+
+    """
+    Computes the expected yield of every bin and its derivative with respect to the parameters.
+    Every process is scaled by the product of the parameters that apply to it.
+    Parameters:
+    - theta: numpy array, parameters, shape (C, K).
+    - batch: dict, output of build_batch().
+    Returns:
+    - total: numpy array, shape (C, B).
+    - derivative: numpy array, shape (C, K, B).
+    """
+
+    factors = np.where(batch["uses"], theta[:, :, None], 1.0)
+    scale   = factors.prod(axis=1)
+    total   = np.einsum('cp,cpb->cb', scale, batch["yields"])
+
+    derivative = np.empty(theta.shape + (total.shape[1],))
+    for k in range(theta.shape[1]):
+        others = np.delete(factors, k, axis=1).prod(axis=1) * batch["uses"][:, k]
+        derivative[:, k] = np.einsum('cp,cpb->cb', others, batch["yields"])
+
+    return total, derivative
+
+def profile_mc_stats(total, data, sigma):
+
+    """
+    Profiles the Barlow-Beeston lite nuisance of every bin analytically: the expected yield is
+    total + beta * sigma with a unit Gaussian constraint on beta, and the minimum in beta is the
+    root of sigma beta^2 + (total + sigma^2) beta + sigma (total - data) = 0.
+    Parameters:
+    - total: numpy array, expected yields.
+    - data: numpy array, observed yields.
+    - sigma: numpy array, MC statistical error of every bin (zero switches the nuisance off).
+    Returns:
+    - beta: numpy array, profiled nuisances.
+    """
+
+    linear = total + sigma ** 2
+    root   = np.sqrt((total - sigma ** 2) ** 2 + 4 * sigma ** 2 * data)
+    denom  = linear + root
+
+    # written without dividing by sigma, so it is stable for small errors and zero without them
+    return np.divide(-2 * sigma * (total - data), denom, out=np.zeros_like(denom), where=denom > 0)
+
+def nll(theta, batch, data):
+
+    """
+    Computes the negative log-likelihood of every card, as a Poisson deviance with the MC
+    statistics nuisances profiled, and its gradient (the nuisances drop out at their minimum).
+    Parameters:
+    - theta: numpy array, parameters, shape (C, K).
+    - batch: dict, output of build_batch().
+    - data: numpy array, observed yields, shape (C, B).
+    Returns:
+    - nll: numpy array, shape (C,).
+    - gradient: numpy array, shape (C, K).
+    """
+
+    total, derivative = expected(theta, batch)
+
+    beta = profile_mc_stats(total, data, batch["sigma"])
+    mean = np.maximum(total + beta * batch["sigma"], 1e-12)
+    log  = np.where(data > 0, data * np.log(np.maximum(data, 1e-12) / mean), 0.0)
+    term = np.where(batch["mask"], mean - data + log + beta ** 2 / 2, 0.0)
+
+    pull = np.where(batch["mask"], 1 - data / mean, 0.0)
+
+    return term.sum(axis=1), np.einsum('cb,ckb->ck', pull, derivative)
+
+def fit(batch, data, fixed_r=None):
+
+    """
+    Minimizes the likelihood of all cards at once. The cards are independent, so the summed
+    likelihood is minimized over all their parameters in one call.
+    Parameters:
+    - batch: dict, output of build_batch() or repeat_batch().
+    - data: numpy array, observed yields, shape (C, B).
+    - fixed_r: numpy array, signal strength of every card, shape (C,), or None to fit it.
+    Returns:
+    - theta: numpy array, best-fit parameters, shape (C, K).
+    - nll: numpy array, minimum of every card, shape (C,).
+    """
+
+    theta = batch["init"].copy()
+    free  = np.ones(theta.shape, dtype=bool)
+
+    # parameters that no process uses (padding) stay at their initial value
+    free &= batch["uses"].any(axis=2)
+
+    if fixed_r is not None:
+        theta[:, 0] = fixed_r
+        free[:, 0]  = False
+
+    bounds = [(None, None) if k == 0 else (0.0, None) for c, k in zip(*np.nonzero(free))]
+
+    def objective(x):
+        trial       = theta.copy()
+        trial[free] = x
+        values, gradient = nll(trial, batch, data)
+        return values.sum(), gradient[free]
+
+    if free.any():
+        result      = minimize(objective, theta[free], jac=True, method="L-BFGS-B", bounds=bounds,
+                               options={"maxiter": 5000, "ftol": 1e-14, "gtol": 1e-9})
+        theta[free] = result.x
+
+    return theta, nll(theta, batch, data)[0]
+
+def r_error(theta, batch, data, step=1e-4):
+
+    """
+    Estimates the uncertainty of the signal strength of every card from the Hessian of the
+    likelihood, built by finite differences of the analytic gradient.
+    Parameters:
+    - theta: numpy array, best-fit parameters, shape (C, K).
+    - batch: dict, output of build_batch().
+    - data: numpy array, observed yields, shape (C, B).
+    - step: float, finite difference step.
+    Returns:
+    - error: numpy array, shape (C,).
+    """
+
+    n_par   = theta.shape[1]
+    hessian = np.empty(theta.shape + (n_par,))
+
+    for k in range(n_par):
+        up, down = theta.copy(), theta.copy()
+        up[:, k] += step
+        down[:, k] -= step
+        hessian[:, :, k] = (nll(up, batch, data)[1] - nll(down, batch, data)[1]) / (2 * step)
+
+    # unused (padding) parameters are decoupled so that the matrix can be inverted
+    unused = ~batch["uses"].any(axis=2)
+    hessian[unused] = 0.0
+    hessian[:, np.arange(n_par), np.arange(n_par)] += unused
+
+    with np.errstate(invalid="ignore"):
+        return np.sqrt(np.linalg.inv(hessian)[:, 0, 0])
+
+# results for all cards
+def asimov(batch, r):
+
+    """
+    Builds the Asimov dataset of every card at a signal strength, with the rateParams at their
+    initial values.
+    Parameters:
+    - batch: dict, output of build_batch().
+    - r: float, signal strength.
+    Returns:
+    - data: numpy array, shape (C, B).
+    """
+
+    theta       = batch["init"].copy()
+    theta[:, 0] = r
+
+    return expected(theta, batch)[0]
+
+def cls_limits(batch, data, scale):
+
+    """
+    Finds the asymptotic CLs upper limit on the signal strength of every card, from one batched
+    scan of the profile likelihood on the data and on the background-only Asimov dataset.
+    Parameters:
+    - batch: dict, output of build_batch().
+    - data: numpy array, observed yields, shape (C, B).
+    - scale: numpy array, expected uncertainty of r of every card, sets the scan range.
+    Returns:
+    - expected: numpy array, median expected limits, shape (C,).
+    - observed: numpy array, observed limits, shape (C,).
+    """
+
+    n_cards = len(batch["names"])
+    points  = np.linspace(0, 1, limit_points)[None, :] * 6 * np.where(np.isfinite(scale), scale, 1.0)[:, None]
+    scan    = repeat_batch(batch, limit_points)
+
+    background = np.repeat(asimov(batch, 0.0), limit_points, axis=0)
+    observed   = np.repeat(data, limit_points, axis=0)
+
+    # minima of the likelihood with r free (r >= 0 for the observed test statistic)
+    fitted, nll_data = fit(batch, data)
+    best             = np.maximum(fitted[:, 0], 0.0)
+    nll_data         = fit(batch, data, best)[1]
+    nll_asimov       = fit(batch, asimov(batch, 0.0), np.zeros(n_cards))[1]
+
+    q_asimov = 2 * (fit(scan, background, points.ravel())[1].reshape(n_cards, -1) - nll_asimov[:, None])
+    q_data   = 2 * (fit(scan, observed, points.ravel())[1].reshape(n_cards, -1) - nll_data[:, None])
+    q_data   = np.where(points >= best[:, None], np.maximum(q_data, 0), 0.0)
+    q_asimov = np.maximum(q_asimov, 0)
+
+    # on the background-only Asimov data CLs = 2 (1 - Phi(sqrt(q))), the median expected limit
+    # is where sqrt(q) = Phi^-1(1 - alpha/2)
+    cls_exp = 2 * norm.sf(np.sqrt(q_asimov))
+    cls_obs = norm.sf(np.sqrt(q_data)) / np.maximum(norm.cdf(np.sqrt(q_asimov) - np.sqrt(q_data)), 1e-300)
+
+    return crossing(points, cls_exp), crossing(points, cls_obs)
+
+def crossing(points, cls):
+
+    """
+    Interpolates the signal strength where CLs falls below cl_alpha, NaN if it does not in the scan.
+    Parameters:
+    - points: numpy array, scanned signal strengths, shape (C, N).
+    - cls: numpy array, CLs at the points, shape (C, N).
+    Returns:
+    - limits: numpy array, shape (C,).
+    """
+
+    below = cls < cl_alpha
+    first = below.argmax(axis=1)
+    rows  = np.arange(len(points))
+    prev  = np.maximum(first - 1, 0)
+
+    x0, x1 = points[rows, prev], points[rows, first]
+    y0, y1 = cls[rows, prev], cls[rows, first]
+    slope  = np.where(y1 != y0, (cl_alpha - y0) / np.where(y1 != y0, y1 - y0, 1.0), 0.0)
+
+    return np.where(below.any(axis=1), x0 + slope * (x1 - x0), np.nan)
+
+def fit_cards(paths):
+
+    """
+    Fits all datacards in one batch: best-fit signal strength with its error, Asimov expected
+    significance for r = 1, and expected and observed CLs upper limits.
+    Parameters:
+    - paths: list of str, paths to the datacards.
+    Returns:
+    - results: list of dict, one per card.
+    """
+
+    batch = build_batch([parse_datacard(path) for path in paths])
+    data  = batch["data"]
+
+    theta, nll_best = fit(batch, data)
+    error           = r_error(theta, batch, data)
+
+    # expected significance: r = 1 Asimov data against the r = 0 hypothesis
+    signal        = asimov(batch, 1.0)
+    theta_a, nll1 = fit(batch, signal)
+    nll0          = fit(batch, signal, np.zeros(len(paths)))[1]
+    significance  = np.sqrt(np.maximum(2 * (nll0 - nll1), 0))
+
+    scale              = r_error(fit(batch, asimov(batch, 0.0))[0], batch, asimov(batch, 0.0))
+    expected, observed = cls_limits(batch, data, scale)
+
+    return [{"card": path, "r": theta[c, 0], "r_error": error[c], "significance": significance[c],
+             "expected_limit": expected[c], "observed_limit": observed[c],
+             **{name: theta[c, k] for k, name in enumerate(batch["params"][c]) if k > 0}}
+            for c, path in enumerate(paths)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit datacards with a binned Poisson likelihood, all cards in one batch.")
+    parser.add_argument("cards", nargs="+", help="datacards, or directories containing datacard_*.txt")
+    parser.add_argument("--json", default=None, help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.cards:
+        paths += sorted(glob.glob(os.path.join(path, "datacard_*.txt"))) if os.path.isdir(path) else [path]
+
+    start   = time.perf_counter()
+    results = fit_cards(paths)
+    print(f"Fitted {len(paths)} datacards in {time.perf_counter() - start:.2f} s\n")
+
+    print(f"{'datacard':<50} {'r':>8} {'error':>8} {'Z exp':>7} {'lim exp':>9} {'lim obs':>9}")
+    for result in results:
+        print(f"{os.path.basename(result['card']):<50} {result['r']:>8.3f} {result['r_error']:>8.3f} "
+              f"{result['significance']:>7.2f} {result['expected_limit']:>9.3f} {result['observed_limit']:>9.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
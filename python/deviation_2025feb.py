@@ -9,6 +9,7 @@ sys.path.append('./python')
 sys.path.append('./analysis')
 from hist_plots_2025jan import get_xlabel, get_selection, get_variation, get_process
 from analysis_final import procDictAdd, intLumi
+from hist_cube import build_cubes, norm_table, normalize, deviations, write_histogram
 
 # glob all .root hist files
 root_files = glob.glob('/ceph/salshamaily/topEWK_FCCee/samples/all/*.root')
@@ -22,87 +23,29 @@ plot_files = glob.glob("/ceph/salshamaily/topEWK_FCCee/samples/deviation/*.root"
 # output directory for plotting function
 outplot_dir = "/ceph/salshamaily/topEWK_FCCee/plots/deviation/stack_2025feb"
 
-# original root files to use in parse_data() function
-parse_dir = "ceph/salshamaily/topEWK_FCCee/analysis/final_output"
-        
 # calculating deviations
 def calculate_deviations(root_files):
     
     print('Calculating deviations...')
     
-    histograms = {}
-    
-    # function to manipulate file names from final output analysis used in re-scaling
-    def pad_data(filename, process, variation):
-    
-            if variation == "SM":
-                    return f"wzp6_ee_SM_tt_{process}_noCKMmix_keepPolInfo_ecm365"
-            
-            return f"wzp6_ee_SM_tt_{process}_noCKMmix_keepPolInfo_{variation}_ecm365"
+    # all histograms of a variable in one array, normalized at once
+    cubes = build_cubes(root_files, lambda file: (get_process(file), get_variation(file), get_selection(file)))
+    table = norm_table(procDictAdd, intLumi)
     
-    for file in root_files:
-        f = ROOT.TFile.Open(file)
+    for variable_name, cube in cubes.items():
+        for process, variation, selection in normalize(cube, table):
+            print(f'Warning: {variable_name} ({process}, {variation}, {selection}) is empty and was not re-scaled')
         
-        variation = get_variation(file)
-        selection = get_selection(file)
-        process   = get_process(file)
-    
-        for key in f.GetListOfKeys():
-            variable = key.ReadObj()
+        # subtracting SM from BSM histograms of the same process and selection
+        deviation = deviations(cube)
         
-            if isinstance(variable, ROOT.TH1):
-                hist = variable.Clone()  # cloning to avoid file deletion
-                hist.SetDirectory(0)
-                
-                variable_name = hist.GetName()
-                
-                # from analysis_final.py
-                parsed_filename = pad_data(file, process, variation)
-                SumOfWeights    = procDictAdd[parsed_filename]['sumOfWeights']
-                N_exp           = procDictAdd[parsed_filename]['crossSection']*intLumi
-                
-                # re-scaling histogram for accuracy
-                factor = hist.GetEntries()/hist.Integral() * (N_exp/SumOfWeights)
-                hist.Scale(factor)
-                
-                # group histograms using nested dictionaries
-                if variable_name not in histograms:
-                    histograms[variable_name] = {}
-                    
-                if process not in histograms[variable_name]:
-                    histograms[variable_name][process] = {}
-                    
-                if selection not in histograms[variable_name][process]:
-                    histograms[variable_name][process][selection] = {}
-                    
-                # adding groups to a list
-                histograms[variable_name][process][selection][variation] = hist
-                
-        f.Close()
-    
-    # getting deviations for each variable, process, selection
-    for variable_name, process_dict in histograms.items():
-        for process, selection_dict in process_dict.items():
-            for selection, variation_dict in selection_dict.items():
-            
-                sm_hist = variation_dict['SM']
+        for i, (process, variation, selection) in enumerate(deviation["keys"]):
+        
+            # saving deviation histogram to output file
+            output_file = os.path.join(output_dir, f'{variable_name}_{process}_{variation}_{selection}_devhisto.root')
+            write_histogram(output_file, variable_name, deviation, i)
             
-                for variation, hist in variation_dict.items():
-                    if variation == 'SM':
-                        continue
-                    
-                    # subtracting SM from BSM histograms
-                    deviation_hist = hist.Clone()
-                    deviation_hist.Add(sm_hist,-1)
-                
-                    # saving deviation histogram to output file
-                    output_file = os.path.join(output_dir, f'{variable_name}_{process}_{variation}_{selection}_devhisto.root')
-                
-                    output_root = ROOT.TFile(output_file, 'RECREATE')
-                    deviation_hist.Write()
-                    output_root.Close()
-                
-                    print(f'Saved {deviation_hist.GetName()} to {output_file}')
+            print(f'Saved {variable_name} to {output_file}')
                 
 # plotting deviation histograms
 def plot_deviations(root_files):
@@ -0,0 +1,185 @@
+# importing packages
+import os
+import sys
+import argparse
+import numpy as np
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from hist_cube import load_cubes, reference_rows
+
+# fractions of the total BSM separation reported
+explained_levels = [0.9, 0.99, 0.999]
+
+# stacking the deviations
+def deviation_matrix(cubes, lumi, reference='SM'):
+
+    """
+    Stacks the deviations BSM - SM of calculate_deviations into one matrix: one row per
+    (process, selection, variation), the bins of all variables side by side. Every bin is divided
+    by its expected error sqrt(SM + MC variances), so that the squared norm of a row is the chi2
+    of its deviation and the SVD ranks directions by separation power.
+    Parameters:
+    - cubes: dict, output of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    - reference: str, SM variation.
+    Returns:
+    - stack: dict, "keys" [(process, selection, variation)], "variables", "edges" {variable: edges},
+      "columns" (bins per variable), "matrix" (R, M) and "scale" (R, M), the errors divided out.
+    """
+
+    variables = sorted(cubes)
+    common    = None
+
+    for variable in variables:
+        rows, refs = reference_rows(cubes[variable], reference)
+        keys       = {cubes[variable]["keys"][i] for i in rows}
+        common     = keys if common is None else common & keys
+
+    keys    = sorted(common, key=lambda key: (key[0], key[2], key[1]))
+    blocks  = []
+    scales  = []
+
+    for variable in variables:
+        cube       = cubes[variable]
+        rows, refs = reference_rows(cube, reference)
+        index      = {cube["keys"][i]: (i, j) for i, j in zip(rows, refs)}
+        pick       = np.array([index[key] for key in keys], dtype=int).reshape(-1, 2)
+        norm       = lumi * cube["rates"][:, None]
+        values     = cube["values"][:, 1:-1] * norm
+        variances  = cube["variances"][:, 1:-1] * norm ** 2
+
+        bsm, sm = values[pick[:, 0]], values[pick[:, 1]]
+        error   = np.sqrt(sm + variances[pick[:, 0]] + variances[pick[:, 1]])
+        filled  = sm > 0
+
+        blocks.append(np.where(filled, (bsm - sm) / np.where(filled, error, 1.0), 0.0))
+        scales.append(np.where(filled, error, 0.0))
+
+    return {"keys":      [(process, selection, variation) for process, variation, selection in keys],
+            "variables": variables,
+            "edges":     {variable: cubes[variable]["edges"] for variable in variables},
+            "columns":   [len(cubes[variable]["edges"]) - 1 for variable in variables],
+            "matrix":    np.concatenate(blocks, axis=1),
+            "scale":     np.concatenate(scales, axis=1)}
+
+# principal components
+def pca(matrix):
+
+    """
+    Computes the SVD basis of the deviation matrix. The rows are not centred: the SM (zero
+    deviation) is the origin, so the components describe the BSM effect itself.
+    Parameters:
+    - matrix: numpy array, output of deviation_matrix(), shape (R, M).
+    Returns:
+    - components: numpy array, orthonormal bin patterns, shape (k, M) with k = min(R, M).
+    - coefficients: numpy array, coordinates of every row, shape (R, k).
+    - explained: numpy array, cumulative fraction of the total chi2 of the first n components.
+    """
+
+    u, s, components = np.linalg.svd(matrix, full_matrices=False)
+    explained        = np.cumsum(s ** 2) / max((s ** 2).sum(), 1e-300)
+
+    return components, u * s, explained
+
+def n_components(explained, level):
+
+    """
+    Returns the number of components needed to explain a fraction of the total chi2.
+    Parameters:
+    - explained: numpy array, output of pca().
+    - level: float, fraction of the total chi2.
+    Returns:
+    - n: int, number of components.
+    """
+
+    return int(min(np.searchsorted(explained, level - 1e-12) + 1, len(explained)))
+
+def project(components, scale, deviation):
+
+    """
+    Projects deviations (BSM - SM in yields, bins of all variables side by side) onto the
+    components, e.g. the residuals of a fit, which reduces every bin sum to k terms.
+    Parameters:
+    - components: numpy array, shape (k, M).
+    - scale: numpy array, errors of the bins, shape (M,) or (R, M).
+    - deviation: numpy array, shape (..., M).
+    Returns:
+    - coefficients: numpy array, shape (..., k).
+    """
+
+    whitened = np.divide(deviation, scale, out=np.zeros(np.broadcast(deviation, scale).shape), where=scale > 0)
+
+    return whitened @ components.T
+
+def reconstruct(components, coefficients, scale):
+
+    """
+    Rebuilds the deviations in yields from their compressed coefficients.
+    Parameters:
+    - components: numpy array, shape (k, M).
+    - coefficients: numpy array, shape (R, k).
+    - scale: numpy array, errors of the bins, shape (R, M).
+    Returns:
+    - deviation: numpy array, shape (R, M).
+    """
+
+    return (coefficients @ components) * scale
+
+# exporting the compressed templates
+def save_templates(output_file, stack, components, coefficients, explained, n):
+
+    """
+    Writes the first n components and the coefficients of every deviation to a .npz.
+    Parameters:
+    - output_file: str, path of the .npz.
+    - stack: dict, output of deviation_matrix().
+    - components, coefficients, explained: output of pca().
+    - n: int, number of components kept.
+    """
+
+    np.savez_compressed(output_file,
+                        keys=np.array(stack["keys"], dtype=str).reshape(-1, 3),
+                        variables=np.array(stack["variables"]),
+                        columns=np.array(stack["columns"]),
+                        components=components[:n],
+                        coefficients=coefficients[:, :n],
+                        scale=stack["scale"],
+                        explained=explained,
+                        **{f"{variable}/edges": edges for variable, edges in stack["edges"].items()})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SVD/PCA basis of the deviations of all coupling variations, across bins and variables.")
+    parser.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    parser.add_argument("--lumi", type=float, default=None, help="luminosity [pb^-1], defaults to the one of the final stage")
+    parser.add_argument("--level", type=float, default=0.99, help="fraction of the total chi2 the exported components explain")
+    parser.add_argument("--output", default=None, help="write the compressed templates to this .npz")
+    args = parser.parse_args()
+
+    cubes, int_lumi = load_cubes(args.cubes)
+    stack           = deviation_matrix(cubes, args.lumi or int_lumi)
+    components, coefficients, explained = pca(stack["matrix"])
+
+    rows, columns = stack["matrix"].shape
+    print(f"{rows} deviations x {columns} bins ({len(stack['variables'])} variables)")
+    print(f"{'component':>9} {'chi2 fraction':>14} {'cumulative':>11}")
+    for i, fraction in enumerate(np.diff(np.concatenate([[0.0], explained]))):
+        print(f"{i + 1:>9} {fraction:>14.4f} {explained[i]:>11.4f}")
+        if explained[i] > 1 - 1e-6:
+            break
+
+    for level in explained_levels:
+        print(f"{n_components(explained, level)} components explain {level:.1%} of the BSM separation")
+
+    n = n_components(explained, args.level)
+
+    # separation kept per deviation with n components
+    total = (stack["matrix"] ** 2).sum(axis=1)
+    kept  = (coefficients[:, :n] ** 2).sum(axis=1)
+    print(f"\nchi2 kept with {n} components:")
+    for (process, selection, variation), full, part in zip(stack["keys"], total, kept):
+        print(f"  {process:<9} {selection:<9} {variation:<11} {part:>9.2f} / {full:>9.2f}")
+
+    if args.output:
+        save_templates(args.output, stack, components, coefficients, explained, n)
+        print(f"\n{n} components of {columns} bins written to {args.output}")
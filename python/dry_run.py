@@ -0,0 +1,263 @@
+# importing packages
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import uproot
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files
+from chunk_planner import sample_stats
+
+## HTCondor job flavours at CERN and their maximum wall time [s]
+job_flavours = {
+    "espresso":     20 * 60,
+    "microcentury": 60 * 60,
+    "longlunch":    2 * 3600,
+    "workday":      8 * 3600,
+    "tomorrow":     24 * 3600,
+    "testmatch":    3 * 24 * 3600,
+    "nextweek":     7 * 24 * 3600,
+}
+
+# safety margin applied to the predicted chunk wall time before choosing a queue
+queue_margin = 1.5
+
+# loading what the stage needs from ROOT
+def prepare_root(config_path, config):
+
+    """
+    Loads the FCCAnalyses library (if available) and declares the includePaths headers of a
+    stage configuration, as fccanalysis does before running it.
+    Parameters:
+    - config_path: str, path to the stage configuration.
+    - config: module, stage configuration.
+    Returns:
+    - ROOT: module, the initialised ROOT module.
+    """
+
+    import ROOT
+
+    ROOT.gROOT.SetBatch(True)
+
+    # Range() is not available with implicit multi-threading, and one thread gives the CPU time
+    ROOT.ROOT.DisableImplicitMT()
+
+    # entry limit of the dry-run graph, changed between its event loops
+    if not hasattr(ROOT, "topEWK_dry_run_entries"):
+        ROOT.gInterpreter.Declare("ULong64_t topEWK_dry_run_entries = 0;")
+
+    if ROOT.gSystem.Load("libFCCAnalyses") >= 0:
+        ROOT.gInterpreter.Declare("using namespace FCCAnalyses;")
+
+    for header in getattr(config, "includePaths", []):
+        path = os.path.join(os.path.dirname(os.path.abspath(config_path)), header)
+        if os.path.isfile(path):
+            ROOT.gInterpreter.Declare(f'#include "{path}"')
+
+    return ROOT
+
+# timing a sample
+def sample_graph(ROOT, config, input_file, n_events):
+
+    """
+    Books the stage on the first n_events of a file once, behind a filter on the entry number, so
+    that runs over fewer events reuse the same graph and its compiled code.
+    Parameters:
+    - ROOT: module, output of prepare_root().
+    - config: module, stage configuration.
+    - input_file: str, path to an input file of the sample.
+    - n_events: int, largest number of events a run of the graph processes.
+    Returns:
+    - df: RDataFrame node at the end of the stage.
+    - columns: list of str, output columns of the stage.
+    """
+
+    root = ROOT.RDataFrame("events", input_file).Range(n_events)
+    df   = config.RDFanalysis.analysers(root.Filter("rdfentry_ < topEWK_dry_run_entries", "dry run entries"))
+
+    return df, [column for column in config.RDFanalysis.output() if df.HasColumn(column)]
+
+def sample_events(ROOT, df, columns, output_file, n_events):
+
+    """
+    Runs a graph of sample_graph() on its first n_events events and snapshots the output.
+    Parameters:
+    - ROOT: module, output of prepare_root().
+    - df: RDataFrame node, output of sample_graph().
+    - columns: list of str, output columns of the stage.
+    - output_file: str, path of the snapshot.
+    - n_events: int, number of events to process.
+    Returns:
+    - seconds: float, wall time of the run, which includes booking and compiling its Snapshot action.
+    """
+
+    ROOT.gInterpreter.ProcessLine(f"topEWK_dry_run_entries = {n_events};")
+
+    start = time.perf_counter()
+    df.Snapshot("events", output_file, columns)
+
+    return time.perf_counter() - start
+
+def measure_sample(ROOT, config, input_file, n_events, warmup, work_dir):
+
+    """
+    Measures the processing time per event and the output bytes per branch of a sample. The graph
+    is booked once and a warm-up run compiles it. Every Snapshot call still books and compiles an
+    action of its own, so a short run of warmup events and a long run of n_events are timed, and
+    their difference, in which the per-run cost cancels, is divided by the extra events.
+    Parameters:
+    - ROOT: module, output of prepare_root().
+    - config: module, stage configuration.
+    - input_file: str, path to an input file of the sample.
+    - n_events: int, number of events of the long run.
+    - warmup: int, number of events of the warm-up and short runs.
+    - work_dir: str, directory for the snapshots.
+    Returns:
+    - measurement: dict, seconds per event and output bytes per input event, in total and per branch.
+    """
+
+    with uproot.open(input_file) as file:
+        n_events = min(n_events, file["events"].num_entries)
+
+    df, columns = sample_graph(ROOT, config, input_file, n_events)
+
+    sample_events(ROOT, df, columns, os.path.join(work_dir, "warmup.root"), warmup)
+    short = sample_events(ROOT, df, columns, os.path.join(work_dir, "short.root"), warmup)
+    long  = sample_events(ROOT, df, columns, os.path.join(work_dir, "timed.root"), n_events)
+
+    # files with no more events than the warm-up only give the time of the long run
+    if n_events > warmup:
+        seconds_per_event = max(long - short, 0.0) / (n_events - warmup)
+    else:
+        seconds_per_event = long / max(n_events, 1)
+
+    with uproot.open(os.path.join(work_dir, "timed.root")) as file:
+        tree     = file["events"]
+        branches = {name: tree[name].compressed_bytes / n_events for name in tree.keys(recursive=False)}
+        selected = tree.num_entries
+
+    return {
+        "seconds_per_event": seconds_per_event,
+        "bytes_per_event":   sum(branches.values()),
+        "branches":          branches,
+        "efficiency":        selected / n_events,
+    }
+
+# choosing the batch queue
+def suggest_queue(chunk_seconds):
+
+    """
+    Picks the shortest job flavour that fits the longest chunk with queue_margin to spare.
+    Parameters:
+    - chunk_seconds: float, predicted wall time of the longest chunk.
+    Returns:
+    - flavour: str, name of the job flavour (or 'too long' if none fits).
+    """
+
+    for flavour, limit in job_flavours.items():
+        if chunk_seconds * queue_margin <= limit:
+            return flavour
+
+    return "too long"
+
+# extrapolating to the whole production
+def estimate(config_path, input_dir, n_events, warmup):
+
+    """
+    Runs the dry run for every sample of a stage and extrapolates to the full production.
+    Parameters:
+    - config_path: str, path to the stage configuration.
+    - input_dir: str, stage input directory.
+    - n_events: int, events processed per sample.
+    - warmup: int, events of the warm-up and short timing runs.
+    Returns:
+    - rows: list of dict, one per sample with measurements and extrapolations.
+    """
+
+    config = load_config(config_path)
+    ROOT   = prepare_root(config_path, config)
+    stats  = sample_stats(input_dir, list(config.processList))
+    n_cpus = getattr(config, "nCPUS", 1)
+    rows   = []
+
+    for sample in config.processList:
+        files = sample_files(input_dir, sample)
+        if not files:
+            print(f"{sample}: no input file found, skipped")
+            continue
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            measurement = measure_sample(ROOT, config, files[0], n_events, warmup, work_dir)
+
+        events   = stats[sample]["events"]
+        chunks   = max(1, min(config.processList[sample].get("chunks", 1), stats[sample]["files"]))
+        cpu_time = events * measurement["seconds_per_event"]
+
+        rows.append({
+            "sample":         sample,
+            "events":         events,
+            "chunks":         chunks,
+            "cpu_hours":      cpu_time / 3600,
+            "wall_hours":     cpu_time / n_cpus / 3600,
+            "chunk_hours":    cpu_time / chunks / n_cpus / 3600,
+            "output_gb":      events * measurement["bytes_per_event"] / 1e9,
+            "queue":          suggest_queue(cpu_time / chunks / n_cpus),
+            **measurement,
+        })
+
+    return rows
+
+def print_estimate(rows, n_cpus):
+
+    """
+    Prints the per-sample estimate, the totals and the largest output branches.
+    Parameters:
+    - rows: list of dict, output of estimate().
+    - n_cpus: int, nCPUS of the stage.
+    """
+
+    print(f"{'sample':<70} {'events':>11} {'ms/evt':>7} {'eff':>5} {'CPU h':>7} {'wall h':>7} {'chunk h':>8} {'out GB':>7} {'queue':>12}")
+
+    for row in rows:
+        print(f"{row['sample']:<70} {row['events']:>11} {row['seconds_per_event'] * 1e3:>7.2f} {row['efficiency']:>5.2f} "
+              f"{row['cpu_hours']:>7.2f} {row['wall_hours']:>7.2f} {row['chunk_hours']:>8.2f} {row['output_gb']:>7.2f} {row['queue']:>12}")
+
+    print(f"\nTotal: {sum(row['cpu_hours'] for row in rows):.1f} CPU-hours, "
+          f"{sum(row['wall_hours'] for row in rows):.1f} h wall time at nCPUS={n_cpus}, "
+          f"{sum(row['output_gb'] for row in rows):.1f} GB of output")
+
+    # output size per branch over the whole production
+    branches = {}
+    for row in rows:
+        for name, per_event in row["branches"].items():
+            branches[name] = branches.get(name, 0.0) + per_event * row["events"]
+
+    print("\nLargest output branches:")
+    for name, size in sorted(branches.items(), key=lambda item: item[1], reverse=True)[:15]:
+        print(f"  {name:<30} {size / 1e9:>8.2f} GB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate CPU time, wall time and output size of a stage from a few events per sample.")
+    parser.add_argument("config", help="stage configuration, e.g. analysis/analysis_stage1.py")
+    parser.add_argument("--input-dir", default=None, help="input directory, defaults to inputDir of the configuration")
+    parser.add_argument("--events", type=int, default=1000, help="events processed per sample")
+    parser.add_argument("--warmup", type=int, default=10, help="events of the warm-up and short timing runs")
+    parser.add_argument("--timing", default=None, help="write seconds per event per sample to this JSON (for chunk_planner.py)")
+    args = parser.parse_args()
+
+    config    = load_config(args.config)
+    input_dir = args.input_dir or getattr(config, "inputDir", None)
+
+    if input_dir is None:
+        sys.exit(f"{args.config} has no inputDir, pass --input-dir")
+
+    rows = estimate(args.config, input_dir, args.events, args.warmup)
+    print_estimate(rows, getattr(config, "nCPUS", 1))
+
+    if args.timing:
+        with open(args.timing, "w") as f:
+            json.dump({row["sample"]: row["seconds_per_event"] for row in rows}, f, indent=2)
@@ -0,0 +1,242 @@
+# importing packages
+import os
+import sys
+import argparse
+import itertools
+import numpy as np
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sample_norm import couplings, xsec_variation
+from hist_cube import load_cubes
+
+# template order of a morphing model: SM, then up and down of every coupling
+def template_names(names):
+    return ['SM'] + [f'{name}{direction}' for name in names for direction in ['up', 'down']]
+
+# morphing weights
+def morphing_weights(points, names=None):
+
+    """
+    Computes the weight of every template at a set of coupling points. With the SM template at 0
+    and the up/down templates at +-c, the per-bin quadratic y(x) = SM + b x + q x^2 through the three
+    templates is SM * (1 - x^2/c^2) + up * (x/2c + x^2/2c^2) + down * (-x/2c + x^2/2c^2). The
+    couplings add up independently, as there are no samples with two couplings switched on.
+    Parameters:
+    - points: array, coupling values, shape (G, K) in the order of names.
+    - names: list of str, couplings (keys of sample_norm.couplings), all of them by default.
+    Returns:
+    - weights: numpy array, shape (G, 1 + 2K), in the order of template_names().
+    """
+
+    names  = names or list(couplings)
+    points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+    x      = points / np.array([couplings[name] for name in names])
+
+    up   = (x + x ** 2) / 2
+    down = (x ** 2 - x) / 2
+    sm   = 1 - (x ** 2).sum(axis=1, keepdims=True)
+
+    return np.concatenate([sm, np.stack([up, down], axis=2).reshape(len(points), -1)], axis=1)
+
+def xsec_morphing(points, names=None):
+
+    """
+    Predicts the total cross section relative to the SM at a set of coupling points from the
+    up/down factors of sample_norm.xsec_variation, with the same quadratic as the histograms.
+    Parameters:
+    - points: array, coupling values, shape (G, K).
+    - names: list of str, couplings, all of them by default.
+    Returns:
+    - ratios: numpy array, shape (G,).
+    """
+
+    names   = names or list(couplings)
+    factors = [1.0] + [xsec_variation[f'{name}{direction}_'] for name in names for direction in ['up', 'down']]
+
+    return morphing_weights(points, names) @ np.array(factors)
+
+# collecting the templates of a cube
+def build_model(cube, lumi, names=None):
+
+    """
+    Collects the SM, up and down templates of every (process, selection) of a cube, scaled to a
+    luminosity. Combinations missing a template are left out.
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    - names: list of str, couplings, all of them by default.
+    Returns:
+    - model: dict, "names", "keys" [(process, selection)], "templates" and "variances" (n, 1 + 2K, bins).
+    """
+
+    names   = names or list(couplings)
+    wanted  = template_names(names)
+    index   = {key: i for i, key in enumerate(cube["keys"])}
+    norm    = lumi * cube["rates"][:, None]
+    values  = cube["values"][:, 1:-1] * norm
+    errors  = cube["variances"][:, 1:-1] * norm ** 2
+    pairs   = sorted({(process, selection) for process, variation, selection in cube["keys"]})
+    keys    = []
+    rows    = []
+
+    for process, selection in pairs:
+        row = [index.get((process, variation, selection)) for variation in wanted]
+
+        if None in row:
+            missing = [variation for variation, i in zip(wanted, row) if i is None]
+            print(f"Warning: {process} {selection} has no {', '.join(missing)} template, left out of the morphing")
+            continue
+
+        keys.append((process, selection))
+        rows.append(row)
+
+    rows = np.array(rows, dtype=int).reshape(len(rows), len(wanted))
+
+    return {"names": names, "keys": keys, "edges": cube["edges"],
+            "templates": values[rows], "variances": errors[rows]}
+
+def coefficients(model):
+
+    """
+    Returns the per-bin polynomial of a model, y(x) = a + sum_k (b_k x_k + q_k x_k^2).
+    Parameters:
+    - model: dict, output of build_model().
+    Returns:
+    - a: numpy array, shape (n, bins).
+    - b: numpy array, linear coefficients, shape (n, K, bins).
+    - q: numpy array, quadratic coefficients, shape (n, K, bins).
+    """
+
+    c    = np.array([couplings[name] for name in model["names"]])[None, :, None]
+    sm   = model["templates"][:, :1]
+    up   = model["templates"][:, 1::2]
+    down = model["templates"][:, 2::2]
+
+    return sm[:, 0], (up - down) / (2 * c), (up + down - 2 * sm) / (2 * c ** 2)
+
+# checking the morphing on samples it was not built from
+def closure(model, cube, lumi, variation, point):
+
+    """
+    Compares the morphing at a held-out coupling point with the histograms of a sample generated
+    there, bin by bin. The SM/up/down templates are reproduced exactly by construction, so only a
+    variation that is not one of them tests the quadratic dependence on the couplings.
+    Parameters:
+    - model: dict, output of build_model().
+    - cube: dict, the cube the model was built from, holding the held-out variation.
+    - lumi: float, integrated luminosity [pb^-1].
+    - variation: str, variation of the held-out sample, as in the cube keys.
+    - point: array, coupling values of the sample, in the order of model["names"].
+    Returns:
+    - rows: list of (process, selection, chi2, ndf), one per template set with the held-out sample.
+    """
+
+    if variation in template_names(model["names"]):
+        raise ValueError(f"{variation} is a template of the morphing, its closure holds by construction")
+
+    index = {key: i for i, key in enumerate(cube["keys"])}
+    norm  = lumi * cube["rates"][:, None]
+    rows  = []
+
+    predicted, predicted_variances = predict(model, [point])
+
+    for n, (process, selection) in enumerate(model["keys"]):
+        i = index.get((process, variation, selection))
+        if i is None:
+            continue
+
+        actual   = cube["values"][i, 1:-1] * norm[i]
+        variance = cube["variances"][i, 1:-1] * norm[i] ** 2 + predicted_variances[0, n]
+        filled   = variance > 0
+        chi2     = ((predicted[0, n] - actual)[filled] ** 2 / variance[filled]).sum()
+        rows.append((process, selection, chi2, int(filled.sum())))
+
+    return rows
+
+# predicting histograms
+def predict(model, points):
+
+    """
+    Predicts the histograms of every (process, selection) of a model at a set of coupling points,
+    as one contraction of the template weights with the templates.
+    Parameters:
+    - model: dict, output of build_model().
+    - points: array, coupling values, shape (G, K) in the order of model["names"].
+    Returns:
+    - values: numpy array, shape (G, n, bins).
+    - variances: numpy array, shape (G, n, bins), from the statistical errors of the templates.
+    """
+
+    weights = morphing_weights(points, model["names"])
+
+    return (np.einsum('gt,ntb->gnb', weights, model["templates"]),
+            np.einsum('gt,ntb->gnb', weights ** 2, model["variances"]))
+
+def grid(ranges):
+
+    """
+    Builds a regular grid of coupling points.
+    Parameters:
+    - ranges: list of (min, max, n), one per coupling.
+    Returns:
+    - points: numpy array, shape (prod(n), K).
+    """
+
+    axes = [np.linspace(low, high, int(n)) for low, high, n in ranges]
+
+    return np.array(list(itertools.product(*axes)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Morph the SM/up/down templates to any point of the ta_ttA, tv_ttA, vr_ttZ couplings.")
+    parser.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    parser.add_argument("--coupling", action="append", default=[], metavar="NAME=MIN:MAX:N",
+                        help="coupling range of the grid, repeat for a multi-dimensional grid (default: each coupling from -c to +c)")
+    parser.add_argument("--lumi", type=float, default=None, help="luminosity [pb^-1], defaults to the one of the final stage")
+    parser.add_argument("--output", default=None, help="write the predicted histograms of the grid to this .npz")
+    parser.add_argument("--closure", action="append", default=[], metavar="VARIATION=NAME:VALUE[,NAME:VALUE]",
+                        help="held-out sample in the cubes and its coupling point, compared with the morphing (repeatable)")
+    args = parser.parse_args()
+
+    cubes, int_lumi = load_cubes(args.cubes)
+    lumi            = args.lumi or int_lumi
+
+    ranges = {}
+    for option in args.coupling:
+        name, values = option.split("=")
+        low, high, n = values.split(":")
+        ranges[name] = (float(low), float(high), int(n))
+
+    names  = list(ranges) or list(couplings)
+    points = grid([ranges.get(name, (-couplings[name], couplings[name], 3)) for name in names])
+
+    held_out = {}
+    for option in args.closure:
+        variation, values = option.split("=")
+        point = np.zeros(len(names))
+        for value in values.split(","):
+            name, value = value.split(":")
+            point[names.index(name)] = float(value)
+        held_out[variation] = point
+
+    predictions = {}
+    keys        = {}
+    for variable, cube in cubes.items():
+        model = build_model(cube, lumi, names)
+        predictions[variable] = predict(model, points)
+        keys[variable]        = np.array(model["keys"], dtype=str).reshape(-1, 2)
+        print(f"{variable}: {len(model['keys'])} templates morphed to {len(points)} points")
+
+        # closure on the held-out samples, the only points not reproduced by construction
+        for variation, point in held_out.items():
+            for process, selection, chi2, ndf in closure(model, cube, lumi, variation, point):
+                print(f"  closure {variation} {process} {selection}: chi2/ndf = {chi2:.1f}/{ndf}")
+
+    if not held_out:
+        print("No held-out samples given (--closure), the morphing is exact at its templates and was not checked")
+
+    if args.output:
+        np.savez_compressed(args.output, points=points, names=np.array(names),
+                            **{f"{variable}/keys": keys[variable] for variable in keys},
+                            **{f"{variable}/values": values for variable, (values, variances) in predictions.items()},
+                            **{f"{variable}/variances": variances for variable, (values, variances) in predictions.items()})
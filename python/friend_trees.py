@@ -0,0 +1,241 @@
+# importing packages
+import os
+import sys
+import argparse
+import fnmatch
+import uproot
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, config_columns, sample_files
+from output_profiles import copy_metadata
+
+# generator-level columns written by stage1, everything else is reco-level
+gen_patterns = ["gen*", "n_gen*"]
+
+# sub-directories of the stage1 outputDir holding the two halves of a split output
+reco_subdir = "reco"
+gen_subdir  = "gen"
+
+# telling gen-level columns apart from reco-level ones
+def is_gen_column(column):
+
+    """
+    Checks whether a column is generator-level truth.
+    Parameters:
+    - column: str, column name.
+    Returns:
+    - is_gen: bool, True if the column matches one of gen_patterns.
+    """
+
+    return any(fnmatch.fnmatchcase(column, pattern) for pattern in gen_patterns)
+
+def split_branch_list(columns):
+
+    """
+    Splits a branch list into its gen-level and reco-level parts.
+    Parameters:
+    - columns: list of str, branch list (e.g. RDFanalysis.output() of stage1).
+    Returns:
+    - gen: list of str, gen-level columns.
+    - reco: list of str, reco-level columns.
+    """
+
+    gen  = [column for column in columns if is_gen_column(column)]
+    reco = [column for column in columns if not is_gen_column(column)]
+
+    return gen, reco
+
+# splitting one stage1 output into a reco tree and a gen friend tree
+def split_output(input_file, reco_file, gen_file, tree_name="events"):
+
+    """
+    Writes the reco-level and gen-level columns of a stage1 output into two files in a single
+    event loop. Entries stay aligned, so the gen file can be attached as a friend of the reco one.
+    Parameters:
+    - input_file: str, path to the stage1 output.
+    - reco_file: str, path of the reco-level output.
+    - gen_file: str, path of the gen-level output.
+    - tree_name: str, name of the tree in all three files.
+    Returns:
+    - entries: int, number of entries written to each file.
+    """
+
+    import ROOT
+
+    df      = ROOT.RDataFrame(tree_name, input_file)
+    columns = [str(column) for column in df.GetColumnNames() if "rdf_sizeof_" not in str(column)]
+    gen, reco = split_branch_list(columns)
+
+    for path in (reco_file, gen_file):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # both snapshots are lazy so they share the event loop triggered by the count
+    options = ROOT.RDF.RSnapshotOptions()
+    options.fLazy = True
+
+    entries = df.Count()
+    df.Snapshot(tree_name, reco_file, reco, options)
+    df.Snapshot(tree_name, gen_file, gen, options)
+    entries = entries.GetValue()
+
+    # the reco file is the one later stages read their bookkeeping from
+    copy_metadata(input_file, reco_file, tree_name)
+
+    return entries
+
+# checking a split before the combined output is removed
+def validate_split(input_file, reco_file, gen_file, tree_name="events"):
+
+    """
+    Checks that the two halves of a split output have the entries of the combined output and
+    together hold all of its branches, each branch in exactly one of them.
+    Parameters:
+    - input_file: str, path to the combined stage1 output.
+    - reco_file: str, path of the reco-level output.
+    - gen_file: str, path of the gen-level output.
+    - tree_name: str, name of the tree in all three files.
+    Returns:
+    - problems: list of str, empty if the combined output can be removed.
+    """
+
+    branches, entries = {}, {}
+
+    for label, path in (("combined", input_file), ("reco", reco_file), ("gen", gen_file)):
+        with uproot.open(path) as file:
+            tree = file[tree_name]
+            entries[label]  = tree.num_entries
+            branches[label] = {name for name in tree.keys(recursive=False) if "rdf_sizeof_" not in name}
+
+    problems = [f"{label} has {entries[label]} entries, the combined output {entries['combined']}"
+                for label in ("reco", "gen") if entries[label] != entries["combined"]]
+
+    missing = branches["combined"] - branches["reco"] - branches["gen"]
+    if missing:
+        problems.append(f"branches in neither half: {', '.join(sorted(missing))}")
+
+    twice = branches["reco"] & branches["gen"]
+    if twice:
+        problems.append(f"branches in both halves: {', '.join(sorted(twice))}")
+
+    return problems
+
+def split_outputs(config, keep_original=False):
+
+    """
+    Splits every stage1 output in outputDir into outputDir/reco and outputDir/gen, keeping the
+    <sample>.root or <sample>/chunk<i>.root layout. The combined file is only removed once
+    validate_split() has found no problem with its split.
+    Parameters:
+    - config: module, stage1 configuration.
+    - keep_original: bool, never remove the combined files.
+    Returns:
+    - failed: list of str, combined outputs whose split did not validate (and were kept).
+    """
+
+    output_dir = config.outputDir
+    failed     = []
+
+    for sample in config.processList:
+        for path in sample_files(output_dir, sample):
+            relative  = os.path.relpath(path, output_dir)
+            reco_file = os.path.join(output_dir, reco_subdir, relative)
+            gen_file  = os.path.join(output_dir, gen_subdir, relative)
+            entries   = split_output(path, reco_file, gen_file)
+            problems  = validate_split(path, reco_file, gen_file)
+
+            if problems:
+                failed.append(path)
+                print(f"Split of {relative} did not validate, combined output kept:")
+                for problem in problems:
+                    print(f"  - {problem}")
+                continue
+
+            if not keep_original:
+                os.remove(path)
+
+            print(f"Split {relative} ({entries} entries) into {reco_subdir}/ and {gen_subdir}/")
+
+    return failed
+
+# deciding whether a later stage needs the gen friend
+def needs_gen(config):
+
+    """
+    Checks whether a stage2 or final configuration references any gen-level column.
+    Parameters:
+    - config: module, stage configuration.
+    Returns:
+    - needs_gen: bool, True if the gen friend has to be attached.
+    """
+
+    required, _ = config_columns(config)
+
+    return any(is_gen_column(column) for column in required)
+
+def friend_file(reco_file):
+
+    """
+    Returns the gen-level file aligned with a reco-level file of a split stage1 output.
+    Parameters:
+    - reco_file: str, path inside outputDir/reco.
+    Returns:
+    - gen_file: str, matching path inside outputDir/gen.
+    """
+
+    reco_file = os.path.abspath(reco_file)
+    parts     = reco_file.split(os.sep)
+    index     = len(parts) - 1 - parts[::-1].index(reco_subdir)
+    parts[index] = gen_subdir
+
+    return os.sep.join(parts)
+
+# opening stage inputs with the gen friend attached only when needed
+def open_stage_input(config, files, tree_name="events"):
+
+    """
+    Builds an RDataFrame over reco-level input files, attaching the aligned gen-level files as a
+    friend chain only if the configuration references gen columns. fccanalysis opens the inputs of
+    a stage itself, so this is not applied automatically: scripts that build their own dataframe
+    over a split output call it, a stage run with fccanalysis only sees the reco files.
+    Parameters:
+    - config: module, stage configuration reading the files.
+    - files: list of str, reco-level input files.
+    - tree_name: str, name of the tree.
+    Returns:
+    - df: ROOT.RDataFrame over the inputs.
+    - chains: list of ROOT.TChain, to be kept alive as long as df is used.
+    """
+
+    import ROOT
+
+    chain = ROOT.TChain(tree_name)
+    for path in files:
+        chain.Add(path)
+
+    chains = [chain]
+
+    if needs_gen(config):
+        friend = ROOT.TChain(tree_name)
+        for path in files:
+            friend.Add(friend_file(path))
+
+        # no alias: the gen columns keep their own names
+        chain.AddFriend(friend, "")
+        chains.append(friend)
+
+    return ROOT.RDataFrame(chain), chains
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the stage1 outputs into reco-level files and gen-level friend files.")
+    parser.add_argument("config", help="stage1 configuration")
+    parser.add_argument("--keep-original", action="store_true", help="keep the combined outputs after a validated split")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+
+    if not getattr(config, "splitGenReco", False):
+        sys.exit(f"splitGenReco is not set in {args.config}, outputs left as they are")
+
+    if split_outputs(config, args.keep_original):
+        sys.exit(1)
@@ -0,0 +1,358 @@
+# importing packages
+import os
+import sys
+import json
+import numpy as np
+import uproot
+from uproot.writing.identify import to_TH1x, to_TAxis
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sample_norm import N_expect, xsec_variation, sample_name, parse_sample
+
+# variation names used in the histogram file names
+def variation_key(variation):
+
+    """
+    Converts a variation as written in the file names ('SM', 'ta_ttAup', ...) to the key used in
+    sample_norm.xsec_variation ('', 'ta_ttAup_', ...).
+    Parameters:
+    - variation: str, variation from the file name.
+    Returns:
+    - key: str, key of sample_norm.xsec_variation.
+    """
+
+    return '' if variation == 'SM' else variation + '_'
+
+# normalization of every sample
+def norm_table(proc_dict, int_lumi):
+
+    """
+    Builds the normalization factor crossSection * intLumi / sumOfWeights of every ttbar sample once.
+    Samples missing from procDictAdd (the BSM variations, unless it was generated by
+    metadata_scan.py or the variations were filled by weighted_final.py, whose entries carry the
+    mean weight ratio) take the entry of their SM sample with the cross section scaled by
+    sample_norm.xsec_variation.
+    Parameters:
+    - proc_dict: dict, procDictAdd of the final stage.
+    - int_lumi: float, integrated luminosity [pb^-1].
+    Returns:
+    - table: dict, {sample: normalization factor}.
+    """
+
+    table = {}
+
+    for sample in N_expect:
+        if sample in proc_dict:
+            entry = proc_dict[sample]
+            table[sample] = entry['crossSection'] * int_lumi / entry['sumOfWeights']
+            continue
+
+        process, variation = parse_sample(sample)
+        entry = proc_dict[sample_name(process, '')]
+        table[sample] = entry['crossSection'] * xsec_variation[variation] * int_lumi / entry['sumOfWeights']
+
+    return table
+
+# reading histograms into one array per variable
+def build_cubes(root_files, labels):
+
+    """
+    Reads every TH1 of a list of files into one cube per variable: the contents and squared errors
+    of all (process, variation, selection) combinations stacked in 2D arrays, including the
+    underflow and overflow bins.
+    Parameters:
+    - root_files: list of str, paths to the .root files.
+    - labels: function, returns (process, variation, selection) for a file path.
+    Returns:
+    - cubes: dict, {variable: {"keys", "samples", "title", "edges", "values", "variances", "entries"}}.
+    """
+
+    rows = {}
+
+    for root_file in root_files:
+        process, variation, selection = labels(root_file)
+
+        with uproot.open(root_file) as file:
+            for name, classname in file.classnames(recursive=False).items():
+                if not classname.startswith('TH1'):
+                    continue
+
+                hist     = file[name]
+                variable = hist.member('fName')
+                cube     = rows.setdefault(variable, {"keys": [], "samples": [], "title": hist.member('fTitle'),
+                                                      "edges": hist.axes[0].edges(), "values": [],
+                                                      "variances": [], "entries": []})
+
+                cube["keys"].append((process, variation, selection))
+                cube["samples"].append(sample_name(process, variation_key(variation)))
+                cube["values"].append(hist.values(flow=True))
+                cube["variances"].append(hist.variances(flow=True))
+                cube["entries"].append(hist.member('fEntries'))
+
+    for cube in rows.values():
+        for array in ["values", "variances", "entries"]:
+            cube[array] = np.array(cube[array], dtype=np.float64)
+
+    return rows
+
+# applying the normalization
+def unit_factors(cube):
+
+    """
+    Computes GetEntries()/Integral() of every histogram of a cube, the factor that undoes the
+    scaling of the final stage (doScale) and leaves unit-weight event counts (weighted counts for
+    weighted_final.py, which sets the entries to the sum of weights).
+    Parameters:
+    - cube: dict, one cube of build_cubes().
+    Returns:
+    - factors: numpy array, one factor per histogram, zero for histograms with a zero integral.
+    - nonzero: numpy array of bool, False for histograms with a zero integral.
+    """
+
+    integrals = cube["values"][:, 1:-1].sum(axis=1)
+    nonzero   = integrals != 0
+
+    return np.divide(cube["entries"], integrals, out=np.zeros_like(integrals), where=nonzero), nonzero
+
+def scale(cube, factors):
+
+    """
+    Multiplies every histogram of a cube by its factor, squaring the factors for the errors.
+    Parameters:
+    - cube: dict, one cube of build_cubes() (updated in place).
+    - factors: numpy array, one factor per histogram.
+    """
+
+    cube["values"]    *= factors[:, None]
+    cube["variances"] *= factors[:, None] ** 2
+
+def normalize(cube, table):
+
+    """
+    Rescales every histogram of a cube to GetEntries()/Integral() * crossSection * intLumi / sumOfWeights
+    in one broadcast multiply. Histograms with a zero integral cannot be rescaled; they are set to
+    zero and returned so that the caller can report them.
+    Parameters:
+    - cube: dict, one cube of build_cubes() (updated in place).
+    - table: dict, output of norm_table().
+    Returns:
+    - empty: list of tuple, keys of the histograms with a zero integral.
+    """
+
+    factors, nonzero = unit_factors(cube)
+    scale(cube, factors * np.array([table[sample] for sample in cube["samples"]]))
+
+    return [key for key, ok in zip(cube["keys"], nonzero) if not ok]
+
+# subtracting the SM histograms
+def reference_rows(cube, reference='SM'):
+
+    """
+    Pairs every histogram of a cube with the histogram of the reference variation that has the
+    same process and selection.
+    Parameters:
+    - cube: dict, one cube of build_cubes().
+    - reference: str, reference variation.
+    Returns:
+    - rows: list of int, indices of the non-reference histograms that have a reference.
+    - refs: list of int, index of the reference histogram of each row.
+    """
+
+    index = {(process, selection): i for i, (process, variation, selection) in enumerate(cube["keys"]) if variation == reference}
+    rows  = [i for i, (process, variation, selection) in enumerate(cube["keys"])
+             if variation != reference and (process, selection) in index]
+    refs  = [index[(cube["keys"][i][0], cube["keys"][i][2])] for i in rows]
+
+    return rows, refs
+
+def deviations(cube, reference='SM'):
+
+    """
+    Subtracts from every histogram the histogram of the reference variation with the same process
+    and selection, as TH1::Add(sm, -1) does.
+    Parameters:
+    - cube: dict, one cube of build_cubes().
+    - reference: str, variation subtracted from the others.
+    Returns:
+    - deviation: dict, cube of the differences, without the reference histograms.
+    """
+
+    rows, refs = reference_rows(cube, reference)
+
+    return {"keys":      [cube["keys"][i] for i in rows],
+            "samples":   [cube["samples"][i] for i in rows],
+            "title":     cube["title"],
+            "edges":     cube["edges"],
+            "values":    cube["values"][rows] - cube["values"][refs],
+            "variances": cube["variances"][rows] + cube["variances"][refs],
+            "entries":   np.abs(cube["entries"][rows] - cube["entries"][refs])}
+
+# exact rebinning
+def edge_indices(old_edges, new_edges):
+
+    """
+    Finds the position of every new bin edge among the old ones. Rebinning is exact only if every
+    new edge is an old edge, so other edges are rejected.
+    Parameters:
+    - old_edges: numpy array, original bin edges.
+    - new_edges: numpy array, wanted bin edges (increasing, any widths).
+    Returns:
+    - indices: numpy array, index of every new edge in old_edges.
+    """
+
+    old_edges = np.asarray(old_edges, dtype=np.float64)
+    new_edges = np.asarray(new_edges, dtype=np.float64)
+    indices   = np.clip(np.searchsorted(old_edges, new_edges), 0, len(old_edges) - 1)
+    tolerance = 1e-9 * max(1.0, np.abs(old_edges).max())
+
+    if len(new_edges) < 2 or np.any(np.diff(new_edges) <= 0):
+        raise ValueError("new bin edges must be increasing")
+    if np.any(np.abs(old_edges[indices] - new_edges) > tolerance):
+        outside = new_edges[np.abs(old_edges[indices] - new_edges) > tolerance]
+        raise ValueError(f"new bin edges {outside} are not edges of the histogram, the rebinning would not be exact")
+
+    return indices
+
+def rebin_values(values, old_edges, new_edges, flow=True):
+
+    """
+    Sums the bins of one or many histograms into new bins, with one np.add.reduceat along the last
+    axis. Contents (or sumw2) are conserved: with flow bins, everything below or above the new range
+    goes into the new underflow or overflow bin.
+    Parameters:
+    - values: numpy array, contents or sumw2, bins on the last axis (shape (..., bins + 2) with flow).
+    - old_edges: numpy array, original bin edges.
+    - new_edges: numpy array, wanted bin edges, each one an original edge.
+    - flow: bool, whether values include the underflow and overflow bins (without them, contents
+      outside the new range are dropped).
+    Returns:
+    - rebinned: numpy array, shape (..., new bins + 2) with flow, (..., new bins) without.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+
+    if not flow:
+        padding = [(0, 0)] * (values.ndim - 1) + [(1, 1)]
+        return rebin_values(np.pad(values, padding), old_edges, new_edges)[..., 1:-1]
+
+    # segment k starts at column index + 1 of its lower edge, the first one is the underflow
+    starts = np.concatenate([[0], edge_indices(old_edges, new_edges) + 1])
+
+    return np.add.reduceat(values, starts, axis=-1)
+
+def rebin_cube(cube, new_edges):
+
+    """
+    Rebins every histogram of a cube at once, conserving contents and sumw2.
+    Parameters:
+    - cube: dict, cube of build_cubes(), deviations() or load_cubes().
+    - new_edges: numpy array, wanted bin edges, each one an edge of the cube.
+    Returns:
+    - cube: dict, a new cube with the new edges.
+    """
+
+    rebinned = dict(cube)
+    rebinned["edges"]     = np.asarray(new_edges, dtype=np.float64)
+    rebinned["values"]    = rebin_values(cube["values"], cube["edges"], new_edges)
+    rebinned["variances"] = rebin_values(cube["variances"], cube["edges"], new_edges)
+
+    return rebinned
+
+# writing histograms
+def write_th1(output_file, name, title, edges, values, variances, entries):
+
+    """
+    Writes a histogram as a TH1D with its errors, entries and statistics; variable-width bins are
+    written as such.
+    Parameters:
+    - output_file: str, path of the .root file (overwritten).
+    - name: str, name of the histogram in the file.
+    - title: str, title of the histogram.
+    - edges: numpy array, bin edges.
+    - values: numpy array, contents including the underflow and overflow bins.
+    - variances: numpy array, sumw2 including the underflow and overflow bins.
+    - entries: float, number of entries.
+    """
+
+    edges   = np.asarray(edges, dtype=np.float64)
+    centers = (edges[1:] + edges[:-1]) / 2
+    uniform = np.allclose(np.diff(edges), edges[1] - edges[0])
+
+    axis = to_TAxis("xaxis", "", len(edges) - 1, edges[0], edges[-1],
+                    fXbins=np.array([]) if uniform else edges)
+
+    hist = to_TH1x(name, title, values, entries,
+                   values[1:-1].sum(), variances[1:-1].sum(),
+                   (values[1:-1] * centers).sum(), (values[1:-1] * centers ** 2).sum(),
+                   variances, axis)
+
+    with uproot.recreate(output_file) as file:
+        file[name] = hist
+
+def write_histogram(output_file, name, cube, i):
+
+    """
+    Writes histogram i of a cube as a TH1D, see write_th1().
+    Parameters:
+    - output_file: str, path of the .root file (overwritten).
+    - name: str, name of the histogram in the file.
+    - cube: dict, cube of build_cubes() or deviations().
+    - i: int, index of the histogram in the cube.
+    """
+
+    write_th1(output_file, name, cube["title"], cube["edges"], cube["values"][i], cube["variances"][i], cube["entries"][i])
+
+# storing cubes between steps
+def save_cubes(output_file, cubes, proc_dict, int_lumi):
+
+    """
+    Stores cubes rescaled to unit-weight counts, GetEntries()/Integral(), together with the events
+    per pb^-1 of every sample, so that yields can be computed for any luminosity or cross section
+    without re-running the final stage. The cubes themselves are not modified.
+    Parameters:
+    - output_file: str, path of the .npz file.
+    - cubes: dict, output of build_cubes().
+    - proc_dict: dict, procDictAdd of the final stage.
+    - int_lumi: float, integrated luminosity of the final stage [pb^-1].
+    """
+
+    rates  = norm_table(proc_dict, 1.0)
+    arrays = {}
+    meta   = {"intLumi": int_lumi, "variables": {}}
+
+    for variable, cube in cubes.items():
+        meta["variables"][variable] = {"keys": cube["keys"], "samples": cube["samples"], "title": cube["title"]}
+
+        arrays[f"{variable}/edges"]     = cube["edges"]
+        factors = unit_factors(cube)[0][:, None]
+
+        arrays[f"{variable}/values"]    = cube["values"] * factors
+        arrays[f"{variable}/variances"] = cube["variances"] * factors ** 2
+        arrays[f"{variable}/entries"]   = cube["entries"]
+        arrays[f"{variable}/rates"]     = np.array([rates[sample] for sample in cube["samples"]])
+
+    np.savez_compressed(output_file, meta=json.dumps(meta), **arrays)
+
+def load_cubes(input_file):
+
+    """
+    Loads the cubes stored by save_cubes().
+    Parameters:
+    - input_file: str, path of the .npz file.
+    Returns:
+    - cubes: dict, {variable: cube}, in unit-weight counts, each with "rates", the events per pb^-1 and per count.
+    - int_lumi: float, integrated luminosity of the final stage [pb^-1].
+    """
+
+    with np.load(input_file) as data:
+        meta  = json.loads(str(data["meta"]))
+        cubes = {}
+
+        for variable, info in meta["variables"].items():
+            cubes[variable] = {"keys":    [tuple(key) for key in info["keys"]],
+                               "samples": info["samples"],
+                               "title":   info["title"],
+                               **{array: data[f"{variable}/{array}"] for array in ["edges", "values", "variances", "entries", "rates"]}}
+
+    return cubes, meta["intLumi"]
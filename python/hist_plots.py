@@ -3,8 +3,12 @@ import uproot
 import matplotlib.pyplot as plt
 import numpy as np
 import glob
-import ROOT
 import os
+import sys
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from hist_cube import rebin_values, write_th1
 
 # glob all .root hist files
 root_files = glob.glob('/ceph/salshamaily/topEWK_FCCee/analysis/final_output/*.root')
@@ -12,41 +16,42 @@ root_files = glob.glob('/ceph/salshamaily/topEWK_FCCee/analysis/final_output/*.r
 # output directory where ROOT histograms will be saved
 output_dir = "/ceph/salshamaily/topEWK_FCCee/root_hists/bsm_sm_samples"
 
+# bin edges of the plots and saved histograms, each one an edge of the input histograms (None keeps their binning)
+plot_bins = None
+
+# x-axis range of the plots
+plot_range = (10, 140)
+
 # saving histogram as ROOT file
-def save_histogram_as_root(histogram_name, bin_edges, hist_values, output_dir, classification, variation, selection):
+def save_histogram_as_root(histogram_name, bin_edges, hist_values, output_dir, classification, variation, selection, hist_variances=None):
 
     """
     Save a histogram as a ROOT histogram.
 
     Parameters:
     - histogram_name: str, name of the histogram.
-    - bin_edges: numpy array, array of bin edges from the histogram.
+    - bin_edges: numpy array, array of bin edges from the histogram (variable widths are kept).
     - hist_values: numpy array, array of histogram values.
     - output_dir: str, directory where the ROOT file will be saved.
     - classification: str, the process to be plotted (to include in the file name).
     - variation: str, the BSM variation being plotted (to include in the file name).
     - selection: str, either 'nosel' or 'testsel' (to include in the file name).
+    - hist_variances: numpy array, sumw2 of the bins, the values themselves (Poisson errors) if None.
     """
     
     # make sure directory exists to begin with
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # creating ROOT histogram object
-    num_bins = len(bin_edges) - 1
-    root_hist = ROOT.TH1F(histogram_name, histogram_name, num_bins, bin_edges)
-
-    # filling histogram with values
-    for i in range(num_bins):
-        root_hist.SetBinContent(i + 1, hist_values[i])
+    # empty underflow and overflow bins around the values
+    values    = np.pad(np.asarray(hist_values, dtype=np.float64), 1)
+    variances = values if hist_variances is None else np.pad(np.asarray(hist_variances, dtype=np.float64), 1)
 
     # output ROOT file path
     output_file = os.path.join(output_dir, f"{histogram_name}_{classification}_{variation}_{selection}.root")
 
-    # Open a ROOT file to write the histogram
-    root_file = ROOT.TFile(output_file, "RECREATE")  # "RECREATE" to overwrite an existing file
-    root_hist.Write()
-    root_file.Close()
+    # writing the histogram with its bin edges and errors
+    write_th1(output_file, histogram_name, histogram_name, bin_edges, values, variances, values.sum())
 
     print(f"Histogram {histogram_name} saved to {output_file}\n")
 
@@ -219,18 +224,25 @@ def plot_stacked_histogram(histogram_name, semilep_histograms, fullhad_histogram
     - selection: str, either 'NoSel' or 'TestSel'.
     """
 
+    # exact rebinning onto plot_bins, every bin contributes once through its own left edge
+    edges   = semilep_histograms[0][0] if plot_bins is None else np.asarray(plot_bins)
+    semilep = rebin_values(semilep_histograms[0][1], semilep_histograms[0][0], edges, flow=False)
+    fullhad = rebin_values(fullhad_histograms[0][1], fullhad_histograms[0][0], edges, flow=False)
+    fulllep = rebin_values(fulllep_histograms[0][1], fulllep_histograms[0][0], edges, flow=False)
+
     plt.figure(figsize=(8, 6))
     
     # stacking histograms
-    plt.hist([semilep_histograms[0][0][:-1],fullhad_histograms[0][0][:-1],fulllep_histograms[0][0][:-1]],
-    weights=[semilep_histograms[0][1],fullhad_histograms[0][1],fulllep_histograms[0][1]],
-    stacked=True,bins=np.linspace(10,140,20),label=["Semi-leptonic","Fully hadronic","Fully leptonic"],
+    plt.hist([edges[:-1],edges[:-1],edges[:-1]],
+    weights=[semilep,fullhad,fulllep],
+    stacked=True,bins=edges,label=["Semi-leptonic","Fully hadronic","Fully leptonic"],
     color=['silver','lightgreen','cornflowerblue'], edgecolor='black')
 
     xlabel = determine_xlabel(histogram_name)
     
     plt.xlabel(xlabel)
     plt.ylabel('Events')
+    plt.xlim(*plot_range)
     plt.ylim(1, None)
     plt.yscale('log')
     plt.title(f'{histogram_name} ({variation}) ({selection})')
@@ -246,20 +258,21 @@ def plot_stacked_histogram(histogram_name, semilep_histograms, fullhad_histogram
     # overlaying histograms
     plt.figure(figsize=(8, 6))
     
-    plt.hist(semilep_histograms[0][0][:-1], weights=semilep_histograms[0][1],
-    bins=np.linspace(10, 140, 20), histtype='stepfilled', label="Semi-leptonic",
+    plt.hist(edges[:-1], weights=semilep,
+    bins=edges, histtype='stepfilled', label="Semi-leptonic",
     color='silver', linewidth=2, alpha=0.7)
     
-    plt.hist(fulllep_histograms[0][0][:-1], weights=fulllep_histograms[0][1],
-    bins=np.linspace(10, 140, 20), histtype='stepfilled', label="Fully leptonic",
+    plt.hist(edges[:-1], weights=fulllep,
+    bins=edges, histtype='stepfilled', label="Fully leptonic",
     color='cornflowerblue', linewidth=2, alpha=0.5)
     
-    plt.hist(fullhad_histograms[0][0][:-1], weights=fullhad_histograms[0][1],
-    bins=np.linspace(10, 140, 20), histtype='stepfilled', label="Fully hadronic",
+    plt.hist(edges[:-1], weights=fullhad,
+    bins=edges, histtype='stepfilled', label="Fully hadronic",
     color='lightgreen', linewidth=2, alpha=0.5)
     
     plt.xlabel(xlabel)
     plt.ylabel('Events')
+    plt.xlim(*plot_range)
     plt.ylim(1, None)
     plt.yscale('log')
     plt.title(f'{histogram_name} ({variation}) ({selection})')
@@ -273,16 +286,16 @@ def plot_stacked_histogram(histogram_name, semilep_histograms, fullhad_histogram
     
     # saving histograms as ROOT files
     print('ROOT FILE FOR SEMI-LEPTONIC\n')
-    save_histogram_as_root(f"{histogram_name[:-2]}",semilep_histograms[0][0],
-    semilep_histograms[0][1],output_dir,"semilep",variation,selection)
+    save_histogram_as_root(f"{histogram_name[:-2]}",edges,
+    semilep,output_dir,"semilep",variation,selection)
     
     print('ROOT FILE FOR FULLY LEPTONIC\n')
-    save_histogram_as_root(f"{histogram_name[:-2]}",fulllep_histograms[0][0],
-    fulllep_histograms[0][1],output_dir,"fulllep",variation,selection)
+    save_histogram_as_root(f"{histogram_name[:-2]}",edges,
+    fulllep,output_dir,"fulllep",variation,selection)
     
     print('ROOT FILE FOR FULLY HADRONIC\n')
-    save_histogram_as_root(f"{histogram_name[:-2]}",fullhad_histograms[0][0],
-    fullhad_histograms[0][1],output_dir,"fullhad",variation,selection)
+    save_histogram_as_root(f"{histogram_name[:-2]}",edges,
+    fullhad,output_dir,"fullhad",variation,selection)
 
 # processing multiple root files
 def process_multiple_files(root_files, output_dir):
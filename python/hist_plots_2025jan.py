@@ -8,6 +8,9 @@ import glob
 import ROOT
 import os
 
+# importing other useful files
+from hist_cube import build_cubes, norm_table, normalize, save_cubes, write_histogram
+
 # glob all .root hist files
 root_files = glob.glob('/ceph/salshamaily/topEWK_FCCee/analysis/final_output/*.root')
 
@@ -102,45 +105,24 @@ def get_process(root_file):
 # reading histogram data from root files
 def read_data(root_files):
 
-    # function that parses file names to use in re-scaling
-    def parse_data(filename):
-        new_filename = filename[53:-len(filename.split("365")[-1])]
-        return new_filename
-
     print('Processing ROOT files...')
-    
-    for file in root_files:
-        f = ROOT.TFile.Open(file)
-        
-        variation = get_variation(file)
-        selection = get_selection(file)
-        process   = get_process(file)
-    
-        for key in f.GetListOfKeys():
-            variable = key.ReadObj()
-        
-            if isinstance(variable, ROOT.TH1):
-                hist = variable.Clone()  # cloning to avoid file deletion
-                hist.SetDirectory(0)
-                
-                # from analysis_final.py
-                parsed_filename = parse_data(file)
-                SumOfWeights    = procDictAdd[parsed_filename]['sumOfWeights']
-                N_exp           = procDictAdd[parsed_filename]['crossSection']*intLumi
-                
-                # re-scaling histogram for accuracy
-                factor = hist.GetEntries()/hist.Integral() * (N_exp/SumOfWeights)
-                hist.Scale(factor)
-                
-                # output histogram file names
-                output_file = os.path.join(output_dir, f"{variable.GetName()}_{process}_{variation}_{selection}_histo.root")
 
-            # create new root file to write histogram
-            new_file = ROOT.TFile(output_file, "RECREATE")  # "RECREATE" to overwrite an existing file
-            hist.Write()
-            new_file.Close()
+    # all histograms of a variable in one array, normalized at once
+    cubes = build_cubes(root_files, lambda file: (get_process(file), get_variation(file), get_selection(file)))
+    table = norm_table(procDictAdd, intLumi)
 
-        f.Close()
+    # unit-weight copy for luminosity and cross-section scans without the final stage (lumi_scan.py)
+    save_cubes(os.path.join(output_dir, "cubes.npz"), cubes, procDictAdd, intLumi)
+
+    for variable_name, cube in cubes.items():
+        for process, variation, selection in normalize(cube, table):
+            print(f'Warning: {variable_name} ({process}, {variation}, {selection}) is empty and was not re-scaled')
+
+        for i, (process, variation, selection) in enumerate(cube["keys"]):
+
+            # output histogram file names
+            output_file = os.path.join(output_dir, f"{variable_name}_{process}_{variation}_{selection}_histo.root")
+            write_histogram(output_file, variable_name, cube, i)
 
 # plotting root histograms
 def plot_data(root_files):
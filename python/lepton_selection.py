@@ -0,0 +1,65 @@
+## fields of the selected leptons written by stage2, in the order of topEWK::LeptonField
+selected_fields = ["px", "py", "pz", "pt", "phi", "eta", "energy", "mass", "d0", "z0"]
+
+## input columns of topEWK::select_leptons after the cuts, in argument order
+kernel_inputs = ["px", "py", "pz", "phi", "eta", "energy", "mass", "charge", "d0", "z0"]
+
+## cuts understood by topEWK::lepton_cuts, in argument order, with their defaults
+cut_defaults = {
+    "min_energy":  0.0,
+    "min_pt":      0.0,
+    "max_abs_eta": float("inf"),
+    "max_abs_d0":  float("inf"),
+    "max_abs_z0":  float("inf"),
+}
+
+# building the C++ cuts object
+def cuts_expression(cuts):
+
+    """
+    Builds the topEWK::lepton_cuts(...) call for a dictionary of cuts.
+    Parameters:
+    - cuts: dict, {cut name: value} with names from cut_defaults, missing cuts are not applied.
+    Returns:
+    - expression: str, C++ expression creating the cuts.
+    """
+
+    unknown = set(cuts) - set(cut_defaults)
+    if unknown:
+        raise KeyError(f"unknown lepton cuts: {', '.join(sorted(unknown))}")
+
+    values = {**cut_defaults, **cuts}
+    args   = ["std::numeric_limits<float>::infinity()" if values[name] == float("inf") else f"{float(values[name])}f"
+              for name in cut_defaults]
+
+    return f"topEWK::lepton_cuts({', '.join(args)})"
+
+# defines of the fused selection for one lepton collection
+def lepton_defines(collection, counter, cuts):
+
+    """
+    Lists the Defines that select a lepton collection with one compiled kernel (lepton_selection.h)
+    and expose the mask, the selected columns and their count under the usual stage2 names.
+    Parameters:
+    - collection: str, column prefix of the collection, e.g. 'muon'.
+    - counter: str, name of the count column, e.g. 'n_muons_pass'.
+    - cuts: dict, {cut name: value} passed to cuts_expression().
+    Returns:
+    - defines: list of (name, expression) tuples, in definition order.
+    """
+
+    selected = f"{collection}_selected"
+    inputs   = ", ".join(f"{collection}_{name}" for name in kernel_inputs)
+
+    defines = [
+        (selected,              f"topEWK::select_leptons({cuts_expression(cuts)}, {inputs})"),
+        (f"{collection}_pass",  f"topEWK::mask({selected})"),
+    ]
+
+    for name in selected_fields:
+        defines.append((f"{collection}_pass_{name}", f"topEWK::field({selected}, topEWK::LeptonField::{name})"))
+
+    defines.append((f"{collection}_pass_charge", f"topEWK::charges({selected})"))
+    defines.append((counter,                     f"{selected}.n"))
+
+    return defines
@@ -0,0 +1,130 @@
+# importing packages
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from hist_cube import load_cubes, reference_rows
+
+# yields for many luminosities at once
+def yields(cube, lumis, xsec_scales=1.0):
+
+    """
+    Computes the histograms of a stored cube for a vector of luminosities and cross-section
+    hypotheses in one broadcast multiply.
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumis: array, integrated luminosities [pb^-1], shape (P,).
+    - xsec_scales: float or array, cross-section factors, one per histogram (n,) or per point and histogram (P, n).
+    Returns:
+    - yields: numpy array, shape (P, n, bins + 2), flow bins included.
+    """
+
+    norm = np.asarray(lumis, dtype=np.float64)[:, None] * (cube["rates"] * xsec_scales)
+
+    return norm[:, :, None] * cube["values"][None]
+
+def hypothesis_scales(cube, hypotheses):
+
+    """
+    Turns cross-section hypotheses given per process or per variation into the (P, n) factors
+    taken by yields().
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - hypotheses: list of dict, {process or variation: factor} per point, missing ones stay at 1.
+    Returns:
+    - scales: numpy array, shape (P, n).
+    """
+
+    return np.array([[hypothesis.get(process, 1.0) * hypothesis.get(variation, 1.0)
+                      for process, variation, selection in cube["keys"]] for hypothesis in hypotheses])
+
+# Asimov significance of a deviation from the reference
+def asimov_significance(observed, expected):
+
+    """
+    Computes the Asimov significance of observing one set of histograms when another is expected,
+    Z = sqrt(sum over bins 2 (n ln(n/b) - n + b)), for deviations of either sign. Bins with no
+    expected events are skipped.
+    Parameters:
+    - observed: numpy array, histograms n, bins on the last axis (flow bins excluded).
+    - expected: numpy array, histograms b, same shape.
+    Returns:
+    - significance: numpy array, the shape of the inputs without the last axis.
+    """
+
+    valid = expected > 0
+    ratio = np.divide(observed, expected, out=np.ones_like(observed), where=valid & (observed > 0))
+    terms = np.where(valid, 2 * (observed * np.log(ratio) - observed + expected), 0.0)
+
+    return np.sqrt(np.clip(terms.sum(axis=-1), 0, None))
+
+def scan(cube, lumis, xsec_scales=1.0, reference='SM'):
+
+    """
+    Computes yields, deviations from the reference variation and their significance for every
+    luminosity (or hypothesis) point of a cube at once.
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumis: array, integrated luminosities [pb^-1], shape (P,).
+    - xsec_scales: float or array, see yields().
+    - reference: str, variation the others are compared to.
+    Returns:
+    - result: dict, "keys" of the compared histograms, "yields" (P, m), "deviations" (P, m, bins)
+      and "significance" (P, m).
+    """
+
+    hists      = yields(cube, lumis, xsec_scales)[:, :, 1:-1]
+    rows, refs = reference_rows(cube, reference)
+
+    return {"keys":         [cube["keys"][i] for i in rows],
+            "yields":       hists[:, rows].sum(axis=-1),
+            "deviations":   hists[:, rows] - hists[:, refs],
+            "significance": asimov_significance(hists[:, rows], hists[:, refs])}
+
+def lumi_for(significance, lumis, target):
+
+    """
+    Finds the smallest scanned luminosity at which each deviation reaches a target significance.
+    Parameters:
+    - significance: numpy array, shape (P, m), from scan().
+    - lumis: array, scanned luminosities, increasing, shape (P,).
+    - target: float, wanted significance.
+    Returns:
+    - lumis: numpy array, shape (m,), NaN where the target is not reached.
+    """
+
+    reached = significance >= target
+    first   = reached.argmax(axis=0)
+
+    return np.where(reached.any(axis=0), np.asarray(lumis)[first], np.nan)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan yields and sensitivity over luminosity from the cubes stored by hist_plots_2025jan.read_data.")
+    parser.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    parser.add_argument("--lumi-min", type=float, default=0.5e6, help="smallest luminosity [pb^-1]")
+    parser.add_argument("--lumi-max", type=float, default=5e6, help="largest luminosity [pb^-1]")
+    parser.add_argument("--points", type=int, default=50, help="number of luminosity points")
+    parser.add_argument("--target", type=float, default=5.0, help="significance for the luminosity column")
+    args = parser.parse_args()
+
+    cubes, int_lumi = load_cubes(args.cubes)
+    lumis           = np.linspace(args.lumi_min, args.lumi_max, args.points)
+
+    start   = time.perf_counter()
+    results = {variable: scan(cube, np.append(lumis, int_lumi)) for variable, cube in cubes.items()}
+    print(f"Scanned {args.points} luminosity points for {len(cubes)} variables in {(time.perf_counter() - start) * 1e3:.1f} ms\n")
+
+    print(f"{'variable':<24} {'process':<9} {'variation':<11} {'selection':<9} {'yield':>11} {'Z':>7} {f'L(Z={args.target:g})':>11}")
+
+    for variable, result in results.items():
+        needed = lumi_for(result["significance"][:-1], lumis, args.target)
+
+        for i, (process, variation, selection) in enumerate(result["keys"]):
+            print(f"{variable:<24} {process:<9} {variation:<11} {selection:<9} {result['yields'][-1, i]:>11.1f} "
+                  f"{result['significance'][-1, i]:>7.2f} {needed[i]:>11.3g}")
+
+    print(f"\nyield and Z at the luminosity of the final stage, {int_lumi:g} pb^-1")
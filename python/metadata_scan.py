@@ -0,0 +1,233 @@
+# importing packages
+import os
+import sys
+import json
+import argparse
+import uproot
+from concurrent.futures import ThreadPoolExecutor
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files, file_checksum
+from sample_norm import N_expect
+
+# metadata is cached by the checksum of the file, the path index avoids hashing unchanged files again
+cache_file = os.path.join(os.path.expanduser("~"), ".cache", "topEWK", "metadata_cache.json")
+
+# file where the final stage picks up the generated normalization (see analysis_final.py)
+norm_file = "procDictAdd.json"
+
+# reading and writing the metadata cache
+def load_cache():
+    if os.path.isfile(cache_file):
+        with open(cache_file) as f:
+            return json.load(f)
+    return {"paths": {}, "metadata": {}}
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, "w") as f:
+        json.dump(cache, f)
+
+# reading the metadata of one file
+def parameter(file, name):
+
+    """
+    Reads the value of a TParameter written by FCCAnalyses (eventsProcessed, sumOfWeights).
+    Parameters:
+    - file: uproot ReadOnlyDirectory, the open file.
+    - name: str, name of the parameter.
+    Returns:
+    - value: float, or None if the file does not have it.
+    """
+
+    if name not in file:
+        return None
+
+    return float(file[name].member("fVal"))
+
+def read_metadata(path):
+
+    """
+    Reads the number of processed events and the sum of weights of a stage output. Files without
+    the parameters fall back on the number of entries of the events tree, which is only correct
+    if nothing was filtered before.
+    Parameters:
+    - path: str, path to the .root file.
+    Returns:
+    - metadata: dict, {"events", "weights", "entries", "source"}.
+    """
+
+    with uproot.open(path) as file:
+        entries = file["events"].num_entries
+        events  = parameter(file, "eventsProcessed")
+        weights = parameter(file, "sumOfWeights")
+
+    source = "parameters" if events is not None else "entries"
+
+    if events is None:
+        events = entries
+    if weights is None:
+        weights = events
+
+    return {"events": events, "weights": weights, "entries": entries, "source": source}
+
+def file_metadata(path, cache):
+
+    """
+    Returns the metadata of a file from the cache, reading the file only if its checksum is new.
+    Parameters:
+    - path: str, path to the .root file.
+    - cache: dict, metadata cache (updated in place).
+    Returns:
+    - metadata: dict, output of read_metadata().
+    """
+
+    stat  = os.stat(path)
+    entry = cache["paths"].get(path)
+
+    if not (entry and entry["mtime"] == stat.st_mtime and entry["bytes"] == stat.st_size):
+        entry = {"mtime": stat.st_mtime, "bytes": stat.st_size, "sha256": file_checksum(path)}
+        cache["paths"][path] = entry
+
+    if entry["sha256"] not in cache["metadata"]:
+        cache["metadata"][entry["sha256"]] = read_metadata(path)
+
+    return cache["metadata"][entry["sha256"]]
+
+def sidecar_metadata(directory, sample):
+
+    """
+    Reads the sidecar metadata of a sample, <sample>.json or <sample>/metadata.json, with the keys
+    numberOfEvents and sumOfWeights as in procDict.
+    Parameters:
+    - directory: str, stage output directory.
+    - sample: str, sample name.
+    Returns:
+    - metadata: dict, {"events", "weights"}, or None if there is no sidecar.
+    """
+
+    for path in [os.path.join(directory, f"{sample}.json"), os.path.join(directory, sample, "metadata.json")]:
+        if os.path.isfile(path):
+            with open(path) as f:
+                sidecar = json.load(f)
+            return {"events":  float(sidecar["numberOfEvents"]),
+                    "weights": float(sidecar.get("sumOfWeights", sidecar["numberOfEvents"]))}
+
+    return None
+
+# scanning all samples
+def scan(directory, samples, workers=16):
+
+    """
+    Sums the processed events and weights over the files of every sample. Files are read in
+    parallel; samples whose files lack the parameters use their sidecar metadata if there is one.
+    Parameters:
+    - directory: str, stage output directory (the inputDir of the final stage).
+    - samples: list of str, sample names.
+    - workers: int, number of files read in parallel.
+    Returns:
+    - metadata: dict, {sample: {"files", "events", "weights", "source"}}.
+    """
+
+    cache = load_cache()
+    files = {sample: sample_files(directory, sample) for sample in samples}
+    paths = [path for sample_paths in files.values() for path in sample_paths]
+
+    # hashing and reading are I/O bound, so threads are enough
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        per_file = dict(zip(paths, pool.map(lambda path: file_metadata(path, cache), paths)))
+
+    save_cache(cache)
+
+    metadata = {}
+
+    for sample, sample_paths in files.items():
+        rows    = [per_file[path] for path in sample_paths]
+        sidecar = sidecar_metadata(directory, sample)
+        summed  = {"files":   len(rows),
+                   "events":  sum(row["events"] for row in rows),
+                   "weights": sum(row["weights"] for row in rows),
+                   "source":  "parameters" if rows and all(row["source"] == "parameters" for row in rows) else "entries"}
+
+        if sidecar and summed["source"] != "parameters":
+            summed.update(sidecar, source="sidecar")
+        if not rows and not sidecar:
+            summed["source"] = "missing"
+
+        metadata[sample] = summed
+
+    return metadata
+
+# building the normalization dictionary
+def norm_dict(metadata, int_lumi):
+
+    """
+    Builds procDictAdd from the scanned metadata. The cross section is the expected number of
+    events of sample_norm.N_expect divided by the integrated luminosity.
+    Parameters:
+    - metadata: dict, output of scan().
+    - int_lumi: float, integrated luminosity [pb^-1].
+    Returns:
+    - proc_dict: dict, {sample: procDict entry}.
+    """
+
+    return {sample: {"numberOfEvents":     int(row["events"]),
+                     "sumOfWeights":       row["weights"],
+                     "crossSection":       N_expect[sample] / int_lumi,
+                     "kfactor":            1.0,
+                     "matchingEfficiency": 1.0}
+            for sample, row in metadata.items() if row["source"] != "missing"}
+
+def compare(proc_dict, hardcoded):
+
+    """
+    Lists the samples whose scanned normalization differs from the hardcoded procDictAdd.
+    Parameters:
+    - proc_dict: dict, output of norm_dict().
+    - hardcoded: dict, procDictAdd of the final stage.
+    Returns:
+    - problems: list of str, one line per difference.
+    """
+
+    problems = []
+
+    for sample, entry in proc_dict.items():
+        if sample not in hardcoded:
+            problems.append(f"{sample}: missing from procDictAdd")
+            continue
+
+        for key in ["numberOfEvents", "sumOfWeights", "crossSection"]:
+            if abs(entry[key] - hardcoded[sample][key]) > 1e-6 * abs(hardcoded[sample][key]):
+                problems.append(f"{sample}: {key} is {entry[key]:g}, procDictAdd has {hardcoded[sample][key]:g}")
+
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan event counts and weight sums of the stage outputs and generate procDictAdd.")
+    parser.add_argument("config", nargs="?", default="analysis/analysis_final.py", help="final stage configuration")
+    parser.add_argument("--input-dir", default=None, help="stage output directory, defaults to inputDir of the configuration")
+    parser.add_argument("--write", action="store_true", help=f"write the dictionary to <input dir>/{norm_file} for the final stage")
+    args = parser.parse_args()
+
+    config    = load_config(args.config)
+    input_dir = args.input_dir or config.inputDir
+
+    metadata  = scan(input_dir, list(config.processList))
+    proc_dict = norm_dict(metadata, config.intLumi)
+
+    print(f"{'sample':<70} {'files':>6} {'events':>11} {'weights':>13} {'source':>11}")
+    for sample, row in metadata.items():
+        print(f"{sample:<70} {row['files']:>6} {int(row['events']):>11} {row['weights']:>13.1f} {row['source']:>11}")
+
+    # the final stage uses the hardcoded values until a generated file is written
+    problems = compare(proc_dict, config.procDictAdd)
+
+    if problems:
+        print("\nDifferences from the procDictAdd of the final stage:")
+        for problem in problems:
+            print(f"  - {problem}")
+
+    if args.write:
+        with open(os.path.join(input_dir, norm_file), "w") as f:
+            json.dump(proc_dict, f, indent=2)
@@ -0,0 +1,140 @@
+# importing packages
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.stats import chi2, norm
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from hist_cube import load_cubes, reference_rows
+from lumi_scan import yields, asimov_significance
+
+# ranking all observables
+def rank_cube(cube, lumi, reference='SM'):
+
+    """
+    Computes the significance of BSM - SM for every (process, selection, variation) of a cube in
+    one pass: a chi2 with the Poisson and MC errors of both histograms, converted to a Gaussian
+    significance for the number of filled bins, and the Asimov Poisson significance.
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    - reference: str, SM variation.
+    Returns:
+    - rows: list of dict, one per (process, selection, variation).
+    """
+
+    hists     = yields(cube, [lumi])[0, :, 1:-1]
+    variances = (cube["variances"] * (lumi * cube["rates"][:, None]) ** 2)[:, 1:-1]
+
+    rows, refs = reference_rows(cube, reference)
+
+    bsm, sm  = hists[rows], hists[refs]
+    error    = sm + variances[rows] + variances[refs]
+    filled   = sm > 0
+    chi2_sum = np.where(filled, (bsm - sm) ** 2 / np.where(filled, error, 1.0), 0.0).sum(axis=1)
+    dof      = np.maximum(filled.sum(axis=1), 1)
+    z_chi2   = norm.isf(np.maximum(chi2.sf(chi2_sum, dof), 1e-300))
+    z_asimov = asimov_significance(bsm, sm)
+
+    return [{"process": cube["keys"][i][0], "variation": cube["keys"][i][1], "selection": cube["keys"][i][2],
+             "chi2": float(chi2_sum[j]), "ndf": int(dof[j]), "z_chi2": float(max(z_chi2[j], 0.0)),
+             "significance": float(z_asimov[j]), "deviation": float((bsm[j] - sm[j]).sum())}
+            for j, i in enumerate(rows)]
+
+def rank(cubes, lumi):
+
+    """
+    Ranks every (variable, process, selection, variation) by its Asimov significance.
+    Parameters:
+    - cubes: dict, output of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    Returns:
+    - ranking: list of dict, sorted by decreasing significance.
+    """
+
+    ranking = [{"variable": variable, **row} for variable, cube in cubes.items() for row in rank_cube(cube, lumi)]
+
+    return sorted(ranking, key=lambda row: row["significance"], reverse=True)
+
+def top_observables(ranking_file, n):
+
+    """
+    Reads the n best observables of a ranking written by this script, e.g. to limit plotting or
+    datacard generation to them.
+    Parameters:
+    - ranking_file: str, path of the JSON ranking.
+    - n: int, number of observables.
+    Returns:
+    - rows: list of dict, the first n rows.
+    """
+
+    with open(ranking_file) as f:
+        return json.load(f)[:n]
+
+# heatmap
+def plot_heatmap(ranking, output_file):
+
+    """
+    Plots the significance of every observable as a heatmap: variables against (process, variation),
+    one panel per selection.
+    Parameters:
+    - ranking: list of dict, output of rank().
+    - output_file: str, path of the image.
+    """
+
+    selections = sorted({row["selection"] for row in ranking})
+    variables  = sorted({row["variable"] for row in ranking})
+    columns    = sorted({(row["process"], row["variation"]) for row in ranking})
+
+    fig, panels = plt.subplots(len(selections), 1, figsize=(max(8, 0.6 * len(columns)), 1 + 0.6 * len(variables) * len(selections)),
+                               squeeze=False)
+
+    for panel, selection in zip(panels[:, 0], selections):
+        grid = np.full((len(variables), len(columns)), np.nan)
+        for row in ranking:
+            if row["selection"] == selection:
+                grid[variables.index(row["variable"]), columns.index((row["process"], row["variation"]))] = row["significance"]
+
+        image = panel.imshow(grid, aspect="auto", cmap="viridis")
+        for (i, j), value in np.ndenumerate(grid):
+            if np.isfinite(value):
+                panel.text(j, i, f"{value:.1f}", ha="center", va="center", color="white", fontsize=7)
+
+        panel.set_xticks(range(len(columns)))
+        panel.set_xticklabels([f"{process}\n{variation}" for process, variation in columns], fontsize=7, rotation=90)
+        panel.set_yticks(range(len(variables)))
+        panel.set_yticklabels(variables, fontsize=8)
+        panel.set_title(selection)
+        fig.colorbar(image, ax=panel, label="Asimov significance")
+
+    fig.tight_layout()
+    fig.savefig(output_file)
+    plt.close(fig)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank every (variable, process, selection, variation) by the significance of its deviation from the SM.")
+    parser.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    parser.add_argument("--lumi", type=float, default=None, help="luminosity [pb^-1], defaults to the one of the final stage")
+    parser.add_argument("--top", type=int, default=20, help="number of observables printed")
+    parser.add_argument("--json", default=None, help="write the full ranking to this JSON file")
+    parser.add_argument("--heatmap", default=None, help="save the heatmap to this image")
+    args = parser.parse_args()
+
+    cubes, int_lumi = load_cubes(args.cubes)
+    ranking         = rank(cubes, args.lumi or int_lumi)
+
+    print(f"{'#':>3} {'variable':<24} {'process':<9} {'variation':<11} {'selection':<9} {'Z':>7} {'chi2/ndf':>12} {'Z(chi2)':>8} {'deviation':>10}")
+    for number, row in enumerate(ranking[:args.top], 1):
+        print(f"{number:>3} {row['variable']:<24} {row['process']:<9} {row['variation']:<11} {row['selection']:<9} "
+              f"{row['significance']:>7.2f} {row['chi2']:>7.1f}/{row['ndf']:<4} {row['z_chi2']:>8.2f} {row['deviation']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(ranking, f, indent=2)
+
+    if args.heatmap:
+        plot_heatmap(ranking, args.heatmap)
@@ -0,0 +1,98 @@
+# importing packages
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import uproot
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from output_profiles import compression_profiles, recompress
+
+# benchmarking one profile
+def benchmark_profile(input_file, profile, narrow, work_dir):
+
+    """
+    Rewrites a stage output with one profile and measures the cost of writing and reading it back.
+    Parameters:
+    - input_file: str, path to a stage1 or stage2 output.
+    - profile: str, key of compression_profiles.
+    - narrow: bool, whether dtype_policy is applied.
+    - work_dir: str, directory for the rewritten file.
+    Returns:
+    - result: dict, bytes written, write and read times in seconds.
+    """
+
+    output_file = os.path.join(work_dir, f"{profile}_{'narrow' if narrow else 'native'}.root")
+
+    start   = time.perf_counter()
+    entries = recompress(input_file, output_file, profile, narrow=narrow)
+    write_s = time.perf_counter() - start
+
+    # downstream read: decompress every branch of the tree
+    start = time.perf_counter()
+    with uproot.open(output_file) as file:
+        file["events"].arrays(library="np")
+    read_s = time.perf_counter() - start
+
+    return {
+        "profile": profile,
+        "narrow":  narrow,
+        "entries": entries,
+        "bytes":   os.path.getsize(output_file),
+        "write_s": write_s,
+        "read_s":  read_s,
+    }
+
+# benchmarking all profiles
+def benchmark(input_file, profiles, work_dir):
+
+    """
+    Runs benchmark_profile() for every profile, with and without dtype narrowing.
+    Parameters:
+    - input_file: str, path to a stage1 or stage2 output.
+    - profiles: list of str, keys of compression_profiles.
+    - work_dir: str, directory for the rewritten files.
+    Returns:
+    - results: list of dict, one entry per (profile, narrow) combination.
+    """
+
+    return [benchmark_profile(input_file, profile, narrow, work_dir) for profile in profiles for narrow in (False, True)]
+
+# printing the benchmark table
+def print_results(results):
+
+    """
+    Prints the benchmark results relative to the default profile without narrowing.
+    Parameters:
+    - results: list of dict, output of benchmark().
+    """
+
+    reference = next(r for r in results if r["profile"] == "default" and not r["narrow"])
+
+    print(f"{'profile':<10} {'types':<7} {'MB':>9} {'size':>6} {'write [s]':>10} {'read [s]':>9}")
+
+    for r in sorted(results, key=lambda r: r["bytes"]):
+        print(f"{r['profile']:<10} {'narrow' if r['narrow'] else 'native':<7} {r['bytes'] / 1e6:>9.2f} "
+              f"{r['bytes'] / reference['bytes']:>6.2f} {r['write_s']:>10.2f} {r['read_s']:>9.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare output dtype/compression profiles on one stage output file.")
+    parser.add_argument("input_file", help="a stage1 or stage2 output file, e.g. one chunk")
+    parser.add_argument("--profiles", nargs="+", default=list(compression_profiles), help="profiles to compare")
+    parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if "default" not in args.profiles:
+        args.profiles.insert(0, "default")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = benchmark(args.input_file, args.profiles, work_dir)
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,197 @@
+# importing packages
+import os
+import sys
+import fnmatch
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config
+
+## storage type of each output column, the first matching pattern wins
+## columns that match no pattern are written with the type they are computed with
+dtype_policy = [
+    ("n_*",         "std::int16_t"),   # object counts
+    ("*_parentPDG", "std::int16_t"),   # PDG IDs
+    ("muon*_charge",     "std::int8_t"),   # reconstructed charges, integer; the gen charges
+    ("electron*_charge", "std::int8_t"),   # (genTop_charge = +-2/3, ...) keep their own type
+    ("photon*_charge",   "std::int8_t"),
+    ("jet*_charge",      "std::int8_t"),
+    ("*_px",        "float"),
+    ("*_py",        "float"),
+    ("*_pz",        "float"),
+    ("*_pt",        "float"),
+    ("*_p",         "float"),
+    ("*_e",         "float"),
+    ("*_energy",    "float"),
+    ("*_mass",      "float"),
+    ("*_eta",       "float"),
+    ("*_phi",       "float"),
+    ("*_d0",        "float"),
+    ("*_z0",        "float"),
+]
+
+## compression algorithm and level of each output profile
+## "default" keeps whatever FCCAnalyses/ROOT writes
+compression_profiles = {
+    "default": None,
+    "ZSTD-5":  ("kZSTD", 5),
+    "ZSTD-1":  ("kZSTD", 1),
+    "LZ4-4":   ("kLZ4",  4),
+    "LZ4-1":   ("kLZ4",  1),
+    "ZLIB-1":  ("kZLIB", 1),
+    "ZLIB-6":  ("kZLIB", 6),
+}
+
+# finding the storage type of a column
+def storage_type(column):
+
+    """
+    Looks up the storage type of a column in dtype_policy.
+    Parameters:
+    - column: str, name of the output column.
+    Returns:
+    - type: str, C++ type the column is written with, or None if it keeps its own type.
+    """
+
+    for pattern, cpp_type in dtype_policy:
+        if fnmatch.fnmatchcase(column, pattern):
+            return cpp_type
+
+    return None
+
+# narrowing output columns before they are written
+def apply_dtype_policy(df, columns):
+
+    """
+    Redefines the output columns of a dataframe with their storage types from dtype_policy.
+    Needs output_types.h in the includePaths of the stage.
+    Parameters:
+    - df: RDataFrame node returned by the analysers.
+    - columns: list of str, the branch list written by the stage.
+    Returns:
+    - df: RDataFrame node with the narrowed columns.
+    """
+
+    for column in columns:
+        cpp_type = storage_type(column)
+
+        if cpp_type is None or not df.HasColumn(column):
+            continue
+
+        df = df.Redefine(column, f"topEWK::narrow<{cpp_type}>({column})")
+
+    return df
+
+# snapshot options for a compression profile
+def snapshot_options(profile):
+
+    """
+    Builds the RSnapshotOptions for a compression profile.
+    Parameters:
+    - profile: str, key of compression_profiles.
+    Returns:
+    - options: ROOT.RDF.RSnapshotOptions, snapshot options with the profile's compression.
+    """
+
+    import ROOT
+
+    options = ROOT.RDF.RSnapshotOptions()
+    setting = compression_profiles[profile]
+
+    if setting is not None:
+        algorithm, level = setting
+        options.fCompressionAlgorithm = getattr(ROOT.RCompressionSetting.EAlgorithm, algorithm)
+        options.fCompressionLevel     = level
+
+    return options
+
+# rewriting an existing output with a profile
+def recompress(input_file, output_file, profile, narrow=True, tree_name="events"):
+
+    """
+    Rewrites a stage output with the compression of a profile and, optionally, the storage types
+    of dtype_policy. FCCAnalyses writes its snapshots with the default settings, so this is run
+    on the chunk outputs after each stage.
+    Parameters:
+    - input_file: str, path to the stage output.
+    - output_file: str, path of the rewritten file.
+    - profile: str, key of compression_profiles.
+    - narrow: bool, whether to apply dtype_policy as well.
+    - tree_name: str, name of the tree.
+    Returns:
+    - entries: int, number of entries written.
+    """
+
+    import ROOT
+
+    header = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis", "output_types.h")
+    ROOT.gInterpreter.Declare(f'#include "{os.path.abspath(header)}"')
+
+    df      = ROOT.RDataFrame(tree_name, input_file)
+    columns = [str(column) for column in df.GetColumnNames() if "rdf_sizeof_" not in str(column)]
+
+    if narrow:
+        df = apply_dtype_policy(df, columns)
+
+    # the count is filled by the same event loop as the snapshot
+    entries = df.Count()
+    df.Snapshot(tree_name, output_file, columns, snapshot_options(profile))
+
+    copy_metadata(input_file, output_file, tree_name)
+
+    return entries.GetValue()
+
+# keeping the bookkeeping objects written next to the tree
+def copy_metadata(input_file, output_file, tree_name="events"):
+
+    """
+    Copies every object except the tree (eventsProcessed, sumOfWeights, ...) from one file to another.
+    Parameters:
+    - input_file: str, path to the original stage output.
+    - output_file: str, path to the rewritten file.
+    - tree_name: str, name of the tree, which is not copied.
+    """
+
+    import ROOT
+
+    source = ROOT.TFile.Open(input_file)
+    target = ROOT.TFile.Open(output_file, "UPDATE")
+
+    for key in source.GetListOfKeys():
+        if key.GetName() != tree_name:
+            target.WriteObject(key.ReadObj(), key.GetName())
+
+    target.Close()
+    source.Close()
+
+# rewriting all outputs of a stage with its configured profile
+def recompress_outputs(config):
+
+    """
+    Rewrites every .root file in the outputDir of a stage with the stage's outputProfile.
+    Parameters:
+    - config: module, stage configuration (see stage_config.load_config).
+    """
+
+    profile = getattr(config, "outputProfile", "default")
+
+    if profile == "default":
+        print(f"outputProfile is 'default', nothing to do for {config.outputDir}")
+        return
+
+    for directory, _, files in os.walk(config.outputDir):
+        for name in sorted(files):
+            if not name.endswith(".root"):
+                continue
+
+            path      = os.path.join(directory, name)
+            temporary = path + ".tmp.root"
+
+            # the stage already narrowed its columns, only the compression changes here
+            recompress(path, temporary, profile, narrow=False)
+            os.replace(temporary, path)
+
+            print(f"Rewrote {path} with {profile}")
+
+if __name__ == "__main__":
+    recompress_outputs(load_config(sys.argv[1]))
@@ -0,0 +1,182 @@
+# importing packages
+import os
+import sys
+import time
+import argparse
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files
+from weighted_final import scale_factor
+
+# header with the helicity weights, next to the analysis configurations
+polarization_header = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../analysis/polarization.h")
+
+# names of the polarization configurations
+def polarization_label(p_em, p_ep):
+    return f"P(e-)={p_em:+.0%}, P(e+)={p_ep:+.0%}"
+
+# checking the polarizations and the normalisation of every sample before anything is booked
+def check_config(config, samples):
+
+    """
+    Checks the polarization settings of the final configuration and looks up the scale factor of
+    every sample, so that a bad setting fails before the event loops instead of after them.
+    Parameters:
+    - config: module, final stage configuration.
+    - samples: list of str, samples to fill.
+    Returns:
+    - factors: dict, {sample: output of weighted_final.scale_factor()}.
+    """
+
+    p0_em, p0_ep = getattr(config, "generatedPolarization", (0.0, 0.0))
+    if abs(p0_em) >= 1 or abs(p0_ep) >= 1:
+        raise ValueError(f"generatedPolarization {(p0_em, p0_ep)}: |P| must be below 1, the helicity weights divide by 1 +- P")
+
+    outside = [(p_em, p_ep) for p_em, p_ep in config.polarizations if abs(p_em) > 1 or abs(p_ep) > 1]
+    if outside:
+        raise ValueError(f"polarizations outside [-1, 1]: {outside}")
+
+    factors, missing = {}, []
+    for sample in samples:
+        try:
+            factors[sample] = scale_factor(config, sample)
+        except KeyError:
+            missing.append(sample)
+
+    if missing:
+        raise ValueError(f"{len(missing)} sample(s) have no normalisation in procDictAdd:\n  " + "\n  ".join(missing))
+
+    return factors
+
+# histogram models with the polarization axis
+def histo2d_model(ROOT, name, entry, n):
+
+    """
+    Builds the TH2D model of a histoList entry with one y bin per polarization configuration.
+    Parameters:
+    - ROOT: module, the ROOT module.
+    - name: str, name of the histogram.
+    - entry: dict, histoList entry, with fixed (bin, xmin, xmax) or variable-width (bins) x bins.
+    - n: int, number of polarization configurations.
+    Returns:
+    - model: ROOT.RDF.TH2DModel.
+    """
+
+    title = f"{entry['title']};{entry['title']};polarization"
+
+    if "bins" in entry:
+        edges = ROOT.std.vector["double"](entry["bins"])
+        return ROOT.RDF.TH2DModel(name, title, len(edges) - 1, edges.data(), n, 0, n)
+
+    return ROOT.RDF.TH2DModel(name, title, entry["bin"], entry["xmin"], entry["xmax"], n, 0, n)
+
+# booking the histograms of all configurations
+def book_polarizations(ROOT, df, config):
+
+    """
+    Books, for every cut, the histoList histograms of all polarizations as TH2D (the variable
+    against the configuration index), filled with the helicity weights of every configuration in
+    the same event loop.
+    Parameters:
+    - ROOT: module, the ROOT module.
+    - df: ROOT.RDataFrame over the sample, with the beam_helicity_em/ep columns.
+    - config: module, final stage configuration.
+    Returns:
+    - booked: dict, {cut: {histogram name: RResultPtr}}.
+    """
+
+    p_em  = ", ".join(str(float(p)) for p, _ in config.polarizations)
+    p_ep  = ", ".join(str(float(p)) for _, p in config.polarizations)
+    p0_em, p0_ep = getattr(config, "generatedPolarization", (0.0, 0.0))
+    n     = len(config.polarizations)
+
+    df = df.Define("pol_weights", f"topEWK::polarization_weights(beam_helicity_em, beam_helicity_ep, "
+                                  f"ROOT::RVecD{{{p_em}}}, ROOT::RVecD{{{p_ep}}}, {float(p0_em)}, {float(p0_ep)})")
+
+    # every value once per configuration, with the configuration index and its weight
+    for column in sorted({entry["name"] for entry in config.histoList.values()}):
+        df = (df.Define(f"pol_x_{column}", f"topEWK::repeat_values({column}, {n})")
+                .Define(f"pol_y_{column}", f"topEWK::repeat_index({column}, {n})")
+                .Define(f"pol_w_{column}", f"topEWK::repeat_weights({column}, pol_weights)"))
+
+    booked = {}
+    for cut, expression in config.cutList.items():
+        selected     = df.Filter(expression, cut)
+        booked[cut]  = {name: selected.Histo2D(histo2d_model(ROOT, name, entry, n), f"pol_x_{entry['name']}",
+                                               f"pol_y_{entry['name']}", f"pol_w_{entry['name']}")
+                        for name, entry in config.histoList.items()}
+
+    return booked
+
+def write_outputs(ROOT, config, sample, booked, factor):
+
+    """
+    Writes one <sample>_<cut>_polhisto.root file per cut, the y bins labelled with the configurations.
+    Parameters:
+    - ROOT: module, the ROOT module.
+    - config: module, final stage configuration.
+    - sample: str, name of the sample.
+    - booked: dict, output of book_polarizations() after the event loop.
+    - factor: float, output of weighted_final.scale_factor().
+    Returns:
+    - yields: dict, {cut: list of the integral of the first histogram per configuration}.
+    """
+
+    yields = {}
+    for cut, histograms in booked.items():
+        output = ROOT.TFile(os.path.join(config.outputDir, f"{sample}_{cut}_polhisto.root"), "RECREATE")
+
+        for name, result in histograms.items():
+            hist = result.GetValue()
+            hist.Scale(factor)
+            for k, (p_em, p_ep) in enumerate(config.polarizations):
+                hist.GetYaxis().SetBinLabel(k + 1, polarization_label(p_em, p_ep))
+            hist.Write(name)
+
+            yields.setdefault(cut, [hist.Integral(0, hist.GetNbinsX() + 1, k + 1, k + 1) for k in range(len(config.polarizations))])
+
+        output.Close()
+
+    return yields
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the final-stage histograms for several beam polarizations in one event loop per sample.")
+    parser.add_argument("config", nargs="?", default="analysis/analysis_final.py", help="final stage configuration")
+    args = parser.parse_args()
+
+    config  = load_config(args.config)
+    factors = check_config(config, list(config.processList))
+
+    import ROOT
+    ROOT.gROOT.SetBatch(True)
+    ROOT.EnableImplicitMT(getattr(config, "nCPUS", 1))
+    ROOT.gInterpreter.Declare(f'#include "{os.path.abspath(polarization_header)}"')
+
+    frames = []
+    booked = {}
+
+    for sample in config.processList:
+        files = sample_files(config.inputDir, sample)
+        if not files:
+            print(f"Warning: no input files for {sample}, skipped")
+            continue
+
+        df = ROOT.RDataFrame("events", files)
+        frames.append(df)
+        booked[sample] = book_polarizations(ROOT, df, config)
+
+    # one event loop per sample, the samples run concurrently
+    start = time.perf_counter()
+    ROOT.RDF.RunGraphs([result for sample in booked.values() for histograms in sample.values() for result in histograms.values()])
+    print(f"Filled {len(config.polarizations)} polarizations x {len(config.cutList)} cuts x {len(config.histoList)} histograms "
+          f"for {len(booked)} samples in {time.perf_counter() - start:.1f} s\n")
+
+    os.makedirs(config.outputDir, exist_ok=True)
+    labels = [polarization_label(p_em, p_ep) for p_em, p_ep in config.polarizations]
+    print(f"{'sample':<60} {'cut':<9} " + " ".join(f"{label:>26}" for label in labels))
+
+    for sample, histograms in booked.items():
+        yields = write_outputs(ROOT, config, sample, histograms, factors[sample])
+        for cut, values in yields.items():
+            print(f"{sample:<60} {cut:<9} " + " ".join(f"{value:>26.1f}" for value in values))
@@ -0,0 +1,228 @@
+# importing packages
+import os
+import sys
+import glob
+import json
+import uuid
+import atexit
+
+# header with the C++ counters, declared only when profiling is switched on
+profiler_header = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis", "profiler.h")
+
+# instrumented Defines/Filters of this process: (kind, column, counter id)
+registry = []
+
+# wrapping one expression
+def timed_expression(expression, counter):
+
+    """
+    Wraps an RDataFrame expression so that its evaluation is timed by topEWK::profiler::timed.
+    Expressions written as function bodies (containing 'return') are wrapped as they are.
+    Parameters:
+    - expression: str, the Define or Filter expression.
+    - counter: int, id returned by topEWK::profiler::add().
+    Returns:
+    - expression: str, the instrumented expression.
+    """
+
+    body = expression.strip()
+
+    if "return" not in body:
+        body = f"return {body}"
+    if not body.endswith(";"):
+        body += ";"
+
+    return f"return topEWK::profiler::timed({counter}, [&]() {{ {body} }});"
+
+class ProfiledFrame():
+
+    """
+    Wrapper around an RDataFrame node that instruments every Define, Redefine and Filter
+    and forwards everything else to the node.
+    """
+
+    def __init__(self, df):
+        self.df = df
+
+    def _register(self, kind, column):
+        import ROOT
+
+        counter = int(ROOT.topEWK.profiler.add())
+        registry.append((kind, column, counter))
+
+        return counter
+
+    def Define(self, name, expression):
+        counter = self._register("Define", name)
+        return ProfiledFrame(self.df.Define(name, timed_expression(expression, counter)))
+
+    def Redefine(self, name, expression):
+        counter = self._register("Redefine", name)
+        return ProfiledFrame(self.df.Redefine(name, timed_expression(expression, counter)))
+
+    def Filter(self, expression, name=""):
+        counter = self._register("Filter", name or expression)
+        return ProfiledFrame(self.df.Filter(timed_expression(expression, counter), name))
+
+    def __getattr__(self, attribute):
+        value = getattr(self.df, attribute)
+
+        if not callable(value):
+            return value
+
+        # new dataframe nodes (Alias, Range, ...) stay instrumented
+        def call(*args, **kwargs):
+            result = value(*args, **kwargs)
+            return ProfiledFrame(result) if hasattr(result, "Define") and hasattr(result, "Filter") else result
+
+        return call
+
+# switching instrumentation on for a stage
+def instrument(df, report_file):
+
+    """
+    Starts instrumenting a dataframe if a report file is configured. With report_file set to None
+    the dataframe is returned untouched, so the stage runs exactly as without the profiler.
+    Parameters:
+    - df: RDataFrame node the stage starts from.
+    - report_file: str, path of the merged JSON report, every process writes its own part next to
+      it when it ends, or None.
+    Returns:
+    - df: ProfiledFrame wrapping the node, or the node itself.
+    """
+
+    if report_file is None:
+        return df
+
+    import ROOT
+    ROOT.gInterpreter.Declare(f'#include "{os.path.abspath(profiler_header)}"')
+
+    if not registry:
+        atexit.register(write_report, report_file)
+
+    return ProfiledFrame(df)
+
+def unwrap(df):
+
+    """
+    Returns the plain RDataFrame node behind a ProfiledFrame, to be handed back to FCCAnalyses.
+    Parameters:
+    - df: ProfiledFrame or RDataFrame node.
+    Returns:
+    - df: RDataFrame node.
+    """
+
+    return df.df if isinstance(df, ProfiledFrame) else df
+
+# collecting and writing the measurements
+def collect():
+
+    """
+    Reads the counters of every instrumented Define/Filter, summing columns registered more than
+    once (e.g. one graph per sample).
+    Returns:
+    - rows: list of dict, one per column, sorted by total wall time.
+    """
+
+    import ROOT
+
+    rows = {}
+
+    for kind, column, counter in registry:
+        row = rows.setdefault((kind, column), {"kind": kind, "column": column, "seconds": 0.0,
+                                               "calls": 0, "elements": 0, "bytes": 0})
+        row["seconds"]  += ROOT.topEWK.profiler.nanoseconds(counter) * 1e-9
+        row["calls"]    += ROOT.topEWK.profiler.calls(counter)
+        row["elements"] += ROOT.topEWK.profiler.elements(counter)
+        row["bytes"]    += ROOT.topEWK.profiler.bytes(counter)
+
+    return sorted(rows.values(), key=lambda row: row["seconds"], reverse=True)
+
+def print_report(rows):
+
+    """
+    Prints the profile as a table sorted by wall time.
+    Parameters:
+    - rows: list of dict, output of collect().
+    """
+
+    total = sum(row["seconds"] for row in rows) or 1.0
+
+    print(f"{'kind':<9} {'column':<28} {'time [s]':>9} {'share':>6} {'calls':>11} {'us/call':>8} {'elem/call':>9} {'MB out':>8}")
+
+    for row in rows:
+        calls = row["calls"] or 1
+        print(f"{row['kind']:<9} {row['column']:<28} {row['seconds']:>9.3f} {row['seconds'] / total:>6.1%} "
+              f"{row['calls']:>11} {row['seconds'] / calls * 1e6:>8.2f} {row['elements'] / calls:>9.2f} {row['bytes'] / 1e6:>8.1f}")
+
+def write_report(report_file):
+
+    """
+    Writes the profile of this process to a report of its own next to report_file
+    (<name>.<id>.json), so that parallel chunks and batch jobs do not overwrite each other, and
+    prints it. Nothing is written if no event loop ran.
+    Parameters:
+    - report_file: str, path of the merged JSON report.
+    """
+
+    rows = collect()
+
+    if not any(row["calls"] for row in rows):
+        return
+
+    root, ext = os.path.splitext(report_file)
+    os.makedirs(os.path.dirname(os.path.abspath(report_file)), exist_ok=True)
+    with open(f"{root}.{uuid.uuid4().hex}{ext}", "w") as f:
+        json.dump(rows, f, indent=2)
+
+    print_report(rows)
+
+def report_parts(report_file):
+
+    """
+    Lists the per-process reports written next to a report file (<name>.<id>.json).
+    Parameters:
+    - report_file: str, path of the merged JSON report.
+    Returns:
+    - parts: list of str, paths of the per-process reports.
+    """
+
+    root, ext = os.path.splitext(report_file)
+
+    return sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+def merge_reports(report_file, write=False):
+
+    """
+    Sums the per-process reports and the report already in report_file, column by column.
+    Parameters:
+    - report_file: str, path of the merged JSON report.
+    - write: bool, write the sum to report_file and remove the merged parts (not done while jobs
+      of a run may still be writing them).
+    Returns:
+    - rows: list of dict, as collect(), sorted by total wall time.
+    """
+
+    parts = report_parts(report_file)
+    rows  = {}
+
+    for path in ([report_file] if os.path.isfile(report_file) else []) + parts:
+        with open(path) as f:
+            for part in json.load(f):
+                row = rows.setdefault((part["kind"], part["column"]), {"kind": part["kind"], "column": part["column"],
+                                                                       "seconds": 0.0, "calls": 0, "elements": 0, "bytes": 0})
+                for key in ["seconds", "calls", "elements", "bytes"]:
+                    row[key] += part[key]
+
+    rows = sorted(rows.values(), key=lambda row: row["seconds"], reverse=True)
+
+    if write and parts:
+        with open(report_file, "w") as f:
+            json.dump(rows, f, indent=2)
+        for path in parts:
+            os.remove(path)
+
+    return rows
+
+if __name__ == "__main__":
+    print_report(merge_reports(sys.argv[1], write=True))
@@ -0,0 +1,186 @@
+# importing packages
+import os
+import sys
+import argparse
+import numpy as np
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config
+from hist_cube import load_cubes
+
+# smallest number of effective MC events (sum(w)^2 / sum(w^2)) of a merged bin
+default_min_entries = 100
+
+# cost of every merged bin, in units of the separation; 0 leaves the choice to the MC-stat correction
+default_bin_penalty = 0.0
+
+# widest merged bin considered, in original bins, which keeps the search linear in the bins
+default_window = 30
+
+# inputs of the optimizer
+def channel_sums(cube, lumi, selection, reference='SM'):
+
+    """
+    Sums the processes of one selection into the SM histogram, its MC variance, and the deviation
+    of every other variation from it with its MC variance (the variation and SM samples taken as
+    independent).
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    - selection: str, selection of the histograms.
+    - reference: str, SM variation.
+    Returns:
+    - sm: numpy array, SM yields per bin (without flow bins).
+    - variance: numpy array, squared MC errors of sm.
+    - deviations: numpy array, one row per variation, shape (V, bins).
+    - deviation_variances: numpy array, squared MC errors of deviations, shape (V, bins).
+    - variations: list of str, names of the rows of deviations.
+    """
+
+    values    = cube["values"][:, 1:-1] * lumi * cube["rates"][:, None]
+    variances = cube["variances"][:, 1:-1] * (lumi * cube["rates"][:, None]) ** 2
+
+    rows       = {}
+    for i, (process, variation, sel) in enumerate(cube["keys"]):
+        if sel == selection:
+            rows.setdefault(variation, []).append(i)
+
+    sm         = values[rows[reference]].sum(axis=0)
+    variance   = variances[rows[reference]].sum(axis=0)
+    variations = sorted(variation for variation in rows if variation != reference)
+    deviations = np.array([values[rows[variation]].sum(axis=0) - sm for variation in variations]).reshape(-1, len(sm))
+    deviation_variances = np.array([variances[rows[variation]].sum(axis=0) + variance for variation in variations]).reshape(-1, len(sm))
+
+    return sm, variance, deviations, deviation_variances, variations
+
+# searching the merged bins
+def optimize_edges(edges, sm, variance, deviations, deviation_variances, min_entries=default_min_entries,
+                   window=default_window, bin_penalty=default_bin_penalty):
+
+    """
+    Finds the merging of adjacent bins that maximizes the expected separation
+    sum_bins [sum_k (D_k^2 - s_k^2) / B - bin_penalty] while every merged bin keeps at least
+    min_entries effective MC events. D_k^2 / B alone (the chi2 of the deviations D_k against the SM
+    yield B) can only shrink when bins are merged, so it always picks the finest binning; removing
+    the MC-stat variance s_k^2 of D_k makes each bin's term an unbiased estimate, so that bins whose
+    deviation is MC noise no longer add to it, and bin_penalty charges every bin on top. Merged-bin
+    sums come from cumulative sums, and a dynamic programme over the bin edges with merged bins of
+    at most window original bins runs in O(bins * window). Empty regions (no SM, no deviation) may
+    form bins of their own.
+    Parameters:
+    - edges: numpy array, original bin edges.
+    - sm: numpy array, SM yields per bin.
+    - variance: numpy array, squared MC errors of sm.
+    - deviations: numpy array, deviations per variation, shape (V, bins).
+    - deviation_variances: numpy array, squared MC errors of deviations, shape (V, bins).
+    - min_entries: float, smallest effective number of MC events of a merged bin.
+    - window: int, widest merged bin in original bins (the whole range if no solution is found).
+    - bin_penalty: float, separation a merged bin has to bring to be worth keeping.
+    Returns:
+    - new_edges: numpy array, subset of edges.
+    - separation: float, expected separation of the merged binning.
+    """
+
+    n_bins = len(sm)
+    cum_b  = np.concatenate([[0.0], np.cumsum(sm)])
+    cum_v  = np.concatenate([[0.0], np.cumsum(variance)])
+    cum_d  = np.concatenate([np.zeros((len(deviations), 1)), np.cumsum(deviations, axis=1)], axis=1)
+    cum_s  = np.concatenate([np.zeros((len(deviations), 1)), np.cumsum(deviation_variances, axis=1)], axis=1)
+
+    for width in [window, n_bins]:
+        best = np.full(n_bins + 1, -np.inf)
+        back = np.zeros(n_bins + 1, dtype=int)
+        best[0] = 0.0
+
+        for j in range(1, n_bins + 1):
+            i = np.arange(max(0, j - width), j)
+
+            b = cum_b[j] - cum_b[i]
+            v = cum_v[j] - cum_v[i]
+            d = cum_d[:, j][:, None] - cum_d[:, i]
+            s = cum_s[:, j][:, None] - cum_s[:, i]
+
+            # a merged bin needs enough MC statistics, or must be completely empty
+            empty  = (b == 0) & (v == 0) & (np.abs(d).sum(axis=0) == 0)
+            enough = (b > 0) & (b ** 2 >= min_entries * v)
+            gain   = np.where(b > 0, (d ** 2 - s).sum(axis=0) / np.where(b > 0, b, 1.0), 0.0) - bin_penalty
+            score  = np.where(enough | empty, best[i] + gain, -np.inf)
+
+            back[j] = i[np.argmax(score)]
+            best[j] = score.max()
+
+        if np.isfinite(best[n_bins]):
+            break
+
+    if not np.isfinite(best[n_bins]):
+        raise ValueError(f"no binning has {min_entries} effective MC events in every bin")
+
+    cuts = [n_bins]
+    while cuts[-1] > 0:
+        cuts.append(back[cuts[-1]])
+
+    return np.asarray(edges)[cuts[::-1]], best[n_bins]
+
+# writing the histoList
+def format_histo_list(histo_list):
+
+    """
+    Formats a histoList, with the merged bins as a 'bins' list of edges next to the uniform bins
+    (bin, xmin, xmax). The fccanalysis final stage reads only the uniform bins of 'name' entries and
+    ignores 'bins'; weighted_final.py and polarization_final.py fill the merged bins directly. The
+    merged edges are edges of the uniform bins, so histograms filled by fccanalysis are brought to
+    them exactly by hist_cube.rebin_cube().
+    Parameters:
+    - histo_list: dict, histoList entries.
+    Returns:
+    - text: str, python source of the histoList.
+    """
+
+    width = max(len(name) for name in histo_list) + 3
+    lines = ["histoList = {"]
+
+    for name, entry in histo_list.items():
+        fields = ", ".join(f"{repr(key)}:{[float(f'{edge:.6g}') for edge in value] if key == 'bins' else repr(value)}"
+                           for key, value in entry.items())
+        lines.append(f"    {repr(name) + ':':<{width}} {{{fields}}},")
+
+    lines.append("}")
+
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge histogram bins to maximize the expected separation of the deviations from the SM.")
+    parser.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    parser.add_argument("--config", default="analysis/analysis_final.py", help="final stage configuration with the histoList")
+    parser.add_argument("--selection", default="TestSel", help="selection the binning is optimized for")
+    parser.add_argument("--lumi", type=float, default=None, help="luminosity [pb^-1], defaults to the one of the final stage")
+    parser.add_argument("--min-entries", type=float, default=default_min_entries, help="smallest effective MC events per merged bin")
+    parser.add_argument("--window", type=int, default=default_window, help="widest merged bin in original bins")
+    parser.add_argument("--bin-penalty", type=float, default=default_bin_penalty, help="separation every merged bin has to bring")
+    args = parser.parse_args()
+
+    config          = load_config(args.config)
+    cubes, int_lumi = load_cubes(args.cubes)
+    histo_list      = {}
+
+    print(f"{'variable':<24} {'bins':>5} {'new':>5} {'separation':>11} {'unmerged':>11}")
+
+    for name, entry in config.histoList.items():
+        if entry["name"] not in cubes:
+            histo_list[name] = entry
+            continue
+
+        cube = cubes[entry["name"]]
+        sm, variance, deviations, deviation_variances, variations = channel_sums(cube, args.lumi or int_lumi, args.selection)
+        edges, separation = optimize_edges(cube["edges"], sm, variance, deviations, deviation_variances,
+                                           args.min_entries, args.window, args.bin_penalty)
+
+        was = ((deviations ** 2 - deviation_variances) / np.where(sm > 0, sm, np.inf)).sum() - args.bin_penalty * len(sm)
+        print(f"{name:<24} {len(sm):>5} {len(edges) - 1:>5} {separation:>11.2f} {was:>11.2f}")
+
+        # the uniform bins are kept for fccanalysis, which needs bin, xmin and xmax for 'name' entries
+        histo_list[name] = dict(entry, bins=edges)
+
+    print()
+    print(format_histo_list(histo_list))
@@ -0,0 +1,221 @@
+# importing packages
+import os
+import sys
+import json
+import argparse
+import subprocess
+import uproot
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files, file_checksum
+from schema_check import check_schema, print_problems
+from output_profiles import recompress
+
+# splitting the inputs of a sample into chunks
+def plan_sample(config, input_dir, sample):
+
+    """
+    Splits the input files of a sample into the number of chunks of its processList entry, in
+    contiguous groups as FCCAnalyses does.
+    Parameters:
+    - config: module, stage configuration.
+    - input_dir: str, stage input directory.
+    - sample: str, sample name.
+    Returns:
+    - chunks: list of dict, {"index", "inputs", "output", "marker"} per chunk.
+    """
+
+    files    = sample_files(input_dir, sample)
+    n_chunks = max(1, min(config.processList[sample].get("chunks", 1), len(files)))
+    chunks   = []
+
+    for index in range(n_chunks):
+        inputs = files[len(files) * index // n_chunks: len(files) * (index + 1) // n_chunks]
+
+        if n_chunks == 1:
+            output = os.path.join(config.outputDir, f"{sample}.root")
+            marker = os.path.join(config.outputDir, f".{sample}.done")
+        else:
+            output = os.path.join(config.outputDir, sample, f"chunk{index}.root")
+            marker = os.path.join(config.outputDir, sample, f".chunk{index}.done")
+
+        chunks.append({"index": index, "inputs": inputs, "output": output, "marker": marker})
+
+    return chunks
+
+# completion markers
+def chunk_complete(chunk):
+
+    """
+    Checks whether a chunk has a completion marker for the same inputs and an output file that
+    still matches the checksum recorded in the marker.
+    Parameters:
+    - chunk: dict, entry of plan_sample().
+    Returns:
+    - complete: bool, True if the chunk can be skipped.
+    """
+
+    if not os.path.isfile(chunk["marker"]) or not os.path.isfile(chunk["output"]):
+        return False
+
+    with open(chunk["marker"]) as f:
+        marker = json.load(f)
+
+    return (marker["inputs"] == chunk["inputs"] and
+            marker["bytes"] == os.path.getsize(chunk["output"]) and
+            marker["sha256"] == file_checksum(chunk["output"]))
+
+def write_marker(chunk):
+
+    """
+    Records a finished chunk: its inputs, number of entries, size and checksum of the output.
+    Parameters:
+    - chunk: dict, entry of plan_sample().
+    """
+
+    with uproot.open(chunk["output"]) as file:
+        entries = file["events"].num_entries
+
+    marker = {
+        "index":   chunk["index"],
+        "inputs":  chunk["inputs"],
+        "entries": entries,
+        "bytes":   os.path.getsize(chunk["output"]),
+        "sha256":  file_checksum(chunk["output"]),
+    }
+
+    # written next to the output and renamed, so a marker is never half-written
+    temporary = chunk["marker"] + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(marker, f, indent=2)
+    os.replace(temporary, chunk["marker"])
+
+# running one chunk
+def run_chunk(config_path, chunk):
+
+    """
+    Runs fccanalysis on the inputs of one chunk, applies the outputProfile of the stage and writes
+    the completion marker. Chunks run in separate processes, as the recompression does ROOT I/O.
+    Parameters:
+    - config_path: str, path to the stage configuration.
+    - chunk: dict, entry of plan_sample().
+    Returns:
+    - ok: bool, True if the chunk finished.
+    """
+
+    os.makedirs(os.path.dirname(chunk["output"]), exist_ok=True)
+
+    if os.path.isfile(chunk["marker"]):
+        os.remove(chunk["marker"])
+
+    command = ["fccanalysis", "run", config_path, "--files-list", *chunk["inputs"], "--output", chunk["output"]]
+    result  = subprocess.run(command)
+
+    if result.returncode != 0 or not os.path.isfile(chunk["output"]):
+        print(f"Chunk {chunk['output']} failed (exit code {result.returncode})")
+        return False
+
+    profile = getattr(load_config(config_path), "outputProfile", "default")
+    if profile != "default":
+        temporary = chunk["output"] + ".tmp.root"
+        recompress(chunk["output"], temporary, profile, narrow=False)
+        os.replace(temporary, chunk["output"])
+
+    write_marker(chunk)
+
+    return True
+
+# checking the chunks before merging
+def verify_sample(chunks):
+
+    """
+    Checks that every planned chunk of a sample has a valid marker for its inputs and output, and
+    that no other chunk outputs are lying around in the sample directory.
+    Parameters:
+    - chunks: list of dict, output of plan_sample().
+    Returns:
+    - problems: list of str, empty if the sample can be merged.
+    """
+
+    problems = []
+    outputs  = {chunk["output"] for chunk in chunks}
+
+    for chunk in chunks:
+        if not chunk_complete(chunk):
+            problems.append(f"chunk {chunk['index']} missing or corrupt ({chunk['output']})")
+
+    if len(chunks) > 1:
+        directory = os.path.dirname(chunks[0]["output"])
+        extra     = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                           if name.endswith(".root") and os.path.join(directory, name) not in outputs)
+        problems += [f"unexpected chunk output {path}" for path in extra]
+
+    return problems
+
+def merge_sample(config, sample, chunks):
+
+    """
+    Merges the chunks of a sample into outputDir/<sample>.root with hadd, after verify_sample().
+    Parameters:
+    - config: module, stage configuration.
+    - sample: str, sample name.
+    - chunks: list of dict, output of plan_sample().
+    Returns:
+    - ok: bool, True if the sample was merged (or has a single chunk).
+    """
+
+    problems = verify_sample(chunks)
+
+    if problems:
+        print(f"{sample}: not merged")
+        for problem in problems:
+            print(f"  - {problem}")
+        return False
+
+    if len(chunks) == 1:
+        return True
+
+    merged = os.path.join(config.outputDir, f"{sample}.root")
+    result = subprocess.run(["hadd", "-f", merged, *[chunk["output"] for chunk in chunks]])
+
+    return result.returncode == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stage chunk by chunk with completion markers, so interrupted runs can resume.")
+    parser.add_argument("config", help="stage configuration, e.g. analysis/analysis_stage2.py")
+    parser.add_argument("--input-dir", default=None, help="input directory, defaults to inputDir of the configuration")
+    parser.add_argument("--resume", action="store_true", help="skip chunks that are complete and valid")
+    parser.add_argument("--jobs", type=int, default=1, help="chunks run at the same time")
+    parser.add_argument("--merge", action="store_true", help="merge the chunks of every sample at the end")
+    parser.add_argument("--no-check", action="store_true", help="skip the schema check before running")
+    args = parser.parse_args()
+
+    config    = load_config(args.config)
+    input_dir = args.input_dir or getattr(config, "inputDir", None)
+
+    if input_dir is None:
+        sys.exit(f"{args.config} has no inputDir, pass --input-dir")
+
+    if not args.no_check:
+        problems, schemas = check_schema(args.config, input_dir)
+        if problems:
+            print_problems(problems, schemas)
+            sys.exit(1)
+
+    plan    = {sample: plan_sample(config, input_dir, sample) for sample in config.processList}
+    pending = [chunk for chunks in plan.values() for chunk in chunks if not (args.resume and chunk_complete(chunk))]
+
+    print(f"{len(pending)} of {sum(len(chunks) for chunks in plan.values())} chunks to run")
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(partial(run_chunk, args.config), pending))
+
+    failed = results.count(False)
+    if failed:
+        sys.exit(f"{failed} chunk(s) failed, run again with --resume")
+
+    if args.merge and not all([merge_sample(config, sample, chunks) for sample, chunks in plan.items()]):
+        sys.exit(1)
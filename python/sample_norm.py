@@ -40,11 +40,31 @@ xsec_variation['tv_ttAdown_'] = 1.051
 xsec_variation['vr_ttZup_']   = 0.954
 xsec_variation['vr_ttZdown_'] = 1.065
 
+## coupling values of the up variations (the down variations are at minus these values)
+couplings = {
+             'ta_ttA' : 0.424237,
+             'tv_ttA' : 0.010606,
+             'vr_ttZ' : 0.17638
+            }
+
+## sample name of a process under given parameters (variation '' is the standard model)
+def sample_name(process, variation):
+    return 'wzp6_ee_SM_tt_' + process + '_noCKMmix_keepPolInfo_' + variation + 'ecm365'
+
+## process and variation of a sample name, inverse of sample_name()
+def parse_sample(sample):
+    for process in BRs:
+        for variation in xsec_variation:
+            if sample == sample_name(process, variation):
+                return process, variation
+    raise KeyError(f'{sample} is not a known ttbar sample')
+
 ## number of events expected from each process under given parameters
 N_expect = {}
 for process in BRs:
     for variation in xsec_variation:
-        sample = 'wzp6_ee_SM_tt_' + process + '_noCKMmix_keepPolInfo_' + variation + 'ecm365' 
+        sample = sample_name(process, variation)
         N_expect[sample] = N_tot * xsec_variation[variation] * BRs[process]
 
-print(N_expect)
\ No newline at end of file
+if __name__ == '__main__':
+    print(N_expect)
@@ -0,0 +1,164 @@
+# importing packages
+import os
+import sys
+import json
+import difflib
+import argparse
+import uproot
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, config_columns, sample_files
+from friend_trees import needs_gen, friend_file, reco_subdir
+
+# tree written by FCCAnalyses and read back by the following stage
+tree_name = "events"
+
+# schemas are cached per input directory, keyed by the file they were read from
+cache_file = os.path.join(os.path.expanduser("~"), ".cache", "topEWK", "schema_cache.json")
+
+# reading the list of columns from a file
+def read_schema(path):
+
+    """
+    Reads the column names of the events tree of a file, including EDM4hep sub-branches.
+    Parameters:
+    - path: str, path to the .root file.
+    Returns:
+    - columns: list of str, sorted column names.
+    """
+
+    with uproot.open(path) as file:
+        tree = file[tree_name]
+        columns = set(tree.keys(recursive=False)) | set(tree.keys(recursive=True, full_paths=False))
+
+    return sorted(columns)
+
+# reading schemas through the cache
+def cached_schema(path, cache):
+
+    """
+    Returns the schema of a file, reading it only if the cached copy is missing or stale.
+    Parameters:
+    - path: str, path to the .root file.
+    - cache: dict, schema cache loaded from cache_file (updated in place).
+    Returns:
+    - columns: list of str, column names.
+    """
+
+    path      = os.path.abspath(path)
+    directory = cache.setdefault(os.path.dirname(path), {})
+    stat      = os.stat(path)
+    entry     = directory.get(path)
+
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        return entry["columns"]
+
+    columns = read_schema(path)
+    directory[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "columns": columns}
+
+    return columns
+
+# reading and writing the schema cache
+def load_cache():
+    if os.path.isfile(cache_file):
+        with open(cache_file) as f:
+            return json.load(f)
+    return {}
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, "w") as f:
+        json.dump(cache, f)
+
+# comparing the columns of a configuration with the input files
+def check_schema(config_path, input_dir=None, use_cache=True):
+
+    """
+    Compares the columns referenced by a stage configuration with the schema of one input file
+    per sample in its processList.
+    Parameters:
+    - config_path: str, path to the stage configuration.
+    - input_dir: str, overrides the inputDir of the configuration (needed for stage1).
+    - use_cache: bool, whether to reuse schemas cached by earlier checks.
+    Returns:
+    - problems: dict, {sample: {column: [places where it is referenced]}} for missing columns,
+      with None as value for samples that have no input file.
+    - schemas: dict, {sample: list of columns} read for the samples with problems.
+    """
+
+    config    = load_config(config_path)
+    input_dir = input_dir or getattr(config, "inputDir", None)
+
+    if input_dir is None:
+        raise ValueError(f"{config_path} has no inputDir, pass one explicitly")
+
+    required, _ = config_columns(config)
+    cache       = load_cache() if use_cache else {}
+    problems    = {}
+    schemas     = {}
+
+    for sample in config.processList:
+        files = sample_files(input_dir, sample)
+
+        if not files:
+            problems[sample] = None
+            continue
+
+        path   = files[0]
+        schema = set(cached_schema(path, cache))
+
+        # split stage1 outputs: the gen friend is attached when the configuration needs it
+        if reco_subdir in path.split(os.sep) and needs_gen(config) and os.path.isfile(friend_file(path)):
+            schema |= set(cached_schema(friend_file(path), cache))
+
+        missing = {column: places for column, places in required.items() if column not in schema}
+
+        if missing:
+            problems[sample] = missing
+            schemas[sample]  = sorted(schema)
+
+    save_cache(cache)
+
+    return problems, schemas
+
+# printing the schema differences
+def print_problems(problems, schemas):
+
+    """
+    Prints missing columns per sample, with close matches from the input schema.
+    Parameters:
+    - problems: dict, missing columns per sample from check_schema().
+    - schemas: dict, input columns per sample from check_schema().
+    """
+
+    for sample, missing in problems.items():
+        if missing is None:
+            print(f"{sample}: no input file found")
+            continue
+
+        print(f"{sample}: {len(missing)} missing column(s)")
+
+        for column, places in sorted(missing.items()):
+            line = f"  - {column:<25} used by {', '.join(places)}"
+
+            matches = difflib.get_close_matches(column, schemas[sample], n=2)
+            if matches:
+                line += f"  (did you mean {', '.join(matches)}?)"
+
+            print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the input files provide every column a stage configuration uses.")
+    parser.add_argument("config", help="stage configuration, e.g. analysis/analysis_stage2.py")
+    parser.add_argument("--input-dir", default=None, help="input directory, defaults to inputDir of the configuration")
+    parser.add_argument("--no-cache", action="store_true", help="re-read the schemas even if cached")
+    args = parser.parse_args()
+
+    problems, schemas = check_schema(args.config, args.input_dir, use_cache=not args.no_cache)
+
+    if problems:
+        print_problems(problems, schemas)
+        sys.exit(1)
+
+    print(f"Schema check passed for {args.config}")
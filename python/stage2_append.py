@@ -0,0 +1,174 @@
+# importing packages
+import os
+import sys
+import json
+import argparse
+import datetime
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, expression_columns, sample_files
+
+# manifest kept in the stage2 outputDir listing every appended version
+manifest_name = "append_manifest.json"
+
+# tree name shared by the stage2 outputs and their sidecars
+tree_name = "events"
+
+# listing the stage2 output files of a configuration
+def stage_output_files(config):
+
+    """
+    Lists the stage2 outputs of every sample, either <sample>.root or <sample>/chunk<i>.root.
+    Parameters:
+    - config: module, stage2 configuration.
+    Returns:
+    - files: list of str, paths relative to outputDir.
+    """
+
+    return [os.path.relpath(path, config.outputDir)
+            for sample in config.processList for path in sample_files(config.outputDir, sample)]
+
+# reading and writing the manifest
+def load_manifest(output_dir):
+
+    """
+    Reads the append manifest of a stage2 outputDir.
+    Parameters:
+    - output_dir: str, stage2 outputDir.
+    Returns:
+    - manifest: dict, {"versions": [...]}, empty if nothing was appended yet.
+    """
+
+    path = os.path.join(output_dir, manifest_name)
+
+    if not os.path.isfile(path):
+        return {"versions": []}
+
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def version_dir(output_dir, version):
+    return os.path.join(output_dir, f"append_v{version}")
+
+# appending new columns to the stage2 outputs
+def append_columns(config, defines):
+
+    """
+    Computes new columns from the existing stage2 outputs and writes only those columns into
+    sidecar files aligned entry by entry with the outputs (outputDir/append_v<N>/...).
+    Parameters:
+    - config: module, stage2 configuration.
+    - defines: dict, {new column: RDataFrame expression using stage2 output columns}.
+    Returns:
+    - version: dict, the manifest entry of the new version.
+    """
+
+    import ROOT
+
+    output_dir = config.outputDir
+    manifest   = load_manifest(output_dir)
+
+    # appended columns must stay unique across stage2 and all earlier versions
+    existing = set(config.RDFanalysis.output())
+    for entry in manifest["versions"]:
+        existing |= set(entry["columns"])
+
+    clashes = sorted(set(defines) & existing)
+    if clashes:
+        raise ValueError(f"columns already exist in {output_dir}: {', '.join(clashes)}")
+
+    number  = len(manifest["versions"]) + 1
+    version = {
+        "version": number,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "columns": dict(defines),
+        "files":   {},
+    }
+
+    for relative in stage_output_files(config):
+        source  = os.path.join(output_dir, relative)
+        sidecar = os.path.join(version_dir(output_dir, number), relative)
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+
+        # earlier versions are attached so new columns can build on them
+        df, chains = open_with_appended(source, output_dir, manifest)
+
+        for name, expression in defines.items():
+            df = df.Define(name, expression)
+
+        count = df.Count()
+        df.Snapshot(tree_name, sidecar, list(defines))
+
+        expected = chains[0].GetEntries()
+        written_file = ROOT.TFile.Open(sidecar)
+        written      = written_file.Get(tree_name).GetEntries()
+        written_file.Close()
+
+        if not count.GetValue() == expected == written:
+            raise RuntimeError(f"entry mismatch for {relative}: stage2 {expected}, sidecar {written}")
+
+        version["files"][relative] = written
+        print(f"Appended {', '.join(defines)} to {relative} ({written} entries)")
+
+    manifest["versions"].append(version)
+    save_manifest(output_dir, manifest)
+
+    return version
+
+# reading stage2 outputs together with their appended columns
+def open_with_appended(source, output_dir, manifest=None):
+
+    """
+    Builds an RDataFrame over one stage2 output with the sidecars of every appended version
+    attached as friends.
+    Parameters:
+    - source: str, path to the stage2 output.
+    - output_dir: str, stage2 outputDir holding the manifest.
+    - manifest: dict, manifest to use instead of reading it from output_dir.
+    Returns:
+    - df: ROOT.RDataFrame over the output and its sidecars.
+    - chains: list of ROOT.TChain, to be kept alive as long as df is used.
+    """
+
+    import ROOT
+
+    manifest = manifest or load_manifest(output_dir)
+    relative = os.path.relpath(source, output_dir)
+
+    chain = ROOT.TChain(tree_name)
+    chain.Add(source)
+    chains = [chain]
+
+    for entry in manifest["versions"]:
+        if relative not in entry["files"]:
+            continue
+
+        friend = ROOT.TChain(tree_name)
+        friend.Add(os.path.join(version_dir(output_dir, entry["version"]), relative))
+        chain.AddFriend(friend, "")
+        chains.append(friend)
+
+    return ROOT.RDataFrame(chain), chains
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append new columns to existing stage2 outputs as sidecar friend files.")
+    parser.add_argument("config", help="stage2 configuration, e.g. analysis/analysis_stage2.py")
+    parser.add_argument("--define", nargs="+", default=[], metavar="NAME=EXPRESSION",
+                        help="new columns, defaults to appendDefines of the configuration")
+    args = parser.parse_args()
+
+    config  = load_config(args.config)
+    defines = dict(item.split("=", 1) for item in args.define) if args.define else getattr(config, "appendDefines", {})
+
+    if not defines:
+        sys.exit("Nothing to append: pass --define or set appendDefines in the configuration")
+
+    for name, expression in defines.items():
+        print(f"{name} = {expression}  (reads {', '.join(sorted(expression_columns(expression)))})")
+
+    append_columns(config, defines)
@@ -0,0 +1,396 @@
+# importing packages
+import os
+import re
+import ast
+import sys
+import json
+import argparse
+import numpy as np
+import awkward as ak
+import uproot
+from concurrent.futures import ProcessPoolExecutor
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files, expression_columns
+from lepton_selection import selected_fields, cut_defaults
+from output_profiles import storage_type
+from metadata_scan import parameter
+
+# numpy types matching the C++ storage types of output_profiles.dtype_policy
+numpy_types = {
+    "float":        np.float32,
+    "std::int8_t":  np.int8,
+    "std::int16_t": np.int16,
+}
+
+# default number of entries per chunk
+default_step = 200000
+
+# bookkeeping parameters of FCCAnalyses outputs, copied from the input files
+bookkeeping = ["eventsProcessed", "sumOfWeights"]
+
+# lepton collections of stage2 and their count columns
+collections = [("muon", "n_muons_pass", "muonCuts"), ("electron", "n_electrons_pass", "electronCuts")]
+
+# lepton selection
+def select_leptons(events, collection, counter, cuts):
+
+    """
+    Applies the stage2 lepton cuts to one collection, as lepton_selection.h does for RDataFrame.
+    Parameters:
+    - events: awkward Array, stage1 columns of a chunk.
+    - collection: str, column prefix of the collection, e.g. 'muon'.
+    - counter: str, name of the count column, e.g. 'n_muons_pass'.
+    - cuts: dict, {cut name: value} with names from lepton_selection.cut_defaults.
+    Returns:
+    - columns: dict, {column name: array} with the mask, selected fields and count.
+    """
+
+    cuts = {**cut_defaults, **cuts}
+    px   = events[f"{collection}_px"]
+    py   = events[f"{collection}_py"]
+    pt   = np.sqrt(px * px + py * py)
+
+    mask = events[f"{collection}_energy"] > cuts["min_energy"]
+
+    # optional cuts only touch their columns when they are set (pt > 0 would drop zero and nan pt)
+    if cuts["min_pt"] > 0:
+        mask = mask & (pt > cuts["min_pt"])
+    for cut, field in (("max_abs_eta", "eta"), ("max_abs_d0", "d0"), ("max_abs_z0", "z0")):
+        if np.isfinite(cuts[cut]):
+            mask = mask & (abs(events[f"{collection}_{field}"]) < cuts[cut])
+
+    columns = {f"{collection}_pass": mask}
+
+    for field in selected_fields:
+        source = pt if field == "pt" else events[f"{collection}_{field}"]
+        columns[f"{collection}_pass_{field}"] = source[mask]
+
+    columns[f"{collection}_pass_charge"] = events[f"{collection}_charge"][mask]
+    columns[counter] = ak.num(columns[f"{collection}_pass_energy"], axis=1)
+
+    return columns
+
+# evaluating the stage2Filters expressions on awkward arrays
+class ElementwiseExpression(ast.NodeTransformer):
+
+    """
+    Turns a filter expression parsed as python into one evaluated column-wise: and/or/not become
+    &, |, ~ (keeping the grouping of the expression), x.at(i) becomes element(x, i) and
+    x.size() becomes size(x). Other function calls are not supported.
+    """
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op    = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        value = node.values[0]
+        for other in node.values[1:]:
+            value = ast.BinOp(left=value, op=op, right=other)
+        return value
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Attribute) and node.func.attr == "at" and len(node.args) == 1:
+            return ast.Call(func=ast.Name(id="element", ctx=ast.Load()), args=[node.func.value, node.args[0]], keywords=[])
+        if isinstance(node.func, ast.Attribute) and node.func.attr == "size" and not node.args:
+            return ast.Call(func=ast.Name(id="size", ctx=ast.Load()), args=[node.func.value], keywords=[])
+        if isinstance(node.func, ast.Name) and node.func.id == "abs":
+            return node
+        raise ValueError(f"'{ast.unparse(node)}' is not supported by the awkward stage2, use the RDataFrame one")
+
+def element(values, index):
+
+    """
+    Element index of every event, NaN (failing every comparison) where the event has fewer.
+    """
+
+    return ak.fill_none(ak.pad_none(values, index + 1, axis=1)[:, index], np.nan)
+
+def filter_mask(expression, columns, n_events):
+
+    """
+    Evaluates a C++ filter expression of stage2Filters on the columns of a chunk.
+    Parameters:
+    - expression: str, RDataFrame filter expression.
+    - columns: dict-like, {column name: array}.
+    - n_events: int, number of events of the chunk.
+    Returns:
+    - mask: numpy array of bool, shape (n_events,).
+    """
+
+    text = expression.replace("&&", " and ").replace("||", " or ").replace("std::abs", "abs")
+    text = re.sub(r"\btrue\b", "True", re.sub(r"\bfalse\b", "False", text))
+    text = "".join(" not " if char == "!" and following != "=" else char for char, following in zip(text, text[1:] + " "))
+
+    tree = ast.fix_missing_locations(ElementwiseExpression().visit(ast.parse(text.strip(), mode="eval")))
+    mask = eval(compile(tree, expression, "eval"), {"__builtins__": {}, "abs": abs, "element": element, "size": ak.num}, columns)
+
+    return np.broadcast_to(np.asarray(ak.to_numpy(mask) if isinstance(mask, ak.Array) else mask, dtype=bool), (n_events,))
+
+class ChunkColumns(dict):
+
+    """
+    Columns of a chunk: the ones computed by the selection, then the stage1 ones.
+    """
+
+    def __init__(self, computed, events):
+        super().__init__(computed)
+        self.events = events
+
+    def __missing__(self, name):
+        if name not in self.events.fields:
+            raise KeyError(name)
+        return self.events[name]
+
+# stage2 selection of one chunk
+def process_events(events, config):
+
+    """
+    Runs the stage2 selection on a chunk: lepton selection, then every filter of stage2Filters.
+    Parameters:
+    - events: awkward Array, stage1 columns of a chunk.
+    - config: module, stage2 configuration.
+    Returns:
+    - columns: dict, {column name: array} for the selected events, restricted to the output list.
+    """
+
+    computed = {}
+    for collection, counter, cuts in collections:
+        computed.update(select_leptons(events, collection, counter, getattr(config, cuts)))
+
+    columns  = ChunkColumns(computed, events)
+    selected = np.ones(len(events), dtype=bool)
+
+    for name, expression in config.stage2Filters:
+        selected = selected & filter_mask(expression, columns, len(events))
+
+    output = {}
+
+    for name in config.RDFanalysis.output():
+        array = columns[name][selected]
+
+        if storage_type(name) in numpy_types:
+            array = ak.values_astype(array, numpy_types[storage_type(name)])
+
+        output[name] = array
+
+    return output
+
+# stage1 columns read by the selection
+def input_columns(config):
+
+    """
+    Lists the stage1 columns needed by process_events().
+    Parameters:
+    - config: module, stage2 configuration.
+    Returns:
+    - columns: list of str, column names.
+    """
+
+    columns  = set()
+    produced = set()
+
+    for collection, counter, cuts in collections:
+        columns  |= {f"{collection}_{field}" for field in selected_fields + ["charge"] if field != "pt"}
+        produced |= {f"{collection}_pass", counter, f"{collection}_pass_charge"}
+        produced |= {f"{collection}_pass_{field}" for field in selected_fields}
+
+    for name, expression in config.stage2Filters:
+        columns |= expression_columns(expression) - produced
+
+    # everything else in the output list is copied from stage1
+    columns |= {name for name in config.RDFanalysis.output() if name not in produced}
+
+    return sorted(columns)
+
+# layout of the output tree
+def tree_layout(output):
+
+    """
+    Groups the jagged output columns into records that share one counter branch, as uproot writes
+    jagged columns as C arrays with a counter: the selected fields of a lepton collection use its
+    count column (n_muons_pass, n_electrons_pass, stored as int32 by uproot), any other jagged
+    column shares n_<prefix> with the columns of the same prefix (Emiss_* -> n_Emiss).
+    Parameters:
+    - output: dict, output of process_events().
+    Returns:
+    - groups: dict, {group: [column names]} for the jagged columns.
+    - counters: dict, {group: counter branch name}.
+    """
+
+    lepton_groups = {f"{collection}_pass": counter for collection, counter, cuts in collections}
+    groups        = {}
+    counters      = {}
+
+    for name, array in output.items():
+        if array.ndim == 1:
+            continue
+
+        prefix = next((group for group in lepton_groups if name.startswith(group + "_")), name.split("_")[0])
+        groups.setdefault(prefix, []).append(name)
+        counters[prefix] = lepton_groups.get(prefix, f"n_{prefix}")
+
+    return groups, counters
+
+def tree_arrays(output, groups):
+
+    """
+    Packs the columns of a chunk as the branches of tree_layout(), the count columns of the lepton
+    collections being written by their records.
+    Parameters:
+    - output: dict, output of process_events().
+    - groups: dict, output of tree_layout().
+    Returns:
+    - arrays: dict, {branch or group: array}.
+    """
+
+    grouped  = {name for names in groups.values() for name in names}
+    counters = {counter for collection, counter, cuts in collections}
+    arrays   = {name: array for name, array in output.items() if name not in grouped and name not in counters}
+
+    for group, names in groups.items():
+        arrays[group] = ak.zip({name[len(group) + 1:]: output[name] for name in names})
+
+    return arrays
+
+# one unit of work: one input file, read in chunks
+def process_file(task):
+
+    """
+    Reads a stage1 file with uproot in chunks of `step` entries, selects every chunk and appends
+    it to the events tree of the output file. The bookkeeping TParameters of the input are copied
+    to the output (with ROOT, as uproot does not write them).
+    Parameters:
+    - task: tuple, (config path, input file, last entry, step, output file).
+    Returns:
+    - result: tuple, (output file, entries read, entries written, bookkeeping values).
+    """
+
+    config_path, input_file, stop, step, output_file = task
+    config = load_config(config_path)
+
+    read, written = 0, 0
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    with uproot.open(input_file) as source, uproot.recreate(output_file) as file:
+        entries = source["events"].num_entries
+        values  = {name: parameter(source, name) for name in bookkeeping}
+        types   = {name: source.classname_of(name) for name in bookkeeping if name in source}
+
+        for events in source["events"].iterate(input_columns(config), step_size=step, entry_stop=stop):
+            output = process_events(events, config)
+            groups, counters = tree_layout(output)
+            arrays = tree_arrays(output, groups)
+
+            if "events" not in file:
+                file.mktree("events", {name: array.type.content for name, array in arrays.items()},
+                            counter_name=lambda group: counters.get(group, f"n{group}"))
+
+            file["events"].extend(arrays)
+            read    += len(events)
+            written += len(next(iter(output.values()))) if output else 0
+
+    # a partial read (max_events) only processed its share of the generated events
+    fraction = read / entries if entries else 1.0
+    values   = {name: value * fraction for name, value in values.items() if value is not None}
+
+    if values:
+        write_bookkeeping(output_file, values, types)
+
+    return output_file, read, written, values
+
+def write_bookkeeping(output_file, values, types):
+
+    """
+    Writes the bookkeeping TParameters with the types they have in the input file.
+    Parameters:
+    - output_file: str, path to the output file.
+    - values: dict, {name: value}.
+    - types: dict, {name: class name in the input, e.g. 'TParameter<int>'}.
+    """
+
+    try:
+        import ROOT
+    except ImportError:
+        print(f"Warning: ROOT is not available, {', '.join(values)} of {output_file} only go to the sample metadata.json")
+        return
+
+    file = ROOT.TFile(output_file, "UPDATE")
+    for name, value in values.items():
+        cpp_type = types.get(name, "TParameter<double>")[len("TParameter<"):-1]
+        cast     = int if cpp_type in ["int", "long", "Long64_t", "long long"] else float
+        ROOT.TParameter(cpp_type)(name, cast(value)).Write()
+    file.Close()
+
+# planning the files of every sample
+def plan_tasks(config_path, config, step, max_events=None):
+
+    """
+    Lists the stage1 inputs of every sample, one task per file.
+    Parameters:
+    - config_path: str, path to the stage2 configuration.
+    - config: module, stage2 configuration.
+    - step: int, maximum number of entries per chunk.
+    - max_events: int, stop after this many entries per sample (for quick studies).
+    Returns:
+    - tasks: dict, {sample: list of tuples accepted by process_file()}.
+    """
+
+    tasks = {}
+
+    for sample in config.processList:
+        left = max_events if max_events else np.inf
+        tasks[sample] = []
+
+        for number, input_file in enumerate(sample_files(config.inputDir, sample)):
+            if left <= 0:
+                break
+
+            with uproot.open(input_file) as file:
+                entries = file["events"].num_entries
+
+            stop  = int(min(entries, left))
+            left -= stop
+            tasks[sample].append((config_path, input_file, stop, step,
+                                  os.path.join(config.outputDir, sample, f"chunk{number}.root")))
+
+    return tasks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stage2 selection with uproot and awkward instead of RDataFrame.")
+    parser.add_argument("config", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "../analysis/analysis_stage2.py"),
+                        help="stage2 configuration")
+    parser.add_argument("--input-dir", default=None, help="stage1 directory, defaults to inputDir of the configuration")
+    parser.add_argument("--output-dir", default=None, help="output directory, defaults to outputDir of the configuration")
+    parser.add_argument("--step", type=int, default=default_step, help="entries per chunk")
+    parser.add_argument("--max-events", type=int, default=None, help="entries per sample, for quick studies")
+    parser.add_argument("--ncpus", type=int, default=None, help="worker processes, defaults to nCPUS of the configuration")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    config.inputDir  = args.input_dir or config.inputDir
+    config.outputDir = args.output_dir or config.outputDir
+
+    tasks = plan_tasks(args.config, config, args.step, args.max_events)
+
+    # the workers reload the configuration, so the output directory travels with the task
+    with ProcessPoolExecutor(max_workers=args.ncpus or config.nCPUS) as pool:
+        for sample, sample_tasks in tasks.items():
+            totals = {}
+            for output_file, read, written, values in pool.map(process_file, sample_tasks):
+                print(f"{output_file}: {written}/{read} events selected")
+                for name, value in values.items():
+                    totals[name] = totals.get(name, 0.0) + value
+
+            # sidecar read by metadata_scan.py when the files carry no parameters
+            if "eventsProcessed" in totals:
+                with open(os.path.join(config.outputDir, sample, "metadata.json"), "w") as f:
+                    json.dump({"numberOfEvents": totals["eventsProcessed"],
+                               "sumOfWeights":   totals.get("sumOfWeights", totals["eventsProcessed"])}, f, indent=2)
@@ -0,0 +1,178 @@
+# importing packages
+import os
+import re
+import glob
+import hashlib
+import importlib.util
+
+# words that appear in RDataFrame expressions but are never column names
+CPP_KEYWORDS = {
+    "return", "auto", "const", "int", "float", "double", "bool", "char", "long", "short",
+    "unsigned", "signed", "size_t", "true", "false", "and", "or", "not", "if", "else",
+    "for", "while", "static_cast", "std", "ROOT", "VecOps", "RVec", "nullptr", "this",
+}
+
+# identifiers not preceded by '.', '::' or a word character and not followed by '::' or '('
+IDENTIFIER_RE = re.compile(r"(?<![\w.:])([A-Za-z_]\w*)(?!\w)(?!\s*::)(?!\s*\()")
+
+# string and character literals are removed before looking for column names
+LITERAL_RE = re.compile(r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'")
+
+# loading an analysis configuration file as a module
+def load_config(config_path):
+
+    """
+    Imports an FCCAnalyses configuration file (stage1, stage2 or final) as a python module.
+    Parameters:
+    - config_path: str, path to the configuration file.
+    Returns:
+    - config: module, the imported configuration.
+    """
+
+    config_path = os.path.abspath(config_path)
+    module_name = os.path.splitext(os.path.basename(config_path))[0]
+
+    spec   = importlib.util.spec_from_file_location(module_name, config_path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+
+    return config
+
+# listing the files of a sample in a stage input or output directory
+def sample_files(directory, sample):
+
+    """
+    Lists the files of a sample, either <sample>.root or the chunks in <sample>/.
+    Parameters:
+    - directory: str, stage input or output directory.
+    - sample: str, name of the sample in processList.
+    Returns:
+    - files: list of str, paths to the files, empty if the sample has none.
+    """
+
+    single_file = os.path.join(directory, f"{sample}.root")
+
+    if os.path.isfile(single_file):
+        return [single_file]
+
+    return sorted(glob.glob(os.path.join(directory, sample, "*.root")))
+
+# checksum of a file
+def file_checksum(path, block_size=1 << 20):
+
+    """
+    Computes the sha256 checksum of a file.
+    Parameters:
+    - path: str, path to the file.
+    - block_size: int, bytes read at a time.
+    Returns:
+    - checksum: str, hex digest.
+    """
+
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+# finding the column names used by an expression
+def expression_columns(expression):
+
+    """
+    Extracts the names of the columns referenced by an RDataFrame expression.
+    Parameters:
+    - expression: str, the Define or Filter expression.
+    Returns:
+    - columns: set of str, names of the referenced columns.
+    """
+
+    stripped = LITERAL_RE.sub(" ", expression)
+
+    return {name for name in IDENTIFIER_RE.findall(stripped) if name not in CPP_KEYWORDS}
+
+class RecordingFrame():
+
+    """
+    Stand-in for an RDataFrame that records the Alias/Define/Redefine/Filter calls made by
+    an RDFanalysis.analysers function instead of executing them.
+    """
+
+    def __init__(self):
+        self.operations = []
+
+    def Alias(self, alias, column):
+        self.operations.append(("Alias", alias, column))
+        return self
+
+    def Define(self, name, expression):
+        self.operations.append(("Define", name, expression))
+        return self
+
+    def Redefine(self, name, expression):
+        self.operations.append(("Redefine", name, expression))
+        return self
+
+    def Filter(self, expression, name=""):
+        self.operations.append(("Filter", name, expression))
+        return self
+
+    # plain RDataFrame queries are answered as if every column existed
+    def HasColumn(self, name):
+        return True
+
+# collecting the columns a configuration needs from its input files
+def config_columns(config):
+
+    """
+    Lists the input columns required by an analysis configuration and the ones it creates.
+    Columns are taken from RDFanalysis.analysers/output (stage1 and stage2) and from cutList
+    and histoList (final stage).
+    Parameters:
+    - config: module, configuration returned by load_config().
+    Returns:
+    - required: dict, {column: [places where it is referenced]} for columns read from the input.
+    - produced: set of str, columns created by the configuration itself.
+    """
+
+    references = {}
+    produced   = set()
+
+    def reference(columns, where):
+        for column in columns:
+            references.setdefault(column, []).append(where)
+
+    analysis = getattr(config, "RDFanalysis", None)
+
+    if analysis is not None and hasattr(analysis, "analysers"):
+        frame = RecordingFrame()
+        analysis.analysers(frame)
+
+        for kind, name, argument in frame.operations:
+            if kind == "Alias":
+                reference([argument], f"Alias {name}")
+                produced.add(name)
+
+            elif kind == "Define":
+                reference(expression_columns(argument), f"Define {name}")
+                produced.add(name)
+
+            elif kind == "Redefine":
+                reference(expression_columns(argument), f"Redefine {name}")
+
+            else:
+                reference(expression_columns(argument), f"Filter {name or argument}")
+
+    if analysis is not None and hasattr(analysis, "output"):
+        reference(analysis.output(), "output")
+
+    for cut_name, cut in getattr(config, "cutList", {}).items():
+        reference(expression_columns(cut), f"cutList {cut_name}")
+
+    for hist_name, hist in getattr(config, "histoList", {}).items():
+        reference([hist["name"]], f"histoList {hist_name}")
+
+    required = {column: places for column, places in references.items() if column not in produced}
+
+    return required, produced
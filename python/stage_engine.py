@@ -0,0 +1,279 @@
+# importing packages
+import os
+import sys
+import glob
+import json
+import uuid
+import atexit
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import expression_columns
+
+# pass fraction assumed for filters that have not been measured yet
+default_pass_fraction = 0.5
+
+# cut-flow reports booked during this run, written out when the process ends
+booked_reports = []
+
+# dependencies between defines
+def define_dependencies(defines):
+
+    """
+    Finds, for every Define, the columns it reads.
+    Parameters:
+    - defines: list of (name, expression) tuples.
+    Returns:
+    - dependencies: dict, {name: set of column names read by the expression}.
+    """
+
+    return {name: expression_columns(expression) for name, expression in defines}
+
+def needed_defines(columns, dependencies):
+
+    """
+    Collects the Defines needed to compute a set of columns, following their dependencies.
+    Parameters:
+    - columns: iterable of str, columns read by a Filter or written to the output.
+    - dependencies: dict, output of define_dependencies().
+    Returns:
+    - needed: set of str, names of the Defines involved.
+    """
+
+    needed  = set()
+    pending = [column for column in columns if column in dependencies]
+
+    while pending:
+        name = pending.pop()
+
+        if name in needed:
+            continue
+
+        needed.add(name)
+        pending += [column for column in dependencies[name] if column in dependencies]
+
+    return needed
+
+def define_cost(name, dependencies):
+
+    """
+    Estimates the per-event cost of a Define: one unit for the computation plus one per input
+    column it reads from the file.
+    Parameters:
+    - name: str, name of the Define.
+    - dependencies: dict, output of define_dependencies().
+    Returns:
+    - cost: int, estimated cost.
+    """
+
+    return 1 + sum(1 for column in dependencies[name] if column not in dependencies)
+
+# choosing the filter order
+def order_filters(defines, filters, selectivity=None):
+
+    """
+    Orders the Filters so that cheap and selective ones run first. At every step the filter with
+    the lowest cost / (1 - pass fraction) is chosen, where the cost only counts the Defines not
+    already computed for an earlier filter.
+    Parameters:
+    - defines: list of (name, expression) tuples.
+    - filters: list of (name, expression) tuples.
+    - selectivity: dict, {filter name: pass fraction} measured on an earlier run.
+    Returns:
+    - ordered: list of (name, expression) tuples.
+    """
+
+    selectivity  = selectivity or {}
+    dependencies = define_dependencies(defines)
+    computed     = set()
+    remaining    = list(filters)
+    ordered      = []
+
+    def rank(item):
+        name, expression = item
+        columns  = expression_columns(expression)
+        new      = needed_defines(columns, dependencies) - computed
+        cost     = 1 + sum(define_cost(define, dependencies) for define in new)
+        cost    += sum(1 for column in columns if column not in dependencies)
+        rejected = 1.0 - selectivity.get(name, default_pass_fraction)
+
+        return cost / rejected if rejected > 0 else float("inf")
+
+    while remaining:
+        best = min(remaining, key=rank)
+        remaining.remove(best)
+        ordered.append(best)
+        computed |= needed_defines(expression_columns(best[1]), dependencies)
+
+    return ordered
+
+# reading and writing measured pass fractions
+def report_parts(report_file):
+
+    """
+    Lists the per-chunk reports written next to a report file (<name>.<id>.json).
+    Parameters:
+    - report_file: str, path to the merged JSON report.
+    Returns:
+    - parts: list of str, paths of the per-chunk reports.
+    """
+
+    root, ext = os.path.splitext(report_file)
+
+    return sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+def merge_reports(report_file, write=False):
+
+    """
+    Sums the per-chunk reports and the report already in report_file. Counts are only summed for a
+    filter measured at the same position, so runs with different filter orders stay apart.
+    Parameters:
+    - report_file: str, path to the merged JSON report.
+    - write: bool, write the sum to report_file and remove the merged parts (not done while jobs of
+      a run may still be reading or writing them).
+    Returns:
+    - summary: list of dict, {"name", "position", "all", "pass"}, sorted by position.
+    """
+
+    parts   = report_parts(report_file)
+    summary = {}
+
+    for path in ([report_file] if os.path.isfile(report_file) else []) + parts:
+        with open(path) as f:
+            for cut in json.load(f):
+                entry = summary.setdefault((cut["position"], cut["name"]), {"name": cut["name"], "position": cut["position"],
+                                                                            "all": 0, "pass": 0})
+                entry["all"]  += cut["all"]
+                entry["pass"] += cut["pass"]
+
+    summary = sorted(summary.values(), key=lambda cut: (cut["position"], cut["name"]))
+
+    if write and parts:
+        with open(report_file, "w") as f:
+            json.dump(summary, f, indent=2)
+        for path in parts:
+            os.remove(path)
+
+    return summary
+
+def load_selectivity(report_file):
+
+    """
+    Reads the pass fraction of every filter from the reports of earlier runs. A filter's fraction is
+    conditional on the filters in front of it, so the measurement taken at the lowest position is
+    used: at position 0 it is the marginal pass fraction over all events.
+    Parameters:
+    - report_file: str, path to the merged JSON report.
+    Returns:
+    - selectivity: dict, {filter name: pass fraction}, empty if there is no report.
+    """
+
+    if not report_file:
+        return {}
+
+    selectivity = {}
+
+    for cut in merge_reports(report_file):
+        if cut["all"] > 0 and cut["name"] not in selectivity:
+            selectivity[cut["name"]] = cut["pass"] / cut["all"]
+
+    return selectivity
+
+def write_reports(report_file):
+
+    """
+    Sums the cut-flow reports booked in this process and writes them, with the position of every
+    filter and the events it saw and kept, to a report of its own next to report_file, so that
+    batch jobs running at the same time do not overwrite each other. Reports whose event loop never
+    ran are skipped.
+    Parameters:
+    - report_file: str, path to the merged JSON report.
+    """
+
+    summary = {}
+
+    for report in booked_reports:
+        if not report.IsReady():
+            continue
+
+        for position, cut in enumerate(report.GetValue()):
+            entry = summary.setdefault(str(cut.GetName()), {"name": str(cut.GetName()), "position": position, "all": 0, "pass": 0})
+            entry["all"]  += cut.GetAll()
+            entry["pass"] += cut.GetPass()
+
+    if not summary:
+        return
+
+    root, ext = os.path.splitext(report_file)
+    os.makedirs(os.path.dirname(os.path.abspath(report_file)), exist_ok=True)
+    with open(f"{root}.{uuid.uuid4().hex}{ext}", "w") as f:
+        json.dump(list(summary.values()), f, indent=2)
+
+    print_report(list(summary.values()))
+
+def print_report(summary):
+
+    """
+    Prints, for every filter in the order it was applied, the events it saw and kept, its pass
+    fraction given the filters before it, and the fraction of the events left after it.
+    Parameters:
+    - summary: list of dict, {"name", "position", "all", "pass"}.
+    """
+
+    print(f"{'pos':>3} {'filter':<20} {'all':>12} {'pass':>12} {'fraction':>9} {'cumulative':>10}")
+
+    total = {}
+    for cut in summary:
+        if cut["position"] == 0:
+            total.setdefault(cut["name"], cut["all"])
+
+    first = max(total.values(), default=0)
+
+    for cut in summary:
+        fraction   = cut["pass"] / cut["all"] if cut["all"] else 0.0
+        cumulative = cut["pass"] / first if first else 0.0
+        print(f"{cut['position']:>3} {cut['name']:<20} {cut['all']:>12} {cut['pass']:>12} {fraction:>9.3f} {cumulative:>10.3f}")
+
+# building the dataframe
+def build_stage(df, defines, filters, report_file=None):
+
+    """
+    Applies Defines and Filters to a dataframe: filters are reordered with order_filters(), each
+    filter only gets the Defines it depends on in front of it, and the Defines used only for the
+    output are added after the last filter. If report_file is given, the measured pass fractions
+    are read from it and from the per-chunk reports of earlier runs, and this process writes
+    its own per-chunk report next to it when it ends.
+    Parameters:
+    - df: RDataFrame node the stage starts from.
+    - defines: list of (name, expression) tuples, in an order that respects their dependencies.
+    - filters: list of (name, expression) tuples.
+    - report_file: str, path to the JSON selectivity report.
+    Returns:
+    - df: RDataFrame node after all Defines and Filters.
+    """
+
+    dependencies = define_dependencies(defines)
+    defined      = set()
+
+    def define(df, names):
+        for name, expression in defines:
+            if name in names and name not in defined:
+                df = df.Define(name, expression)
+                defined.add(name)
+        return df
+
+    for name, expression in order_filters(defines, filters, load_selectivity(report_file)):
+        df = define(df, needed_defines(expression_columns(expression), dependencies))
+        df = df.Filter(expression, name)
+
+    df = define(df, set(dependencies))
+
+    if report_file and hasattr(df, "Report"):
+        if not booked_reports:
+            atexit.register(write_reports, report_file)
+        booked_reports.append(df.Report())
+
+    return df
+
+if __name__ == "__main__":
+    print_report(merge_reports(sys.argv[1], write=True))
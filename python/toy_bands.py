@@ -0,0 +1,236 @@
+# importing packages
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import numpy as np
+from scipy.stats import norm
+from concurrent.futures import ProcessPoolExecutor
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from hist_cube import load_cubes, reference_rows
+from lumi_scan import asimov_significance
+from datacard_fit import parse_datacard, build_batch, repeat_batch, fit, asimov
+
+# quantiles of the bands: median, +-1 sigma and +-2 sigma
+band_quantiles = norm.cdf([-2, -1, 0, 1, 2])
+
+# toys drawn (and fitted) together, each chunk with its own random stream
+toy_chunk = 1000
+
+# reproducible toys
+def draw_toys(rng, expected, n):
+
+    """
+    Draws Poisson pseudo-datasets of a set of templates in one call.
+    Parameters:
+    - rng: numpy Generator.
+    - expected: numpy array, expected yields of any shape.
+    - n: int, number of toys.
+    Returns:
+    - toys: numpy array, shape (n,) + expected.shape.
+    """
+
+    return rng.poisson(np.maximum(expected, 0), size=(n,) + np.shape(expected)).astype(np.float64)
+
+def run_chunk(task):
+
+    """
+    Runs one chunk of toys (in a worker process) with the random stream of the chunk.
+    Parameters:
+    - task: tuple, (function, args, seed, n) with seed a numpy SeedSequence.
+    Returns:
+    - results: dict, output of function(rng, n, *args).
+    """
+
+    function, args, seed, n = task
+
+    return function(np.random.default_rng(seed), n, *args)
+
+def run_toys(function, args, n_toys, seed=1, jobs=1, chunk=toy_chunk):
+
+    """
+    Runs function on n_toys toys in chunks, in parallel. Every chunk gets a child of the seed, so
+    the toys only depend on the seed and the chunk size, not on the number of workers.
+    Parameters:
+    - function: callable, function(rng, n, *args) returning a dict of arrays with the toys first.
+    - args: tuple, further arguments of function.
+    - n_toys: int, number of toys.
+    - seed: int, seed of the toys.
+    - jobs: int, number of worker processes.
+    - chunk: int, toys per chunk.
+    Returns:
+    - results: dict, arrays of all toys.
+    """
+
+    sizes = [min(chunk, n_toys - start) for start in range(0, n_toys, chunk)]
+    tasks = [(function, args, child, size) for child, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes)]
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(run_chunk, tasks))
+    else:
+        results = [run_chunk(task) for task in tasks]
+
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+def bands(samples):
+
+    """
+    Computes the band_quantiles over the toys.
+    Parameters:
+    - samples: numpy array, toys along the first axis.
+    Returns:
+    - bands: numpy array, shape (5,) + samples.shape[1:].
+    """
+
+    return np.quantile(samples, band_quantiles, axis=0)
+
+# toys of the deviations
+def deviation_toys(rng, n, sm, bsm):
+
+    """
+    Draws toys of the SM and BSM histograms and computes their deviation and its significance.
+    Parameters:
+    - rng: numpy Generator.
+    - n: int, number of toys.
+    - sm: numpy array, expected SM yields, shape (R, bins).
+    - bsm: numpy array, expected BSM yields, shape (R, bins).
+    Returns:
+    - results: dict, "deviation" (n, R, bins) and "significance" (n, R) of toy BSM against the SM.
+    """
+
+    toy_sm  = draw_toys(rng, sm, n)
+    toy_bsm = draw_toys(rng, bsm, n)
+
+    return {"deviation": toy_bsm - toy_sm, "significance": asimov_significance(toy_bsm, sm)}
+
+def deviation_bands(cube, lumi, n_toys, seed=1, jobs=1, reference='SM'):
+
+    """
+    Expected bands of the deviations of a cube, as computed by calculate_deviations, and of their
+    significance at a luminosity.
+    Parameters:
+    - cube: dict, one cube of load_cubes().
+    - lumi: float, integrated luminosity [pb^-1].
+    - n_toys: int, number of toys.
+    - seed: int, seed of the toys.
+    - jobs: int, number of worker processes.
+    - reference: str, SM variation.
+    Returns:
+    - result: dict, "keys", "deviation" bands (5, R, bins) and "significance" bands (5, R).
+    """
+
+    rows, refs = reference_rows(cube, reference)
+    values     = cube["values"][:, 1:-1] * lumi * cube["rates"][:, None]
+    toys       = run_toys(deviation_toys, (values[refs], values[rows]), n_toys, seed, jobs)
+
+    return {"keys": [cube["keys"][i] for i in rows],
+            "deviation": bands(toys["deviation"]), "significance": bands(toys["significance"])}
+
+# toys of the datacards
+def card_toys(rng, n, batch, r):
+
+    """
+    Draws toys of every card at a signal strength and fits all of them in one batch.
+    Parameters:
+    - rng: numpy Generator.
+    - n: int, number of toys.
+    - batch: dict, output of build_batch().
+    - r: float, injected signal strength.
+    Returns:
+    - results: dict, best-fit "r" and discovery test statistic "q0", shape (n, C).
+    """
+
+    cards = len(batch["init"])
+    toys  = draw_toys(rng, asimov(batch, r), n).transpose(1, 0, 2).reshape(cards * n, -1)
+    big   = repeat_batch(batch, n)
+
+    theta, nll_best = fit(big, toys)
+    nll_zero        = fit(big, toys, np.zeros(len(toys)))[1]
+    q0              = np.where(theta[:, 0] > 0, np.maximum(2 * (nll_zero - nll_best), 0), 0.0)
+
+    return {"r": theta[:, 0].reshape(cards, n).T, "q0": q0.reshape(cards, n).T}
+
+def card_bands(paths, n_toys, r=1.0, seed=1, jobs=1, chunk=100):
+
+    """
+    Expected bands of the best-fit signal strength and of the significance of datacards, from toys
+    at an injected signal strength.
+    Parameters:
+    - paths: list of str, paths to the datacards.
+    - n_toys: int, number of toys per card.
+    - r: float, injected signal strength.
+    - seed: int, seed of the toys.
+    - jobs: int, number of worker processes.
+    - chunk: int, toys per chunk (every toy is a set of fit parameters).
+    Returns:
+    - results: list of dict, one per card, with "r" and "significance" bands.
+    """
+
+    batch = build_batch([parse_datacard(path) for path in paths])
+    toys  = run_toys(card_toys, (batch, r), n_toys, seed, jobs, chunk)
+
+    r_bands = bands(toys["r"])
+    z_bands = bands(np.sqrt(toys["q0"]))
+
+    return [{"card": path, "r": r_bands[:, c].tolist(), "significance": z_bands[:, c].tolist()}
+            for c, path in enumerate(paths)]
+
+if __name__ == "__main__":
+    parser   = argparse.ArgumentParser(description="Expected bands of the deviations and datacard results from Poisson toys.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    deviation = commands.add_parser("deviations", help="bands of the deviations and their significance")
+    deviation.add_argument("cubes", help=".npz file written by hist_cube.save_cubes")
+    deviation.add_argument("--lumi", type=float, default=None, help="luminosity [pb^-1], defaults to the one of the final stage")
+    deviation.add_argument("--output", default=None, help="write the bands to this .npz")
+
+    cards = commands.add_parser("cards", help="bands of the fitted signal strength and significance")
+    cards.add_argument("cards", nargs="+", help="datacards, or directories containing datacard_*.txt")
+    cards.add_argument("--r", type=float, default=1.0, help="injected signal strength")
+    cards.add_argument("--json", default=None, help="write the bands to this JSON file")
+
+    for command in [deviation, cards]:
+        command.add_argument("--toys", type=int, default=1000, help="number of toys")
+        command.add_argument("--seed", type=int, default=1, help="seed of the toys")
+        command.add_argument("--jobs", type=int, default=1, help="worker processes")
+
+    args  = parser.parse_args()
+    start = time.perf_counter()
+
+    if args.command == "deviations":
+        cubes, int_lumi = load_cubes(args.cubes)
+        results         = {variable: deviation_bands(cube, args.lumi or int_lumi, args.toys, args.seed, args.jobs)
+                           for variable, cube in cubes.items()}
+        print(f"{args.toys} toys of {len(cubes)} variables in {time.perf_counter() - start:.2f} s\n")
+
+        print(f"{'variable':<24} {'process':<9} {'variation':<11} {'selection':<9} {'-2s':>6} {'-1s':>6} {'Z med':>6} {'+1s':>6} {'+2s':>6}")
+        for variable, result in results.items():
+            for i, (process, variation, selection) in enumerate(result["keys"]):
+                print(f"{variable:<24} {process:<9} {variation:<11} {selection:<9} " + " ".join(f"{z:>6.2f}" for z in result["significance"][:, i]))
+
+        if args.output:
+            np.savez_compressed(args.output, quantiles=band_quantiles,
+                                **{f"{variable}/keys": np.array(result["keys"], dtype=str).reshape(-1, 3) for variable, result in results.items()},
+                                **{f"{variable}/deviation": result["deviation"] for variable, result in results.items()},
+                                **{f"{variable}/significance": result["significance"] for variable, result in results.items()})
+
+    else:
+        paths = []
+        for path in args.cards:
+            paths += sorted(glob.glob(os.path.join(path, "datacard_*.txt"))) if os.path.isdir(path) else [path]
+
+        results = card_bands(paths, args.toys, args.r, args.seed, args.jobs)
+        print(f"{args.toys} toys of {len(paths)} datacards in {time.perf_counter() - start:.2f} s\n")
+
+        print(f"{'datacard':<50} {'r -1s':>7} {'r med':>7} {'r +1s':>7} {'Z -1s':>7} {'Z med':>7} {'Z +1s':>7}")
+        for result in results:
+            print(f"{os.path.basename(result['card']):<50} " + " ".join(f"{value:>7.3f}" for value in result["r"][1:4] + result["significance"][1:4]))
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
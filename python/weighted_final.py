@@ -0,0 +1,238 @@
+# importing packages
+import os
+import sys
+import json
+import time
+import argparse
+
+# importing other useful files
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stage_config import load_config, sample_files
+from sample_norm import sample_name, parse_sample, xsec_variation
+
+# header with the checked weight ratios, next to the analysis configurations
+eft_weights_header = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../analysis/eft_weights.h")
+
+# normalization of the variations, written to outputDir and added to procDictAdd by the final stage configuration
+norm_file = "procDictAdd_weighted.json"
+
+# relative difference between the mean weight ratio and sample_norm.xsec_variation that is reported
+ratio_tolerance = 0.01
+
+# histogram models
+def histo_model(ROOT, name, entry):
+
+    """
+    Builds the TH1D model of a histoList entry, with fixed bins (bin, xmin, xmax) or
+    variable-width bins (bins, a list of edges).
+    Parameters:
+    - ROOT: module, the ROOT module.
+    - name: str, name of the histogram.
+    - entry: dict, histoList entry.
+    Returns:
+    - model: ROOT.RDF.TH1DModel.
+    """
+
+    if "bins" in entry:
+        edges = ROOT.std.vector["double"](entry["bins"])
+        return ROOT.RDF.TH1DModel(name, entry["title"], len(edges) - 1, edges.data())
+
+    return ROOT.RDF.TH1DModel(name, entry["title"], entry["bin"], entry["xmin"], entry["xmax"])
+
+# booking all weighted histograms of a sample
+def book_sample(ROOT, df, config, weights):
+
+    """
+    Books the histoList histograms of every cut for a set of event weights on one dataframe, so
+    that all of them are filled in the same event loop, together with the sums of the weights
+    over all events.
+    Parameters:
+    - ROOT: module, the ROOT module.
+    - df: ROOT.RDataFrame over the sample.
+    - config: module, final stage configuration.
+    - weights: dict, {label: weight expression, None for unit weights}.
+    Returns:
+    - booked: dict, {(label, cut): {histogram name: RResultPtr}}.
+    - sums: dict, {label: RResultPtr of the sum of the weights}, the event count for unit weights.
+    """
+
+    columns = {}
+    for label, expression in weights.items():
+        if expression is not None:
+            columns[label] = f"weight_{label}"
+            df = df.Define(columns[label], expression)
+
+    sums = {label: df.Sum(columns[label]) if label in columns else df.Count() for label in weights}
+
+    booked = {}
+    for cut, expression in config.cutList.items():
+        selected = df.Filter(expression, cut)
+
+        for label in weights:
+            booked[(label, cut)] = {
+                name: (selected.Histo1D(histo_model(ROOT, name, entry), entry["name"], columns[label]) if label in columns
+                       else selected.Histo1D(histo_model(ROOT, name, entry), entry["name"]))
+                for name, entry in config.histoList.items()}
+
+    return booked, sums
+
+def eft_weights(config):
+
+    """
+    Lists the event weights of the coupling variations: unit weights for the SM and, per variation
+    of eftWeightVariations, its entry of the eftWeightColumn vector (from eftWeightOffset on) over
+    the nominal entry (eftWeightNominal). The length of the vector is checked in every event.
+    Parameters:
+    - config: module, final stage configuration.
+    Returns:
+    - weights: dict, {variation: weight expression}, '' being the SM.
+    """
+
+    nominal  = getattr(config, "eftWeightNominal", 0)
+    offset   = getattr(config, "eftWeightOffset", 1)
+    expected = max(nominal + 1, offset + len(config.eftWeightVariations))
+
+    weights = {"": None}
+    for i, variation in enumerate(config.eftWeightVariations):
+        weights[variation + "_"] = f"topEWK::weight_ratio({config.eftWeightColumn}, {offset + i}, {nominal}, {expected})"
+
+    return weights
+
+def scale_factor(config, sample):
+
+    """
+    Returns the factor the final stage scales the histograms of a sample with (doScale):
+    intLumi * crossSection * kfactor * matchingEfficiency / sumOfWeights. The weights of the
+    variations carry the change of the cross section themselves.
+    Parameters:
+    - config: module, final stage configuration.
+    - sample: str, SM sample the events come from.
+    Returns:
+    - factor: float.
+    """
+
+    if not getattr(config, "doScale", False):
+        return 1.0
+
+    entry = config.procDictAdd[sample]
+
+    return (config.intLumi * entry["crossSection"] * entry.get("kfactor", 1.0)
+            * entry.get("matchingEfficiency", 1.0) / entry["sumOfWeights"])
+
+def variation_entries(config, sample, sums):
+
+    """
+    Builds the procDictAdd entries of the variations filled from an SM sample. The mean weight
+    ratio r over the events of the sample is the cross section of a variation over the SM one,
+    so its entry is the SM entry with crossSection and sumOfWeights multiplied by r: the
+    normalization crossSection / sumOfWeights stays the SM one, and the rate change is carried by
+    the weighted histograms alone. A ratio that differs from sample_norm.xsec_variation by more
+    than ratio_tolerance is reported.
+    Parameters:
+    - config: module, final stage configuration.
+    - sample: str, SM sample the events come from.
+    - sums: dict, output of book_sample() after the event loop.
+    Returns:
+    - entries: dict, {variation sample: procDict entry}.
+    """
+
+    process = parse_sample(sample)[0]
+    entry   = config.procDictAdd[sample]
+    events  = sums[""].GetValue()
+    entries = {}
+
+    for label, total in sums.items():
+        if label == "" or events == 0:
+            continue
+
+        ratio = total.GetValue() / events
+        if abs(ratio - xsec_variation[label]) > ratio_tolerance * xsec_variation[label]:
+            print(f"Warning: {sample_name(process, label)}: mean weight ratio {ratio:.4f} differs from "
+                  f"xsec_variation {xsec_variation[label]:.4f}")
+
+        entries[sample_name(process, label)] = dict(entry, crossSection=entry["crossSection"] * ratio,
+                                                    sumOfWeights=entry["sumOfWeights"] * ratio)
+
+    return entries
+
+def write_outputs(ROOT, config, output_name, booked, factor):
+
+    """
+    Writes one <sample>_<cut>_histo.root file per weight label and cut, as the final stage does.
+    The number of entries of every histogram is set to its sum of weights, so that
+    hist_cube.unit_factors() gives back the weighted counts of a variation rather than the SM
+    number of events (unit weights leave it unchanged).
+    Parameters:
+    - ROOT: module, the ROOT module.
+    - config: module, final stage configuration.
+    - output_name: function, returns the sample name of the output files of a label.
+    - booked: dict, output of book_sample() after the event loop.
+    - factor: float, output of scale_factor().
+    Returns:
+    - files: list of str, paths of the written files.
+    """
+
+    files = []
+    for (label, cut), histograms in booked.items():
+        path   = os.path.join(config.outputDir, f"{output_name(label)}_{cut}_histo.root")
+        output = ROOT.TFile(path, "RECREATE")
+
+        for name, result in histograms.items():
+            hist = result.GetValue()
+            hist.SetEntries(hist.Integral(0, hist.GetNbinsX() + 1))
+            hist.Scale(factor)
+            hist.Write(name)
+
+        output.Close()
+        files.append(path)
+
+    return files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the histograms of all coupling variations from the SM samples in one event loop per sample.")
+    parser.add_argument("config", nargs="?", default="analysis/analysis_final.py", help="final stage configuration")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+
+    import ROOT
+    ROOT.gROOT.SetBatch(True)
+    ROOT.EnableImplicitMT(getattr(config, "nCPUS", 1))
+    ROOT.gInterpreter.Declare(f'#include "{os.path.abspath(eft_weights_header)}"')
+
+    weights  = eft_weights(config)
+    samples  = [sample for sample in config.processList if parse_sample(sample)[1] == ""]
+    frames   = []
+    booked   = {}
+    sums     = {}
+
+    for sample in samples:
+        files = sample_files(config.inputDir, sample)
+        if not files:
+            print(f"Warning: no input files for {sample}, skipped")
+            continue
+
+        df = ROOT.RDataFrame("events", files)
+        frames.append(df)
+        booked[sample], sums[sample] = book_sample(ROOT, df, config, weights)
+
+    # one event loop per sample, the samples run concurrently
+    start = time.perf_counter()
+    ROOT.RDF.RunGraphs([result for sample in booked.values() for histograms in sample.values() for result in histograms.values()]
+                       + [result for sample in sums.values() for result in sample.values()])
+    print(f"Filled {len(weights)} weight sets x {len(config.cutList)} cuts x {len(config.histoList)} histograms "
+          f"for {len(booked)} samples in {time.perf_counter() - start:.1f} s")
+
+    os.makedirs(config.outputDir, exist_ok=True)
+    proc_dict = {}
+    for sample, histograms in booked.items():
+        process = parse_sample(sample)[0]
+        files   = write_outputs(ROOT, config, lambda label: sample_name(process, label), histograms, scale_factor(config, sample))
+        print(f"{sample}: {len(files)} files written to {config.outputDir}")
+
+        proc_dict.update(variation_entries(config, sample, sums[sample]))
+
+    # the variations are normalized with these entries instead of the SM entry times xsec_variation
+    with open(os.path.join(config.outputDir, norm_file), "w") as f:
+        json.dump(proc_dict, f, indent=2)
+    print(f"Normalization of {len(proc_dict)} variations written to {os.path.join(config.outputDir, norm_file)}")
@@ -0,0 +1,54 @@
+# importing packages
+import os
+import sys
+import numpy as np
+import pytest
+import uproot
+
+# the analysis scripts are imported from python/, as they import each other
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../python"))
+
+# writing small datacards as create_datacard.py does
+@pytest.fixture
+def write_card(tmp_path):
+
+    """
+    Returns a function writing a one-bin-per-channel shape datacard with its histograms.
+    Parameters of the returned function:
+    - name: str, card name.
+    - signal: array, signal yields per bin.
+    - background: array, background yields per bin.
+    - mc_error: float, relative MC error of the templates, 0 for no autoMCStats line.
+    - data: array, observed yields, the background if None.
+    Returns:
+    - path: str, path to the datacard.
+    """
+
+    def write(name, signal, background, mc_error=0.0, data=None):
+        signal     = np.asarray(signal, dtype=np.float64)
+        background = np.asarray(background, dtype=np.float64)
+        data       = background if data is None else np.asarray(data, dtype=np.float64)
+        edges      = np.arange(len(signal) + 1, dtype=np.float64)
+
+        with uproot.recreate(tmp_path / f"{name}.root") as f:
+            for process, values in [("signal", signal), ("background", background), ("data_obs", data)]:
+                variances  = (mc_error * values) ** 2
+                f[process] = uproot.writing.identify.to_TH1x(
+                    fName=process, fTitle=process, data=np.concatenate([[0], values, [0]]),
+                    fEntries=float(values.sum()), fTsumw=float(values.sum()), fTsumw2=float(variances.sum()),
+                    fTsumwx=0.0, fTsumwx2=0.0, fSumw2=np.concatenate([[0], variances, [0]]),
+                    fXaxis=uproot.writing.identify.to_TAxis("xaxis", "", len(edges) - 1, edges[0], edges[-1]))
+
+        lines = ["imax 1", "jmax 1", "kmax *", "-" * 20,
+                 f"shapes * * {name}.root $PROCESS",
+                 "-" * 20, "bin ch", f"observation {data.sum()}", "-" * 20,
+                 "bin ch ch", "process signal background", "process 0 1", "rate -1 -1", "-" * 20]
+        if mc_error > 0:
+            lines.append("ch autoMCStats 0 1")
+
+        path = tmp_path / f"{name}.txt"
+        path.write_text("\n".join(lines) + "\n")
+
+        return str(path)
+
+    return write
@@ -0,0 +1,42 @@
+# importing packages
+import numpy as np
+import pytest
+from scipy.optimize import minimize_scalar
+
+# importing other useful files
+from datacard_fit import profile_mc_stats
+from sample_norm import couplings
+from eft_morphing import morphing_weights
+from coupling_scan import block_nll, profile_scan
+
+def brute_force_nll(prediction, data, sigma):
+    def nll(norm):
+        total = norm * prediction
+        beta  = profile_mc_stats(total, data, sigma)
+        mean  = total + beta * sigma
+        return (mean - data + np.where(data > 0, data * np.log(data / mean), 0.0) + beta ** 2 / 2).sum()
+
+    return minimize_scalar(nll, bounds=(1e-3, 10), method="bounded", options={"xatol": 1e-10}).fun
+
+def test_block_nll_profiles_every_point():
+    rng       = np.random.default_rng(0)
+    templates = rng.uniform(50, 150, size=(3, 8))
+    sigma     = np.full(8, 3.0)
+    data      = templates[0]
+    weights   = np.array([[1.0, 0.2, 0.1], [1.0, -0.3, 0.4], [0.5, 0.3, 0.3]])
+
+    nll = block_nll(weights, templates, sigma, data)
+
+    assert nll == pytest.approx([brute_force_nll(w @ templates, data, sigma) for w in weights], abs=1e-8)
+
+def test_profile_scan_minimum_at_sm():
+    c         = couplings["ta_ttA"]
+    sm        = np.array([100.0, 200.0, 150.0, 50.0])
+    templates = np.array([sm, sm * [1.2, 1.0, 0.9, 1.3], sm * [0.9, 1.1, 1.0, 0.8]])
+    points    = np.linspace(-2 * c, 2 * c, 41)[:, None]
+
+    q = profile_scan(points, ["ta_ttA"], templates, templates * 0.01)
+
+    assert q[20] == pytest.approx(0.0, abs=1e-9)
+    assert np.all(q >= 0)
+    assert morphing_weights(points[20:21], ["ta_ttA"])[0] == pytest.approx([1.0, 0.0, 0.0])
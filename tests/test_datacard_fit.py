@@ -0,0 +1,61 @@
+# importing packages
+import numpy as np
+import pytest
+from scipy.stats import norm
+
+# importing other useful files
+from datacard_fit import parse_datacard, build_batch, profile_mc_stats, fit, asimov, cls_limits, fit_cards
+
+def test_parse_datacard(write_card):
+    card = parse_datacard(write_card("card", [5, 10], [100, 200], mc_error=0.1))
+
+    assert card["processes"] == ["signal", "background"]
+    assert card["signal"] == [True, False]
+    assert card["auto_mc_stats"]["include_signal"]
+
+def test_asimov_fit_returns_one(write_card):
+    batch = build_batch([parse_datacard(write_card("card", [5, 20, 10], [100, 80, 300], mc_error=0.05))])
+    theta = fit(batch, asimov(batch, 1.0))[0]
+
+    assert theta[0, 0] == pytest.approx(1.0, abs=1e-4)
+
+def test_q0_single_bin(write_card):
+    s, b  = 30.0, 100.0
+    batch = build_batch([parse_datacard(write_card("card", [s], [b]))])
+    data  = asimov(batch, 1.0)
+
+    q0 = 2 * (fit(batch, data, np.zeros(1))[1] - fit(batch, data)[1])
+
+    # Asimov discovery significance of a counting experiment
+    assert q0[0] == pytest.approx(2 * ((s + b) * np.log(1 + s / b) - s), rel=1e-6)
+
+def test_bb_lite_minimum():
+    total = np.array([10.0, 50.0, 200.0, 5.0])
+    data  = np.array([14.0, 40.0, 230.0, 0.0])
+    sigma = np.array([2.0, 5.0, 10.0, 1.0])
+
+    beta = profile_mc_stats(total, data, sigma)
+    mean = total + beta * sigma
+
+    # derivative of mean - data ln(mean) + beta^2/2 in beta
+    assert np.allclose(sigma - data * sigma / mean + beta, 0.0, atol=1e-9)
+    assert np.all(profile_mc_stats(total, data, np.zeros(4)) == 0.0)
+
+def test_cls_expected_limit(write_card):
+    s, b  = 100.0, 10000.0
+    batch = build_batch([parse_datacard(write_card("card", [s], [b]))])
+    data  = asimov(batch, 0.0)
+
+    expected, observed = cls_limits(batch, data, np.array([np.sqrt(b) / s]))
+
+    # large background: q(r) = (r s)^2 / b, and CLs = 0.05 at sqrt(q) = Phi^-1(0.975)
+    assert expected[0] == pytest.approx(norm.ppf(1 - 0.05 / 2) * np.sqrt(b) / s, rel=0.02)
+    assert observed[0] == pytest.approx(expected[0], rel=0.02)
+
+def test_fit_cards_batch_is_per_card(write_card):
+    paths   = [write_card("weak", [1, 2], [100, 100]), write_card("strong", [50, 80], [100, 100])]
+    results = fit_cards(paths)
+
+    assert [result["card"] for result in results] == paths
+    assert results[1]["significance"] > results[0]["significance"]
+    assert results[1]["expected_limit"] < results[0]["expected_limit"]
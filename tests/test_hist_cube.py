@@ -0,0 +1,18 @@
+# importing packages
+import numpy as np
+import pytest
+
+# importing other useful files
+from hist_cube import rebin_values
+
+def test_rebin_values_conserves_contents():
+    values = np.arange(12, dtype=np.float64).reshape(2, 6)
+    edges  = np.arange(5, dtype=np.float64)
+
+    rebinned = rebin_values(values, edges, [1.0, 3.0])
+
+    assert rebinned.sum(axis=1) == pytest.approx(values.sum(axis=1))
+    assert rebinned[0] == pytest.approx([0 + 1, 2 + 3, 4 + 5])
+
+    with pytest.raises(ValueError):
+        rebin_values(values, edges, [0.5, 3.0])
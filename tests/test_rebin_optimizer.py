@@ -0,0 +1,41 @@
+# importing packages
+import numpy as np
+import pytest
+
+# importing other useful files
+from hist_cube import rebin_values
+from rebin_optimizer import optimize_edges
+
+def test_noise_deviations_are_merged():
+    n     = 40
+    edges = np.linspace(0, 1, n + 1)
+    sm    = np.full(n, 1000.0)
+    noise = np.full((1, n), 20.0)
+    true  = np.zeros((1, n))
+    true[0, 30:] = 20.0
+    deviations = true + np.random.default_rng(1).normal(0, np.sqrt(noise))
+
+    new_edges, separation = optimize_edges(edges, sm, np.full(n, 10.0), deviations, noise, min_entries=10)
+
+    # sum D^2 / B alone would keep all 40 bins
+    assert len(new_edges) - 1 < n
+    assert new_edges[0] == 0.0 and new_edges[-1] == 1.0
+
+    # the separation is the objective evaluated on the merged bins
+    merged_b = rebin_values(sm, edges, new_edges, flow=False)
+    merged_d = rebin_values(deviations, edges, new_edges, flow=False)
+    merged_s = rebin_values(noise, edges, new_edges, flow=False)
+    assert separation == pytest.approx(((merged_d ** 2 - merged_s) / merged_b).sum())
+
+def test_bin_penalty_merges_more():
+    n          = 20
+    edges      = np.linspace(0, 1, n + 1)
+    sm         = np.full(n, 100.0)
+    deviations = np.linspace(1, 10, n)[None, :]
+    noise      = np.zeros((1, n))
+
+    finest = optimize_edges(edges, sm, np.ones(n), deviations, noise, min_entries=10)[0]
+    coarse = optimize_edges(edges, sm, np.ones(n), deviations, noise, min_entries=10, bin_penalty=0.2)[0]
+
+    assert len(finest) - 1 == n
+    assert len(coarse) < len(finest)
@@ -0,0 +1,43 @@
+# importing packages
+import numpy as np
+import pytest
+
+# importing other useful files
+from datacard_fit import parse_datacard, build_batch, repeat_batch, fit, asimov
+from toy_bands import draw_toys, run_toys, card_toys, bands
+
+def single_card(batch, c):
+    return {key: value[c:c + 1] for key, value in batch.items()}
+
+def test_card_toys_keep_the_cards_apart(write_card):
+    batch = build_batch([parse_datacard(write_card("weak", [2, 3], [100, 50])),
+                         parse_datacard(write_card("strong", [40, 60], [100, 50]))])
+    n     = 20
+
+    result = card_toys(np.random.default_rng(7), n, batch, 1.0)
+    toys   = draw_toys(np.random.default_rng(7), asimov(batch, 1.0), n)
+
+    assert result["r"].shape == (n, 2)
+    assert result["q0"].shape == (n, 2)
+
+    # every column is the fit of its own card to its own toys
+    for c in range(2):
+        theta = fit(repeat_batch(single_card(batch, c), n), toys[:, c])[0]
+        assert np.allclose(result["r"][:, c], theta[:, 0], atol=1e-4)
+
+def test_run_toys_chunks_concatenate():
+    def counts(rng, n, mean):
+        return {"x": draw_toys(rng, mean, n)}
+
+    result = run_toys(counts, (np.array([5.0, 50.0]),), 25, seed=3, chunk=10)
+
+    assert result["x"].shape == (25, 2)
+    assert np.array_equal(result["x"], run_toys(counts, (np.array([5.0, 50.0]),), 25, seed=3, chunk=10)["x"])
+
+def test_bands_are_ordered():
+    samples = np.random.default_rng(1).normal(size=(5000, 3))
+    result  = bands(samples)
+
+    assert result.shape == (5, 3)
+    assert np.all(np.diff(result, axis=0) > 0)
+    assert result[2] == pytest.approx(np.zeros(3), abs=0.1)